@@ -0,0 +1,30 @@
+import importlib.util
+import os
+import shutil
+import sys
+
+import pytest
+
+SOURCE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "webcraft_wrapper.py")
+
+
+@pytest.fixture(scope="session")
+def ww(tmp_path_factory):
+    # The wrapper configures itself at import time (server dir with a .jar,
+    # databases and spill files next to the script), so it is imported from
+    # a copy in a scratch dir that has the default MINECRAFT_DIR in it.
+    root = tmp_path_factory.mktemp("wrapper")
+    shutil.copy(SOURCE, root / "webcraft_wrapper.py")
+    minecraft_dir = root / r"path\to\server\root"
+    minecraft_dir.mkdir(parents=True)
+    (minecraft_dir / "server.jar").write_bytes(b"")
+    cwd = os.getcwd()
+    os.chdir(root)
+    try:
+        spec = importlib.util.spec_from_file_location("webcraft_wrapper", root / "webcraft_wrapper.py")
+        module = importlib.util.module_from_spec(spec)
+        sys.modules["webcraft_wrapper"] = module
+        spec.loader.exec_module(module)
+        yield module
+    finally:
+        os.chdir(cwd)
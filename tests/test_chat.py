@@ -0,0 +1,39 @@
+import pytest
+
+
+@pytest.fixture
+def inst(ww, tmp_path, monkeypatch):
+    (tmp_path / "server.jar").write_bytes(b"")
+    inst = ww.ServerInstance("chattest", str(tmp_path))
+    monkeypatch.setitem(ww.servers, "chattest", inst)
+    return inst
+
+
+def test_players_change_reaches_client_at_current_cursor(ww, inst):
+    client = ww.app.test_client()
+    inst.publish_chat("<Steve> hi", "Steve")
+    first = client.get("/s/chattest/chat").json
+    cursor = first["cursor"]
+    assert cursor == inst.log_seq
+    assert client.get(f"/s/chattest/chat?since={cursor}").json.get("players") is None
+
+    # What refresh_players does after attaching: no chat line, just a new list
+    inst.players_online.update({"Alex", "Steve"})
+    inst.mark_players_changed(publish=True)
+    reply = client.get(f"/s/chattest/chat?since={cursor}").json
+    assert reply["players"] == ["Alex", "Steve"]
+    assert reply["messages"] == []
+
+    events, _ = inst.events.wait_after(first["event_id"], 0)
+    assert ("players", '{"players": ["Alex", "Steve"]}') in [(e, p) for _, e, p in events]
+
+
+def test_chat_from_new_player_marks_before_its_line(ww, inst):
+    client = ww.app.test_client()
+    cursor = client.get("/s/chattest/chat").json["cursor"]
+    handle = type("Handle", (), {"inst": inst})()
+    name, m = ww.line_classifier.classify("<Bob> hello")
+    ww.line_classifier.handlers[name](handle, m)
+    reply = client.get(f"/s/chattest/chat?since={cursor}").json
+    assert reply["players"] == ["Bob"]
+    assert reply["messages"] == ["<Bob> hello"]
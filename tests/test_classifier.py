@@ -0,0 +1,41 @@
+import pytest
+
+# One prefix per layout parse_log_line understands
+LAYOUTS = {
+    "vanilla": "[12:00:00] [Server thread/INFO]: {}",
+    "fabric": "[12:00:00] [Server thread/INFO] (Minecraft) {}",
+    "forge": "[12:00:00] [Server thread/INFO] [minecraft/DedicatedServer/]: {}",
+    "bare": "[12:00:00 INFO]: {}",
+}
+
+
+def classify(ww, line):
+    name, m = ww.line_classifier.classify(ww.parse_log_line(line).message)
+    return name, m.groupdict() if m else None
+
+
+@pytest.mark.parametrize("layout", LAYOUTS)
+@pytest.mark.parametrize("message, rule, groups", [
+    ('Done (3.512s)! For help, type "help"', "ready", {"ready_secs": "3.512"}),
+    ("Saved the game", "saved", {}),
+    ("[Rcon: Saved the game]", "saved", {}),
+    ("Stopping server", "stopping", {}),
+    ("<Steve> hello there", "chat", {"chat_user": "Steve", "chat_msg": "hello there"}),
+    ("Alex joined the game", "join", {"join_user": "Alex"}),
+    ("Alex left the game", "leave", {"leave_user": "Alex"}),
+])
+def test_rules_match_every_layout(ww, layout, message, rule, groups):
+    name, found = classify(ww, LAYOUTS[layout].format(message))
+    assert name == rule
+    assert {k: v for k, v in found.items() if k in groups} == groups
+
+
+@pytest.mark.parametrize("layout", LAYOUTS)
+@pytest.mark.parametrize("text", ["Done (1.0s)!", "Saved the game", "Stopping server", "Bob joined the game"])
+def test_chat_cannot_fake_a_rule(ww, layout, text):
+    assert classify(ww, LAYOUTS[layout].format(f"<Steve> {text}"))[0] == "chat"
+
+
+def test_prefix_text_alone_does_not_match(ww):
+    assert classify(ww, "[12:00:00] [Server thread/INFO]: Preparing spawn area: Done (0%)")[0] is None
+    assert classify(ww, "[12:00:00] [Server thread/INFO]: Not Stopping server yet")[0] is None
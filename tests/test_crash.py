@@ -0,0 +1,62 @@
+import pytest
+
+
+class Handle:
+    # The parts of a ServerProcess that CrashTracker and the line rules use
+    def __init__(self, inst):
+        self.inst = inst
+        self.reached = {"starting"}
+        self.ready_secs = None
+        self.saved = None
+
+    def set_state(self, state):
+        self.reached.add(state)
+
+
+@pytest.fixture
+def handle(ww, tmp_path, monkeypatch):
+    (tmp_path / "server.jar").write_bytes(b"")
+    inst = ww.ServerInstance("crashtest", str(tmp_path))
+    handle = Handle(inst)
+    handle.crashes = ww.CrashTracker(handle)
+    monkeypatch.setattr(inst.perf, "record", lambda *a: None)
+    monkeypatch.setattr(inst.perf, "mark", lambda *a: None)
+    monkeypatch.setattr(ww, "send_server_cmd", lambda *a, **k: True)
+    return handle
+
+
+def feed(ww, handle, message, level="INFO"):
+    # What read_server_output does with each line
+    line = f"[12:00:00] [Server thread/{level}]: {message}"
+    record = ww.parse_log_line(line)
+    handle.inst.append_output_line(record)
+    handle.crashes.feed(line, ww.line_classifier.dispatch(record.message, handle))
+
+
+def test_startup_noise_is_not_a_crash(ww, handle):
+    feed(ww, handle, "Loading Starlight 1.1.2")
+    feed(ww, handle, "Watchdog: max-tick-time 60000")
+    feed(ww, handle, 'Done (3.5s)! For help, type "help"')
+    assert not handle.crashes.is_crash()
+
+
+def test_player_text_is_not_a_crash(ww, handle):
+    feed(ww, handle, 'Done (3.5s)! For help, type "help"')
+    feed(ww, handle, "<Steve> that was a fatal mistake")
+    feed(ww, handle, "FatalFrank joined the game")
+    assert not handle.crashes.is_crash()
+
+
+def test_crash_after_ready_keeps_context_from_this_run(ww, handle):
+    inst = handle.inst
+    feed(ww, handle, "line from the previous run")
+    handle.crashes = ww.CrashTracker(handle)  # a new run starts here
+    feed(ww, handle, 'Done (3.5s)! For help, type "help"')
+    feed(ww, handle, "Exception in server tick loop", "ERROR")
+    feed(ww, handle, "at net.minecraft.server.MinecraftServer.run")
+    assert handle.crashes.is_crash()
+    first = handle.crashes.first
+    assert first["signature"] == "Exception in server tick loop"
+    assert not any("previous run" in line for line in first["context"])
+    assert first["context"][-1].endswith("MinecraftServer.run")
+    assert inst.crash_history.snapshot()[-1] is first
@@ -0,0 +1,246 @@
+import socket
+import struct
+import sys
+import textwrap
+import threading
+import time
+
+import pytest
+
+PASSWORD = "hunter2"
+
+# Stands in for the JVM: answers on stdout the way a vanilla console does
+FAKE_SERVER = textwrap.dedent("""
+    import sys, time
+    def out(s):
+        sys.stdout.write(time.strftime("[%H:%M:%S]") + " [Server thread/INFO]: " + s + "\\n")
+        sys.stdout.flush()
+    out('Done (0.100s)! For help, type "help"')
+    for line in sys.stdin:
+        cmd = line.strip()
+        if cmd == "stop":
+            break
+        if cmd == "save-all flush":
+            out("Saving the game (this may take a moment!)")
+            out("Saved the game")
+        else:
+            out("CMD " + cmd)
+""")
+
+
+class FakeRcon:
+    # Minimal RCON server: login, one reply packet per command (split at
+    # 4096 bytes like the real one) and "Unknown request" for the end marker.
+    def __init__(self, password=PASSWORD):
+        self.password = password
+        self.replies = {"save-all flush": "Saving the game (this may take a moment!)Saved the game"}
+        self.commands = []
+        self.logins = 0
+        self.clients = []
+        self.sock = socket.socket()
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.listen()
+        self.port = self.sock.getsockname()[1]
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            self.clients.append(conn)
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _recv(self, conn, n):
+        data = b""
+        while len(data) < n:
+            chunk = conn.recv(n - len(data))
+            if not chunk:
+                raise EOFError
+            data += chunk
+        return data
+
+    def _send(self, conn, request_id, kind, body):
+        data = body.encode()
+        conn.sendall(struct.pack("<iii", len(data) + 10, request_id, kind) + data + b"\0\0")
+
+    def _serve(self, conn):
+        try:
+            while True:
+                (length,) = struct.unpack("<i", self._recv(conn, 4))
+                data = self._recv(conn, length)
+                request_id, kind = struct.unpack("<ii", data[:8])
+                body = data[8:-2].decode()
+                if kind == 3:
+                    self.logins += body == self.password
+                    self._send(conn, request_id if body == self.password else -1, 2, "")
+                elif kind == 2:
+                    self.commands.append(body)
+                    reply = self.replies.get(body, "echo: " + body)
+                    for i in range(0, max(len(reply), 1), 4096):
+                        self._send(conn, request_id, 0, reply[i:i + 4096])
+                else:
+                    self._send(conn, request_id, 0, "Unknown request %x" % kind)
+        except (OSError, EOFError):
+            conn.close()
+
+    def drop_clients(self):
+        for conn in self.clients:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self.clients = []
+
+    def close(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)  # wakes the blocked accept()
+        except OSError:
+            pass
+        self.sock.close()
+        self.drop_clients()
+
+
+def wait_until(predicate, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def console_lines(inst):
+    return [str(record) for record in inst.server_output_buffer.snapshot()]
+
+
+@pytest.fixture
+def rcon():
+    server = FakeRcon()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def make_server(ww, tmp_path):
+    started = []
+
+    def make(port, password=PASSWORD):
+        minecraft_dir = tmp_path / "server"
+        minecraft_dir.mkdir()
+        (minecraft_dir / "server.jar").write_bytes(b"")
+        script = tmp_path / "fake_server.py"
+        script.write_text(FAKE_SERVER)
+        inst = ww.ServerInstance("rcontest", str(minecraft_dir), rcon_port=port, rcon_password=password)
+        inst.start_cmd = [sys.executable, str(script)]
+        ww.start_server(inst)
+        started.append(inst)
+        assert inst.server_process.wait_for("ready", 10)
+        return inst
+
+    yield make
+    for inst in started:
+        proc = inst.server_process
+        proc.stop_requested = True
+        proc.write_line("stop")
+        if not proc.wait_for("exited", 5):
+            proc.kill()
+            proc.wait_for("exited", 5)
+
+
+def test_command_round_trip(ww, rcon, make_server):
+    inst = make_server(rcon.port)
+    assert ww.run_server_cmd(inst, "/say hi") == (True, "echo: say hi", "rcon")
+    assert rcon.logins == 1
+    assert inst.rcon.stats()["sent"] == 1
+
+
+def test_long_reply_is_joined(ww, rcon, make_server):
+    inst = make_server(rcon.port)
+    rcon.replies["big"] = "x" * 10000
+    sent, reply, transport = ww.run_server_cmd(inst, "big")
+    assert (sent, len(reply), transport) == (True, 10000, "rcon")
+
+
+def test_wrong_password_falls_back_to_stdin(ww, rcon, make_server):
+    inst = make_server(rcon.port, password="wrong")
+    assert ww.run_server_cmd(inst, "say hi") == (True, None, "stdin")
+    assert rcon.logins == 0 and rcon.commands == []
+    assert not inst.rcon.usable()  # waits RCON_RETRY before trying again
+    assert wait_until(lambda: any("CMD say hi" in line for line in console_lines(inst)))
+
+
+def test_reconnects_after_connection_drop(ww, rcon, make_server):
+    inst = make_server(rcon.port)
+    assert ww.run_server_cmd(inst, "first")[1] == "echo: first"
+    rcon.drop_clients()
+    assert wait_until(lambda: inst.rcon.stats()["connections"] == 0)
+    assert ww.run_server_cmd(inst, "second") == (True, "echo: second", "rcon")
+    assert rcon.logins == 2
+
+
+def test_falls_back_to_stdin_when_rcon_is_down(ww, rcon, make_server):
+    inst = make_server(rcon.port)
+    rcon.close()
+    assert ww.run_server_cmd(inst, "say fallback") == (True, None, "stdin")
+    assert ww.send_server_cmd(inst, "say again")
+    assert wait_until(lambda: any("CMD say again" in line for line in console_lines(inst)))
+    assert any("CMD say fallback" in line for line in console_lines(inst))
+
+
+def test_save_flush_confirmed_by_rcon_reply(ww, rcon, make_server, tmp_path, monkeypatch):
+    # Over RCON the "Saved the game" line never reaches the console
+    monkeypatch.setattr(ww, "SAVE_FLUSH_TIMEOUT", 2)
+    inst = make_server(rcon.port)
+    world = tmp_path / "world"
+    (world / "region").mkdir(parents=True)
+    (world / "level.dat").write_bytes(b"level")
+    (world / "region" / "r.0.0.mca").write_bytes(b"chunks")
+    t = time.time()
+    ww.take_live_snapshot(inst, str(world), str(tmp_path / "snapshot"))
+    assert time.time() - t < 2
+    assert (tmp_path / "snapshot" / "region" / "r.0.0.mca").read_bytes() == b"chunks"
+    assert wait_until(lambda: rcon.commands == ["save-off", "save-all flush", "save-on"])
+
+
+def test_save_flush_timeout(ww, rcon, make_server, tmp_path, monkeypatch):
+    monkeypatch.setattr(ww, "SAVE_FLUSH_TIMEOUT", 0.2)
+    inst = make_server(rcon.port)
+    rcon.replies["save-all flush"] = ""
+    world = tmp_path / "world"
+    world.mkdir()
+    with pytest.raises(Exception, match="did not confirm save-all flush"):
+        ww.take_live_snapshot(inst, str(world), str(tmp_path / "snapshot"))
+    assert wait_until(lambda: rcon.commands[-1:] == ["save-on"])
+
+
+def test_attached_server_hot_backup(ww, rcon, tmp_path):
+    # Attach mode has no stdin, so every step of the backup goes over RCON
+    minecraft_dir = tmp_path / "attached"
+    (minecraft_dir / "world" / "region").mkdir(parents=True)
+    (minecraft_dir / "server.jar").write_bytes(b"")
+    (minecraft_dir / "world" / "level.dat").write_bytes(b"level")
+    (minecraft_dir / "world" / "region" / "r.0.0.mca").write_bytes(b"chunks" * 1000)
+    inst = ww.ServerInstance("attachtest", str(minecraft_dir), backup_dir=str(tmp_path / "backups"),
+                             attach=True, rcon_port=rcon.port, rcon_password=PASSWORD)
+    ww.start_server(inst)
+    try:
+        assert inst.server_process.wait_for("ready", 5)
+        ww.do_backup_task(inst)
+        names = ww.list_manifests(inst.chunk_store_dir)
+        assert len(names) == 1
+        assert sorted(ww.load_manifest(inst.chunk_store_dir, names[0])["files"]) == ["level.dat", "region/r.0.0.mca"]
+        assert wait_until(lambda: rcon.commands[-1:] == ["save-on"])
+        assert "save-all flush" in rcon.commands
+        assert not [n for n in minecraft_dir.iterdir() if n.name.startswith(".world_snapshot_")]
+    finally:
+        inst.server_process.detach()
+
+
+def test_attached_server_has_every_process_field(ww, tmp_path):
+    (tmp_path / "server.jar").write_bytes(b"")
+    inst = ww.ServerInstance("fields", str(tmp_path), attach=True)
+    proc = type("Proc", (), {"pid": 1, "stdin": None})()
+    assert set(vars(ww.ServerProcess(proc, inst))) <= set(vars(ww.AttachedServer(inst)))
@@ -0,0 +1,20 @@
+import pytest
+
+
+@pytest.mark.parametrize("origin, host, allowed", [
+    ("http://mc.example.com:5000", "mc.example.com:5001", True),
+    ("http://127.0.0.1:5000", "127.0.0.1:5001", True),
+    ("http://[::1]:5000", "[::1]:5001", True),
+    ("https://evil.example", "mc.example.com:5001", False),
+    ("http://mc.example.com.evil.example", "mc.example.com:5001", False),
+    ("null", "mc.example.com:5001", False),
+    (None, "mc.example.com:5001", False),
+])
+def test_origin_must_match_host(ww, origin, host, allowed):
+    assert ww.ws_origin_allowed(origin, host) is allowed
+
+
+def test_origin_allow_list(ww, monkeypatch):
+    monkeypatch.setattr(ww, "WS_ALLOWED_ORIGINS", ["https://chat.example.com"])
+    assert ww.ws_origin_allowed("https://chat.example.com", "10.0.0.5:5001")
+    assert not ww.ws_origin_allowed("https://other.example.com", "10.0.0.5:5001")
@@ -1,16 +1,52 @@
 import subprocess
 import threading
+import asyncio
+import concurrent.futures
+import queue
+import locale
 import re
 import time
 import os
 import json
 import datetime
 import signal
+import sys
 import atexit
-from flask import Flask, request, jsonify, render_template_string, session
+from flask import Flask, request, jsonify, session, Response, g
 from werkzeug.utils import secure_filename
 import shutil
 import uuid
+import hashlib
+import gzip
+import tarfile
+import tempfile
+import collections
+import random
+import functools
+import itertools
+import sqlite3
+import array
+import bisect
+import mmap
+import struct
+import codecs
+import base64
+import urllib.parse
+import select
+import socket
+import ctypes
+try:
+    import fcntl  # reflink snapshots (Linux only)
+except ImportError:
+    fcntl = None
+try:
+    from compression import zstd  # Python 3.14+, native archives fall back to gzip without it
+except ImportError:
+    zstd = None
+try:
+    import brotli  # optional, pages are served gzip-only without it
+except ImportError:
+    brotli = None
 import requests # NEW: Import for downloading files
 
 # -----------------------------
@@ -30,10 +66,113 @@ GEYSER_JAR_PATH = os.path.join(MINECRAFT_DIR, "mods", "Geyser-Fabric.jar")
 GEYSER_DOWNLOAD_URL = "https://download.geysermc.org/v2/projects/geyser/versions/latest/builds/latest/downloads/fabric"
 GEYSER_UPDATE_PATTERN = re.compile(r"here's a new Geyser update available to support Bedrock version \S+\. Download it here: \|")
 
+# NEW: Backup engine. "incremental" stores deduplicated blocks in CHUNK_STORE_DIR,
+# "archive" writes one full archive per backup with ARCHIVE_BACKEND.
+BACKUP_MODE = "incremental"
+CHUNK_STORE_DIR = os.path.join(BACKUP_DIR, "chunkstore")
+INCREMENTAL_KEEP = 30  # manifests kept before old ones are pruned and GC'd
+
+# NEW: "native" = in-process parallel .tar.zst (.tar.gz before Python 3.14),
+# "winrar" = Rar.exe at WINRAR_PATH
+ARCHIVE_BACKEND = "native"
+ARCHIVE_WORKERS = os.cpu_count() or 4
+ARCHIVE_LEVEL = 3
+ARCHIVE_PIECE = 16 * 1024 * 1024  # big files are split so one region can use several workers
+
+# NEW: Restores are extracted next to the live world, then swapped in with a
+# rename. The replaced world is kept in PREVIOUS_WORLD_DIR for /admin/rollback.
+EXTRACT_WORKERS = 8
+PREVIOUS_WORLD_DIR = os.path.join(MINECRAFT_DIR, "world.previous")
+
+# NEW: RCON. Commands go over RCON when the server has it enabled (read from
+# server.properties unless set here) so /admin/command can return their
+# output; stdin is the fallback whenever RCON is off or unreachable.
+RCON_ENABLED = True
+RCON_HOST = "127.0.0.1"
+RCON_PORT = None      # None = rcon.port from server.properties
+RCON_PASSWORD = None  # None = rcon.password from server.properties
+RCON_POOL_SIZE = 2
+RCON_TIMEOUT = 10
+RCON_RETRY = 30  # seconds to stay on stdin after a failed connect
+
+# NEW: Attach mode (also turned on with --attach). The JVM is started
+# detached, or was already running, and outlives the wrapper: output is
+# followed from LATEST_LOG and commands go over RCON, so the wrapper can be
+# restarted or reloaded without touching the server. Needs RCON enabled.
+ATTACH_MODE = False
+LATEST_LOG = os.path.join(MINECRAFT_DIR, "logs", "latest.log")
+ATTACH_POLL = 0.25  # seconds between log checks without inotify
+ATTACH_PROBE = 5    # seconds between liveness checks of the RCON port
+
+# NEW: Performance telemetry. Every PERF_PROBE_INTERVAL seconds PERF_PROBE_CMD
+# is sent to each ready server and its reply (RCON) or console output is parsed
+# for TPS/MSPT, together with "Can't keep up!" warnings. "tick query" needs
+# 1.20.3+; use "tps" on Paper, "forge tps" on Forge, or None to only listen.
+PERF_PROBE_CMD = "tick query"
+PERF_PROBE_INTERVAL = 30
+PERF_TIERS = ((1, 3600), (60, 1440), (3600, 720))  # (seconds per slot, slots): 1h, 1 day, 30 days
+PERF_MARKERS = 500  # joins/leaves/tasks kept to line up with the graphs
+
+# NEW: WebSocket chat for guests, served from the supervisor loop on its own
+# port (the Flask dev server ties up a thread per open connection). Pages fall
+# back to /stream + /send when it is off (None) or unreachable.
+WS_PORT = WEB_PORT + 1
+WS_MAX_CLIENTS = 5000
+WS_QUEUE = 256          # frames buffered per client before it counts as too slow
+WS_MAX_MESSAGE = 4096   # bytes per incoming message
+WS_PING = 30            # seconds of silence before a ping
+WS_HANDSHAKE_TIMEOUT = 10
+# Browsers let any page open a WebSocket, so the upgrade is refused unless the
+# page's Origin is on the same host as the socket (any port) or listed here,
+# e.g. "https://chat.example.com" behind a reverse proxy
+WS_ALLOWED_ORIGINS = []
+
+# NEW: Chunked restore uploads (/admin/upload/*)
+UPLOAD_CHUNK = 8 * 1024 * 1024
+UPLOAD_TTL = 2 * 24 * 3600  # unfinished uploads older than this are dropped
+
+# NEW: Hot backups. While the server runs, saving is paused (save-off +
+# save-all flush), the world is snapshotted and saving resumes right away;
+# the archive is then built from the snapshot with players still online.
+HOT_BACKUPS = True
+SAVE_FLUSH_TIMEOUT = 120
+SNAPSHOT_WORKERS = 8
+
+# NEW: Every chat line is also kept in a SQLite database for /chat/history.
+# Rows are written by one background thread, CHAT_DB_BATCH at a time.
+CHAT_DB_PATH = os.path.join(os.path.dirname(__file__), "chat_history.db")
+CHAT_DB_BATCH = 500
+DB_LINGER = 0.5  # seconds the SQLite writers wait to collect a batch
+CHAT_HISTORY_LIMIT = 200  # max rows per /chat/history page
+
+# NEW: Console output is indexed for /admin/logs/search, next to the server logs
+CONSOLE_DB_PATH = os.path.join(MINECRAFT_DIR, "logs", "console_index.db")
+CONSOLE_DB_BATCH = 5000
+CONSOLE_INDEX_DAYS = 30
+SEARCH_LIMIT = 50
+SEARCH_CONTEXT = 3  # lines shown before/after each hit
+
+# NEW: Console lines pushed out of the in-memory buffer go to on-disk segments
+# (cleared on every start) so the admin panel can scroll back through them.
+CONSOLE_SPILL_DIR = os.path.join(os.path.dirname(__file__), "console_spill")
+SPILL_SEGMENT_LINES = 100000
+SPILL_SEGMENTS = 20  # oldest segment is deleted past this
+OLDER_SCAN_MAX = 200000  # lines examined per filtered scroll-back request
+
+# NEW: More servers managed by this same wrapper, each served under
+# /s/<name>/ (and listed on /fleet). The server configured above is "main"
+# and also answers on the plain routes. Keys are ServerInstance arguments;
+# anything left out is derived from minecraft_dir, e.g.
+#   "creative": {"minecraft_dir": r"path\to\creative", "memory": "2G"},
+#   "lobby": {"minecraft_dir": r"path\to\lobby", "attach": True, "rcon_port": 25576},
+SERVERS = {}
+DEFAULT_SERVER = "main"
+
 
 os.makedirs(BACKUP_DIR, exist_ok=True)
 os.makedirs(UPLOAD_TMP_DIR, exist_ok=True)
 os.makedirs(os.path.join(MINECRAFT_DIR, "mods"), exist_ok=True) # Ensure mods folder exists
+os.makedirs(os.path.join(MINECRAFT_DIR, "logs"), exist_ok=True)
 
 if not os.path.exists(PASSFILE):
     with open(PASSFILE, "w", encoding="utf-8") as f:
@@ -42,11 +181,11 @@ if not os.path.exists(PASSFILE):
 # -----------------------------
 # Find server jar
 # -----------------------------
-def find_server_jar():
-    for f in os.listdir(MINECRAFT_DIR):
+def find_server_jar(minecraft_dir=MINECRAFT_DIR):
+    for f in os.listdir(minecraft_dir):
         if f.lower().endswith(".jar") and "server" in f.lower():
             return f
-    for f in os.listdir(MINECRAFT_DIR):
+    for f in os.listdir(minecraft_dir):
         if f.lower().endswith(".jar"):
             return f
     return None
@@ -56,7 +195,370 @@ if not SERVER_JAR:
     print(f"ERROR: No .jar found in {MINECRAFT_DIR}")
     exit(1)
 
-START_CMD = [JAVA_PATH, "-Xmx4G", "-jar", SERVER_JAR, "nogui"]
+# -----------------------------
+# Ring buffer (NEW)
+# -----------------------------
+class RingBuffer:
+    # Bounded history with O(1) append. Every entry carries a sequence id
+    # (increasing, not necessarily contiguous) so readers can ask for
+    # "everything after N" without copying the whole buffer. All access goes
+    # through one lock, so Flask threads never see a half-written slot.
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._seqs = [0] * capacity
+        self._items = [None] * capacity
+        self._start = 0
+        self._len = 0
+        self.lock = threading.Lock()
+
+    def append(self, seq, item):
+        with self.lock:
+            if self._len < self.capacity:
+                i = (self._start + self._len) % self.capacity
+                self._len += 1
+            else:
+                i = self._start
+                self._start = (self._start + 1) % self.capacity
+            self._seqs[i] = seq
+            self._items[i] = item
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        return iter(self.snapshot())
+
+    def _slot(self, n):
+        return (self._start + n) % self.capacity
+
+    def _bisect(self, seq):
+        # Logical index of the first entry with a seq greater than `seq`
+        lo, hi = 0, self._len
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._seqs[self._slot(mid)] <= seq:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _copy(self, lo, hi, with_seq):
+        a, b = self._slot(lo), self._slot(hi)
+        if lo == hi:
+            return []
+        if a < b:
+            items = self._items[a:b]
+            seqs = self._seqs[a:b] if with_seq else None
+        else:
+            items = self._items[a:] + self._items[:b]
+            seqs = self._seqs[a:] + self._seqs[:b] if with_seq else None
+        return list(zip(seqs, items)) if with_seq else items
+
+    def snapshot(self):
+        with self.lock:
+            return self._copy(0, self._len, False)
+
+    def tail(self, n):
+        with self.lock:
+            return self._copy(max(0, self._len - n), self._len, False)
+
+    def range(self, after, upto=None, limit=None):
+        # (seq, item) pairs with after < seq <= upto, newest `limit` of them
+        with self.lock:
+            lo = self._bisect(after)
+            hi = self._len if upto is None else self._bisect(upto)
+            if limit is not None:
+                lo = max(lo, hi - limit)
+            return self._copy(lo, max(lo, hi), True)
+
+    def first_seq(self):
+        with self.lock:
+            return self._seqs[self._start] if self._len else None
+
+# -----------------------------
+# Console records (NEW)
+# -----------------------------
+# Each console line is parsed once into its parts. The buffer keeps them in
+# parallel columns (packed clock/level/format bytes, interned thread and
+# source names, bare message) instead of the full text, and rebuilds the
+# line when it is read. Lines that don't round-trip exactly are stored whole.
+LOG_LEVELS = ("TRACE", "DEBUG", "INFO", "WARN", "ERROR", "FATAL")  # code = index + 1, 0 = unknown
+LEVEL_CODES = {name: i + 1 for i, name in enumerate(LOG_LEVELS)}
+LEVEL_CODES["WARNING"] = LEVEL_CODES["WARN"]
+LOG_REGEX_MAX = 200  # longest ?regex= accepted by the console filters
+
+FMT_RAW, FMT_PLAIN, FMT_PAREN, FMT_BRACKET, FMT_BARE = range(5)
+LOG_FORMATS = {
+    FMT_PLAIN: "[{clock}] [{thread}/{level}]: {message}",          # vanilla
+    FMT_PAREN: "[{clock}] [{thread}/{level}] ({source}) {message}",  # Fabric
+    FMT_BRACKET: "[{clock}] [{thread}/{level}] [{source}/]: {message}",  # Forge
+    FMT_BARE: "[{clock} {level}]: {message}",                       # old servers
+}
+LOG_LINE = re.compile(
+    r"\[(?P<clock>\d\d:\d\d:\d\d)(?: (?P<bare_level>[A-Z]+)\]: |\] \[(?P<thread>[^\]]*)/(?P<level>[A-Z]+)\]"
+    r"(?:(?P<plain>: )| \((?P<paren_src>[^)]*)\) | \[(?P<bracket_src>[^\]]*)/\]: ))(?P<message>.*)", re.S)
+
+class LogRecord:
+    __slots__ = ("clock", "fmt", "level", "thread", "source", "message")
+
+    def __init__(self, clock, fmt, level, thread, source, message):
+        self.clock = clock      # seconds since midnight, -1 if the line had none
+        self.fmt = fmt
+        self.level = level      # LEVEL_CODES value
+        self.thread = thread
+        self.source = source
+        self.message = message
+
+    @property
+    def level_name(self):
+        return LOG_LEVELS[self.level - 1] if self.level else None
+
+    def __str__(self):
+        if self.fmt == FMT_RAW:
+            return self.message
+        c = self.clock
+        return LOG_FORMATS[self.fmt].format(
+            clock=f"{c // 3600:02d}:{c // 60 % 60:02d}:{c % 60:02d}", thread=self.thread,
+            level=self.level_name, source=self.source, message=self.message)
+
+def parse_log_line(line, prev=None):
+    # Continuation lines (stack traces etc.) inherit level/thread/source from
+    # the line before them so filters keep whole exceptions together.
+    m = LOG_LINE.match(line)
+    if not m:
+        if prev is None:
+            return LogRecord(-1, FMT_RAW, 0, None, None, line)
+        return LogRecord(-1, FMT_RAW, prev.level, prev.thread, prev.source, line)
+    h, mi, sec = m.group("clock").split(":")
+    level = m.group("level") or m.group("bare_level")
+    thread, source = m.group("thread"), m.group("paren_src") or m.group("bracket_src")
+    if m.group("bare_level"):
+        fmt = FMT_BARE
+    elif m.group("plain"):
+        fmt = FMT_PLAIN
+    else:
+        fmt = FMT_PAREN if m.group("paren_src") is not None else FMT_BRACKET
+    record = LogRecord(int(h) * 3600 + int(mi) * 60 + int(sec), fmt, LEVEL_CODES.get(level, 0),
+                       sys.intern(thread) if thread else None,
+                       sys.intern(source) if source else None, m.group("message"))
+    if str(record) != line:
+        record.fmt, record.message = FMT_RAW, line
+    return record
+
+class RecordBuffer(RingBuffer):
+    # RingBuffer of LogRecords stored column-wise. Records pushed out by new
+    # ones are handed to `spill` (a ConsoleSpill) after the lock is released.
+    def __init__(self, capacity, spill=None):
+        super().__init__(capacity)
+        self.spill = spill
+        self._items = None
+        self._clock = array.array("i", [-1]) * capacity
+        self._fmt = bytearray(capacity)
+        self._level = bytearray(capacity)
+        self._thread = [None] * capacity
+        self._source = [None] * capacity
+        self._message = [None] * capacity
+
+    def append(self, seq, record):
+        evicted = None
+        with self.lock:
+            if self._len < self.capacity:
+                i = (self._start + self._len) % self.capacity
+                self._len += 1
+            else:
+                i = self._start
+                self._start = (self._start + 1) % self.capacity
+                if self.spill is not None:
+                    evicted = (self._seqs[i], self._load(i))
+            self._seqs[i] = seq
+            self._clock[i] = record.clock
+            self._fmt[i] = record.fmt
+            self._level[i] = record.level
+            self._thread[i] = record.thread
+            self._source[i] = record.source
+            self._message[i] = record.message
+        if evicted:
+            self.spill.append(*evicted)
+
+    def _load(self, i):
+        return LogRecord(self._clock[i], self._fmt[i], self._level[i],
+                         self._thread[i], self._source[i], self._message[i])
+
+    def _copy(self, lo, hi, with_seq):
+        slots = [self._slot(n) for n in range(lo, hi)]
+        if with_seq:
+            return [(self._seqs[i], self._load(i)) for i in slots]
+        return [self._load(i) for i in slots]
+
+    def select(self, after, upto, limit, min_level=0, source=None, pattern=None):
+        # Newest `limit` (seq, record) pairs in (after, upto] passing the
+        # filters. Level and source are checked on the columns under the lock;
+        # the regex runs on the copies afterwards so a slow pattern can't
+        # stall ingest.
+        source = source.lower() if source else None
+        picked = []
+        with self.lock:
+            lo, hi = self._bisect(after), self._bisect(upto)
+            for n in range(hi - 1, lo - 1, -1):
+                i = self._slot(n)
+                if self._level[i] < min_level:
+                    continue
+                if source and source not in (self._source[i] or "").lower() \
+                        and source not in (self._thread[i] or "").lower():
+                    continue
+                picked.append((self._seqs[i], self._load(i)))
+                if pattern is None and len(picked) >= limit:
+                    break
+        if pattern is not None:
+            picked = [(q, r) for q, r in picked if pattern.search(r.message)][:limit]
+        picked.reverse()
+        return picked
+
+def record_matches(record, min_level=0, source=None, pattern=None):
+    # Same filters as RecordBuffer.select, for records read back from disk
+    if record.level < min_level:
+        return False
+    if source:
+        source = source.lower()
+        if source not in (record.source or "").lower() and source not in (record.thread or "").lower():
+            return False
+    return pattern is None or bool(pattern.search(record.message))
+
+# -----------------------------
+# Console spill (NEW)
+# -----------------------------
+# Segment n is console_<n>.log (one line per record, UTF-8) plus, once it is
+# full, console_<n>.idx: the seqs of its lines followed by their byte offsets,
+# both as int64. Full segments are memory-mapped, so scrolling back only costs
+# page cache; the segment being written is read through a plain file handle.
+# Writes happen on spill_writer, off the thread that ingests console output.
+spill_writer = concurrent.futures.ThreadPoolExecutor(1, thread_name_prefix="spill")
+
+class SpillSegment:
+    def __init__(self, log_path, idx_path, count):
+        self.log_path, self.idx_path, self.count = log_path, idx_path, count
+        self.log_file = open(log_path, "rb")
+        self.idx_file = open(idx_path, "rb")
+        self.log = mmap.mmap(self.log_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.idx = mmap.mmap(self.idx_file.fileno(), 0, access=mmap.ACCESS_READ)
+        index = memoryview(self.idx).cast("q")
+        self.seqs, self.offsets = index[:count], index[count:]
+        self.first, self.last = self.seqs[0], self.seqs[count - 1]
+
+    def read(self, lo, hi):
+        end = self.offsets[hi] if hi < self.count else len(self.log)
+        return self.log[self.offsets[lo]:end]
+
+    def close(self):
+        # Views have to go before the maps can close (and, on Windows, before the files can be deleted)
+        self.seqs.release(); self.offsets.release()
+        self.log.close(); self.idx.close()
+        self.log_file.close(); self.idx_file.close()
+
+class ConsoleSpill:
+    def __init__(self, path, segment_lines=SPILL_SEGMENT_LINES, max_segments=SPILL_SEGMENTS):
+        shutil.rmtree(path, ignore_errors=True)  # seqs restart with the wrapper
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.segment_lines = segment_lines
+        self.max_segments = max_segments
+        self.sealed = collections.deque()
+        self.next_n = 0
+        self.lock = threading.Lock()
+        self.pending = []  # (seq, record) handed over but not written yet
+        self.pending_lock = threading.Lock()
+        self._open_active()
+
+    def _open_active(self):
+        self.active_path = os.path.join(self.path, f"console_{self.next_n}.log")
+        self.next_n += 1
+        self.out = open(self.active_path, "wb")
+        self.active = open(self.active_path, "rb")
+        self.pos = 0
+        self.seqs = array.array("q")
+        self.offsets = array.array("q")
+
+    def append(self, seq, record):
+        # Cheap enough to call under the caller's locks: the record is only
+        # queued, and one drain per batch is scheduled on spill_writer
+        with self.pending_lock:
+            self.pending.append((seq, record))
+            first = len(self.pending) == 1
+        if first:
+            spill_writer.submit(self.drain)
+
+    def drain(self):
+        with self.lock:
+            self._drain()
+
+    def _drain(self):
+        # Caller holds self.lock, so batches are written in the order queued
+        with self.pending_lock:
+            batch, self.pending = self.pending, []
+        for seq, record in batch:
+            data = str(record).replace("\n", " ").encode("utf-8", "replace") + b"\n"
+            self.seqs.append(seq)
+            self.offsets.append(self.pos)
+            self.out.write(data)
+            self.pos += len(data)
+            if len(self.seqs) >= self.segment_lines:
+                self._seal()
+
+    def _seal(self):
+        self.out.close()
+        self.active.close()
+        idx_path = self.active_path[:-4] + ".idx"
+        with open(idx_path, "wb") as f:
+            f.write(self.seqs.tobytes())
+            f.write(self.offsets.tobytes())
+        self.sealed.append(SpillSegment(self.active_path, idx_path, len(self.seqs)))
+        while len(self.sealed) > self.max_segments:
+            old = self.sealed.popleft()
+            old.close()
+            for p in (old.log_path, old.idx_path):
+                try:
+                    os.remove(p)
+                except OSError:
+                    pass
+        self._open_active()
+
+    def blocks_before(self, before, block=2000):
+        # Yields lists of (seq, text) with seq < before, newest block first
+        # (each list oldest-first). The lock is only held while reading a block.
+        while True:
+            with self.lock:
+                self._drain()  # lines evicted from memory but still queued
+                out = self._block_before(before, block)
+            if not out:
+                return
+            yield out
+            before = out[0][0]
+
+    def _block_before(self, before, block):
+        if self.seqs and self.seqs[0] < before:
+            k = bisect.bisect_left(self.seqs, before)
+            lo = max(0, k - block)
+            self.out.flush()
+            self.active.seek(self.offsets[lo])
+            end = self.offsets[k] if k < len(self.seqs) else self.pos
+            data = self.active.read(end - self.offsets[lo])
+            return self._pairs(self.seqs[lo:k], data)
+        for seg in reversed(self.sealed):
+            if seg.first < before:
+                k = bisect.bisect_left(seg.seqs, before)
+                lo = max(0, k - block)
+                return self._pairs(seg.seqs[lo:k], seg.read(lo, k))
+        return []
+
+    @staticmethod
+    def _pairs(seqs, data):
+        lines = data.decode("utf-8", "replace").split("\n")
+        return list(zip(seqs, lines))
+
+    def __len__(self):
+        with self.lock:
+            self._drain()
+            return len(self.seqs) + sum(seg.count for seg in self.sealed)
 
 # -----------------------------
 # Globals
@@ -64,16 +566,8 @@ START_CMD = [JAVA_PATH, "-Xmx4G", "-jar", SERVER_JAR, "nogui"]
 app = Flask(__name__)
 app.secret_key = os.urandom(24)
 
-server_process = None
-chat_log = []
-players_online = set()
 shutdown_flag = False
-server_output_buffer = []
-SERVER_OUTPUT_MAX = 2000
-
-task_lock = threading.Lock()
-current_task = None
-task_started_at = None
+SERVER_OUTPUT_MAX = 2000  # lines kept in memory per server; older ones spill to CONSOLE_SPILL_DIR
 
 # Crash detection patterns — only backup on real crash
 CRASH_PATTERNS = [
@@ -87,64 +581,731 @@ CRASH_PATTERNS = [
     re.compile(r"Watchdog", re.IGNORECASE),
     re.compile(r"starlight", re.IGNORECASE),  # Starlight crashes
 ]
+# NEW: All signatures in one alternation, checked on every line as it arrives.
+# Group c<i> tells which CRASH_PATTERNS entry hit.
+CRASH_MATCHER = re.compile("|".join(f"(?P<c{i}>{p.pattern})" for i, p in enumerate(CRASH_PATTERNS)), re.IGNORECASE)
+CRASH_CONTEXT = 20  # lines kept before and after the first indicator
+CRASH_SKIP_KINDS = ("chat", "join", "leave")  # line_classifier rules whose text players control
 
-# NEW: Global to track last scheduled backup time
-last_scheduled_backup = None
+# -----------------------------
+# Metrics (NEW)
+# -----------------------------
+# Prometheus counters, gauges and histograms for /metrics. A metric is a dict
+# of label values -> numbers behind its own lock, so an update is one lookup
+# and an add: cheap enough to stay on for every console line. Histograms
+# keep per-bucket counts and are only made cumulative when scraped.
+METRICS = []
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LINE_BUCKETS = (1e-06, 2.5e-06, 5e-06, 1e-05, 2.5e-05, 5e-05, 0.0001, 0.00025, 0.0005, 0.001, 0.01)
+TASK_BUCKETS = (1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0, 3600.0)
 
-def start_task(name):
-    with task_lock:
-        global current_task, task_started_at
-        
-        if current_task is not None:
-            return False
-            
-        current_task = name
-        task_started_at = time.time()
-        print(f"[TASK] Started: {name}")
-        return True
+def _prom_value(v):
+    if v == float("inf"):
+        return "+Inf"
+    return str(v) if isinstance(v, int) else repr(float(v))
+
+class Metric:
+    TYPE = "untyped"
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.lock = threading.Lock()
+        self.values = {}
+        METRICS.append(self)
+
+    def _labels(self, key, extra=None):
+        parts = ['%s="%s"' % (k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+                 for k, v in zip(self.labels, key)]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def samples(self):
+        with self.lock:
+            items = list(self.values.items())
+        return [(self.name + self._labels(key), value) for key, value in items]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.TYPE}"]
+        lines += [f"{name} {_prom_value(value)}" for name, value in self.samples()]
+        return "\n".join(lines)
+
+class Counter(Metric):
+    TYPE = "counter"
+
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+class Gauge(Metric):
+    # Either set directly, or `collect` returns {label values: value} at scrape time
+    TYPE = "gauge"
+
+    def __init__(self, name, help_text, labels=(), collect=None):
+        super().__init__(name, help_text, labels)
+        self.collect = collect
+
+    def set(self, value, *labels):
+        with self.lock:
+            self.values[labels] = value
+
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self):
+        if self.collect is None:
+            return super().samples()
+        return [(self.name + self._labels(key), value) for key, value in self.collect().items()]
+
+class Histogram(Metric):
+    TYPE = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(float(b) for b in buckets)
+
+    def observe(self, value, *labels, count=1):
+        # count > 1 records `value` that many times, e.g. a per-item average for a batch
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            h = self.values.get(labels)
+            if h is None:
+                h = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            h[0][i] += count
+            h[1] += value * count
+            h[2] += count
+
+    def samples(self):
+        with self.lock:
+            items = [(key, list(h[0]), h[1], h[2]) for key, h in self.values.items()]
+        out = []
+        for key, counts, total, n in items:
+            running = 0
+            for le, c in zip(self.buckets + (float("inf"),), counts):
+                running += c
+                out.append((self.name + "_bucket" + self._labels(key, f'le="{_prom_value(le)}"'), running))
+            out.append((self.name + "_sum" + self._labels(key), total))
+            out.append((self.name + "_count" + self._labels(key), n))
+        return out
+
+def render_metrics():
+    return "\n".join(m.render() for m in METRICS) + "\n"
+
+LINES_INGESTED = Counter("webcraft_lines_ingested_total", "Console lines read from the server", ("server",))
+LINE_SECONDS = Histogram("webcraft_line_processing_seconds",
+                         "Time spent per console line in ingest (batch average)", ("server",), LINE_BUCKETS)
+LINE_MATCHES = Counter("webcraft_line_matches_total", "Console lines matched by a classifier rule", ("server", "rule"))
+CRASH_INDICATORS = Counter("webcraft_crash_indicators_total", "Console lines matching a crash pattern", ("server",))
+STDIN_SECONDS = Histogram("webcraft_stdin_write_seconds", "Time from queueing a command to flushing it to stdin", ("server",))
+STDIN_FAILURES = Counter("webcraft_stdin_write_failures_total", "Commands that could not be written to stdin", ("server",))
+STDIN_REJECTED = Counter("webcraft_stdin_rejected_total", "Commands refused because the stdin queue was full", ("server",))
+RCON_SECONDS = Histogram("webcraft_rcon_command_seconds", "RCON command round trip time", ("server",))
+RCON_FAILURES = Counter("webcraft_rcon_failures_total", "RCON commands that failed", ("server",))
+HTTP_REQUESTS = Counter("webcraft_http_requests_total", "HTTP requests handled", ("route", "method", "status"))
+HTTP_SECONDS = Histogram("webcraft_http_request_seconds", "HTTP request handling time (until headers for streams)",
+                         ("route", "method"))
+STREAM_CLIENTS = Gauge("webcraft_stream_clients", "Connected /stream clients", ("server",))
+Gauge("webcraft_websocket_clients", "Connected WebSocket clients", ("server",),
+      lambda: {(i.name,): len(i.ws.clients) for i in servers.values()})
+WS_DROPPED = Counter("webcraft_websocket_dropped_total", "WebSocket clients closed for falling behind", ("server",))
+TASK_SECONDS = Histogram("webcraft_task_seconds", "Duration of finished tasks", ("server", "task"), TASK_BUCKETS)
+BACKUP_BYTES = Gauge("webcraft_last_backup_bytes",
+                     "Size of the last backup (archive file, or new chunk store data)", ("server", "mode"))
+BACKUP_BYTES_TOTAL = Counter("webcraft_backup_bytes_total", "Bytes written by backups", ("server", "mode"))
+Gauge("webcraft_server_up", "1 while the server process is running", ("server",),
+      lambda: {(i.name,): int(i.running()) for i in servers.values()})
+Gauge("webcraft_players_online", "Players currently online", ("server",),
+      lambda: {(i.name,): len(i.players_online) for i in servers.values()})
+Gauge("webcraft_task_running", "1 while a task runs", ("server",),
+      lambda: {(i.name,): int(i.current_task is not None) for i in servers.values()})
+Gauge("webcraft_stdin_queue_depth", "Commands waiting for the stdin writer", ("server",),
+      lambda: {(i.name,): len(i.server_process.writer.pending) for i in servers.values()
+               if i.server_process and i.server_process.writer})
+Gauge("webcraft_rcon_connections", "Open RCON connections", ("server",),
+      lambda: {(i.name,): sum(1 for c in i.rcon.conns if c.alive) for i in servers.values()})
+Gauge("webcraft_tps", "Last measured ticks per second", ("server",),
+      lambda: {(i.name,): i.perf.latest["tps"][1] for i in servers.values() if "tps" in i.perf.latest})
+Gauge("webcraft_mspt", "Last measured milliseconds per tick", ("server",),
+      lambda: {(i.name,): i.perf.latest["mspt"][1] for i in servers.values() if "mspt" in i.perf.latest})
+Gauge("webcraft_db_queue_depth", "Rows waiting for the SQLite writer", ("db",),
+      lambda: {("chat",): chat_store.queue.qsize(), ("console",): console_index.queue.qsize()})
+
+# NEW: Sampling profiler, switched on from the admin panel. While on, a thread
+# records the stack of every other thread PROFILE_INTERVAL seconds apart
+# (wall clock, so waiting threads show up too); /admin/profiler returns the
+# counts as folded stacks for flamegraph.pl / speedscope.
+PROFILE_INTERVAL = 0.01
+PROFILE_DEPTH = 40
+
+class SamplingProfiler:
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self.started_at = None
+        self.stop_event = None
+
+    @property
+    def running(self):
+        return self.stop_event is not None
+
+    def start(self):
+        with self.lock:
+            if self.stop_event is not None:
+                return
+            self.stacks = collections.Counter()
+            self.samples = 0
+            self.started_at = time.time()
+            self.stop_event = threading.Event()
+            threading.Thread(target=self._run, args=(self.stop_event,), name="profiler", daemon=True).start()
+        print("[PROFILE] Sampling started")
+
+    def stop(self):
+        with self.lock:
+            if self.stop_event is None:
+                return
+            self.stop_event.set()
+            self.stop_event = None
+        print(f"[PROFILE] Sampling stopped after {self.samples} samples")
+
+    def _run(self, stop):
+        me = threading.get_ident()
+        while not stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < PROFILE_DEPTH:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, "thread"))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def folded(self):
+        stacks = dict(self.stacks)  # the sampler thread keeps adding while we format
+        return "".join(f"{stack} {n}\n" for stack, n in sorted(stacks.items(), key=lambda kv: -kv[1]))
+
+    def stats(self):
+        return {"running": self.running, "samples": self.samples, "started_at": self.started_at}
+
+profiler = SamplingProfiler()
 
-def finish_task():
-    with task_lock:
-        global current_task, task_started_at
-        current_task = None
-        task_started_at = None
-        print(f"[TASK] Finished.")
+# -----------------------------
+# Performance telemetry (NEW)
+# -----------------------------
+class TimeSeries:
+    # Fixed-memory rings, one per PERF_TIERS entry. A sample goes into the
+    # slot for its time in every tier, so each tier is the one above it
+    # downsampled (1s -> 1m -> 1h) without a separate rollup pass. A slot
+    # remembers which interval it holds and is reset when the ring wraps
+    # around to it again.
+    def __init__(self, tiers=PERF_TIERS):
+        self.tiers = [(step, [None] * slots, [0] * slots, [0.0] * slots, [0.0] * slots)
+                      for step, slots in tiers]
+
+    def add(self, value, now):
+        for step, starts, counts, sums, peaks in self.tiers:
+            start = int(now) - int(now) % step
+            i = start // step % len(starts)
+            if starts[i] != start:
+                starts[i], counts[i], sums[i], peaks[i] = start, 0, 0.0, value
+            counts[i] += 1
+            sums[i] += value
+            peaks[i] = max(peaks[i], value)
+
+    def points(self, tier, since):
+        # [[slot start, mean, max], ...] oldest first
+        step, starts, counts, sums, peaks = self.tiers[tier]
+        out = [[t, sums[i] / counts[i], peaks[i]] for i, t in enumerate(starts) if t is not None and t >= since]
+        out.sort()
+        return out
+
+class PerfStore:
+    # Per-server series (tps, mspt, lag_ms, startup_s) plus markers for
+    # joins, leaves and tasks. Samples come from the supervisor loop and the
+    # probe thread, reads from Flask threads, so everything takes the lock.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.series = {}
+        self.latest = {}
+        self.markers = collections.deque(maxlen=PERF_MARKERS)
+
+    def record(self, name, value, now=None):
+        now = time.time() if now is None else now
+        with self.lock:
+            if name not in self.series:
+                self.series[name] = TimeSeries()
+            self.series[name].add(value, now)
+            self.latest[name] = (now, value)
+
+    def mark(self, kind, label):
+        with self.lock:
+            self.markers.append((time.time(), kind, label))
+
+    def query(self, span):
+        # Picks the finest tier whose ring still covers `span` seconds
+        now = time.time()
+        tier = next((n for n, (step, slots) in enumerate(PERF_TIERS) if step * slots >= span), len(PERF_TIERS) - 1)
+        since = now - min(span, PERF_TIERS[tier][0] * PERF_TIERS[tier][1])
+        with self.lock:
+            return {
+                "step": PERF_TIERS[tier][0],
+                "since": since,
+                "now": now,
+                "series": {name: ts.points(tier, since) for name, ts in self.series.items()},
+                "latest": {name: {"time": t, "value": v} for name, (t, v) in self.latest.items()},
+                "markers": [{"time": t, "kind": k, "label": l} for t, k, l in self.markers if t >= since]
+            }
+
+# -----------------------------
+# Event stream broadcaster (NEW)
+# -----------------------------
+STREAM_HISTORY = 1000
+STREAM_KEEPALIVE = 15
+# /stream runs on the Flask dev server, which holds one request thread per
+# open stream; only the WebSocket (WS_PORT) is served from the supervisor
+# loop. The stream is the fallback for pages that cannot reach WS_PORT, so
+# its threads are capped: past this, /stream answers 503 and pages poll.
+STREAM_MAX_CLIENTS = 200
+stream_slots = threading.BoundedSemaphore(STREAM_MAX_CLIENTS)
+
+class EventBroadcaster:
+    # Fan-out for /stream. Events live in one shared history ring and every
+    # subscriber just remembers the last id it sent, so publishing is a single
+    # append + notify no matter how many clients are connected, and idle
+    # clients sleep on the condition until something happens.
+    def __init__(self, history=STREAM_HISTORY):
+        self.cond = threading.Condition()
+        self.history = RingBuffer(history)
+        self.last_id = 0
+        self.listeners = []  # push subscribers (the WebSocket hub), called with (id, event, payload)
+
+    def publish(self, event, data):
+        payload = json.dumps(data)  # serialized once, shared by all clients
+        with self.cond:
+            self.last_id += 1
+            event_id = self.last_id
+            self.history.append(event_id, (event, payload))
+            self.cond.notify_all()
+            # Under the lock so listeners see ids in order even with
+            # concurrent publishers; they must only hand the event off
+            for listener in self.listeners:
+                listener(event_id, event, payload)
+
+    def wait_after(self, last_id, timeout):
+        # Returns (events newer than last_id, gap). gap is True when the
+        # client's id fell out of the history (or is from a previous run).
+        with self.cond:
+            if self.last_id == last_id:
+                self.cond.wait(timeout)
+            if self.last_id == last_id:
+                return [], False
+            gap = last_id > self.last_id or last_id < self.history.first_seq() - 1
+            batch = self.history.range(0 if gap else last_id)
+            return [(event_id, event, payload) for event_id, (event, payload) in batch], gap
+
+# -----------------------------
+# Server instances (NEW)
+# -----------------------------
+class ServerInstance:
+    # One managed server: its config plus the state that used to be module
+    # globals (process handle, chat/console buffers, players, task slot, crash
+    # history, event stream, RCON pool). Instances share the supervisor loop,
+    # the SQLite writers and the monitor threads, so an idle server costs no
+    # threads of its own.
+    def __init__(self, name, minecraft_dir, java_path=None, backup_dir=None, attach=None,
+                 rcon_port=None, rcon_password=None, memory="4G", chunk_store_dir=None,
+                 previous_world_dir=None, latest_log=None, geyser_jar_path=None):
+        self.name = name
+        self.minecraft_dir = minecraft_dir
+        self.java_path = java_path or os.path.join(minecraft_dir, "javbin", "bin", "javaw.exe")
+        self.backup_dir = backup_dir or os.path.join(BACKUP_DIR, name)
+        self.chunk_store_dir = chunk_store_dir or os.path.join(self.backup_dir, "chunkstore")
+        self.previous_world_dir = previous_world_dir or os.path.join(minecraft_dir, "world.previous")
+        self.latest_log = latest_log or os.path.join(minecraft_dir, "logs", "latest.log")
+        self.geyser_jar_path = geyser_jar_path or os.path.join(minecraft_dir, "mods", "Geyser-Fabric.jar")
+        self.attach = ATTACH_MODE if attach is None else attach
+        self.rcon_port = rcon_port
+        self.rcon_password = rcon_password
+        for d in (self.backup_dir, os.path.join(minecraft_dir, "mods"), os.path.join(minecraft_dir, "logs")):
+            os.makedirs(d, exist_ok=True)
+        self.jar = find_server_jar(minecraft_dir)
+        self.start_cmd = [self.java_path, f"-Xmx{memory}", "-jar", self.jar, "nogui"]
+
+        self.server_process = None
+        self.chat_log = RingBuffer(MAX_CHAT_LINES)
+        self.players_online = set()
+        self.console_spill = ConsoleSpill(os.path.join(CONSOLE_SPILL_DIR, name))
+        self.server_output_buffer = RecordBuffer(SERVER_OUTPUT_MAX, self.console_spill)
+        # Every chat/console line gets a sequence id so pollers only fetch deltas
+        self.log_lock = threading.Lock()
+        self.log_seq = 0
+        self.players_changed_seq = 0
+        self.task_lock = threading.Lock()
+        self.current_task = None
+        self.task_started_at = None
+        self.task_progress = None
+        self.crash_history = RingBuffer(100)
+        self.crash_seq = 0
+        self.last_scheduled_backup = None
+        self.properties_cache = {"mtime": None, "props": {}}
+        self.events = EventBroadcaster()
+        self.ws = WebSocketHub(self)
+        self.rcon = RconPool(RCON_POOL_SIZE, self)
+        self.perf = PerfStore()
+        # NEW: Bumped on every change the polled JSON endpoints can show
+        # (console/chat lines, players, tasks, process state, command
+        # counters); their serialized replies are cached per version
+        self.versions = itertools.count(1)
+        self.state_version = 0
+        self.json_cache = {}  # key -> (version, body)
+        self.last_output_at = None
+
+    def start_task(self, name):
+        with self.task_lock:
+            if self.current_task is not None:
+                return False
+            self.current_task = name
+            self.task_started_at = time.time()
+            print(f"[TASK] Started: {name} ({self.name})")
+            self.events.publish("task", {"task": name})
+            self.perf.mark("task", name)
+            self.bump()
+            return True
+
+    def finish_task(self):
+        with self.task_lock:
+            if self.current_task is not None:
+                # restore:<file> and the like are one series
+                TASK_SECONDS.observe(time.time() - self.task_started_at, self.name, self.current_task.split(":")[0])
+                self.perf.mark("task_end", self.current_task)
+            self.current_task = None
+            self.task_started_at = None
+            self.task_progress = None
+            print(f"[TASK] Finished ({self.name}).")
+            self.events.publish("task", {"task": None})
+            self.bump()
+
+    def set_task_progress(self, progress):
+        # Free-form progress text for the running task, e.g. "42%"
+        with self.task_lock:
+            if progress == self.task_progress:
+                return
+            self.task_progress = progress
+            self.events.publish("task", {"task": self.current_task, "progress": progress})
+            self.bump()
+
+    def is_task_running(self):
+        with self.task_lock:
+            return self.current_task is not None
+
+    def report_progress(self, done, total):
+        self.set_task_progress(f"{done * 100 // total}%")
 
-def is_task_running():
-    with task_lock:
-        return current_task is not None
+    def append_output_line(self, record):
+        with self.log_lock:
+            self.log_seq += 1
+            self.server_output_buffer.append(self.log_seq, record)
+            return self.log_seq
+
+    def append_chat_line(self, text):
+        with self.log_lock:
+            self.log_seq += 1
+            self.chat_log.append(self.log_seq, text)
+            return self.log_seq
+
+    def mark_players_changed(self, publish=False):
+        # Takes a cursor value of its own, so a client already at log_seq
+        # still sees players_changed_seq > since on its next /chat.
+        # publish=True also pushes the list to /stream and WebSocket clients
+        # (join/leave events carry it already).
+        with self.log_lock:
+            self.log_seq += 1
+            self.players_changed_seq = self.log_seq
+        if publish:
+            self.events.publish("players", {"players": sorted(self.players_online)})
+        self.bump()
+
+    def publish_chat(self, text, player=None, kind="chat"):
+        seq = self.append_chat_line(text)
+        chat_store.add(text, player, kind, self.name)
+        self.events.publish("chat", {"seq": seq, "text": text})
+        self.bump()
+
+    def bump(self):
+        # Call after the change is visible; next() on a count is atomic
+        self.state_version = next(self.versions)
+
+    def running(self):
+        proc = self.server_process
+        return proc is not None and proc.poll() is None
 
 # -----------------------------
 # Clean exit
 # -----------------------------
-def kill_server():
-    global server_process, shutdown_flag
+def kill_servers():
+    # Every owned server gets /stop at once, then they are waited on together;
+    # attached servers are left running.
+    global shutdown_flag
     if shutdown_flag:
         return
     shutdown_flag = True
-    print("\n[EXIT] Shutting down - stopping server...")
-    if server_process and server_process.poll() is None:
+    owned = []
+    for inst in servers.values():
+        proc = inst.server_process
+        if not proc or proc.poll() is not None:
+            continue
+        if isinstance(proc, AttachedServer):
+            print(f"\n[EXIT] Detaching from {inst.name} - the server keeps running.")
+            proc.detach()
+            continue
+        owned.append(proc)
+    if not owned:
+        return
+    print(f"\n[EXIT] Shutting down - stopping {len(owned)} server(s)...")
+    for proc in owned:
         try:
             # Send stop command if process is running and hasn't closed stdin/out
-            if server_process.stdin:
-                server_process.stdin.write("/stop\n")
-                server_process.stdin.flush()
-            time.sleep(3)
-            if server_process.poll() is None:
-                server_process.terminate()
-                time.sleep(2)
-            if server_process.poll() is None:
-                server_process.kill()
+            proc.stop_requested = True
+            proc.write_line("/stop")
         except:
             pass
-    print("[EXIT] Server stopped.")
+    for signal_name, grace in (("terminate", 3), ("kill", 2)):
+        deadline = time.time() + grace
+        for proc in owned:
+            try:
+                if not proc.wait_for("exited", max(0, deadline - time.time())):
+                    getattr(proc, signal_name)()
+            except:
+                pass
+    print("[EXIT] Servers stopped.")
+
+atexit.register(kill_servers)
+signal.signal(signal.SIGINT, lambda s, f: (kill_servers(), chat_store.close(), console_index.close(), os._exit(0)))
+signal.signal(signal.SIGTERM, lambda s, f: (kill_servers(), chat_store.close(), console_index.close(), os._exit(0)))
+
+# -----------------------------
+# Sequenced log buffers (NEW)
+# -----------------------------
+def lines_since(buf, since, upto, limit):
+    # Capping at upto keeps lines appended mid-request for the next poll.
+    return [str(item) for _, item in buf.range(since, upto, limit)]
+
+def parse_since(inst):
+    # Returns (since, reset). A cursor from the future means the wrapper
+    # restarted and the client has to throw its view away.
+    try:
+        since = int(request.args.get("since", 0))
+    except ValueError:
+        since = 0
+    if since < 0 or since > inst.log_seq:
+        return 0, True
+    return since, False
+
+# NEW: Polled endpoints answer from a per-version cache. The ETag names the
+# server's state_version (plus the wrapper run and the request variant), so
+# a poller that already has the current state gets a bare 304, and all the
+# pollers between two changes share one serialization.
+BOOT_ID = uuid.uuid4().hex[:8]  # ETags from before a wrapper restart never match
+JSON_CACHE_KEYS = 64
+
+def versioned_json(inst, key, build):
+    # key: the query values that shape the reply; build() returns the dict
+    version = inst.state_version  # read first: the reply may be newer, never older
+    tag = f"{BOOT_ID}-{inst.name}-{version}-{hashlib.sha1(repr(key).encode()).hexdigest()[:12]}"
+    headers = {"ETag": f'"{tag}"', "Cache-Control": "no-cache"}
+    if request.if_none_match.contains_weak(tag):
+        return Response(status=304, headers=headers)
+    cached = inst.json_cache.get(key)
+    if cached and cached[0] == version:
+        body = cached[1]
+    else:
+        body = json.dumps(build())
+        if len(inst.json_cache) >= JSON_CACHE_KEYS:
+            inst.json_cache.clear()
+        inst.json_cache[key] = (version, body)
+    return Response(body, mimetype="application/json", headers=headers)
+
+# -----------------------------
+# SQLite logs (NEW)
+# -----------------------------
+class SqliteLog:
+    # Append-only SQLite table. WAL mode lets request threads read while the
+    # writer commits. Callers only enqueue, so a slow disk never holds up the
+    # stdout reader; the writer thread turns whatever piled up into a single
+    # transaction. Subclasses set SCHEMA and INSERT. SCHEMA may include
+    # ALTER TABLE ... ADD COLUMN to upgrade older databases.
+    SCHEMA = ()
+    INSERT = None
+    TAG = "SQLITE"
+    PRUNE_EVERY = 3600
+
+    def __init__(self, path, batch=CHAT_DB_BATCH):
+        self.path = path
+        self.batch = batch
+        self.queue = queue.Queue()
+        self.local = threading.local()
+        conn = self._connect()
+        with conn:
+            for stmt in self.SCHEMA:
+                try:
+                    conn.execute(stmt)
+                except sqlite3.OperationalError as e:
+                    if "duplicate column" not in str(e):  # already upgraded
+                        raise
+        conn.close()
+        self.thread = threading.Thread(target=self._writer, daemon=True)
+        self.thread.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def reader(self):
+        # One read connection per request thread
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = self.local.conn = self._connect()
+        return conn
+
+    def prune(self, conn):
+        pass
+
+    def _writer(self):
+        conn = self._connect()
+        last_prune = 0
+        while True:
+            batch = [self.queue.get()]
+            if batch[0] is not None:
+                time.sleep(DB_LINGER)
+            while len(batch) < self.batch:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            rows = [row for row in batch if row is not None]
+            try:
+                if rows:
+                    with conn:
+                        conn.executemany(self.INSERT, rows)
+                if time.time() - last_prune > self.PRUNE_EVERY:
+                    last_prune = time.time()
+                    with conn:
+                        self.prune(conn)
+            except sqlite3.Error as e:
+                print(f"[{self.TAG}] Failed to write {len(rows)} rows: {e}")
+            if None in batch:
+                conn.close()
+                return
+
+    def close(self, timeout=5):
+        # Flushes whatever is still queued (called at exit).
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join(timeout)
 
-atexit.register(kill_server)
-signal.signal(signal.SIGINT, lambda s, f: (kill_server(), os._exit(0)))
-signal.signal(signal.SIGTERM, lambda s, f: (kill_server(), os._exit(0)))
+def where_clause(conds):
+    # [(sql, arg or None)] -> (" WHERE ...", args), skipping unset filters
+    used = [(sql, arg) for sql, arg in conds if arg is not None]
+    if not used:
+        return "", []
+    return " WHERE " + " AND ".join(sql for sql, _ in used), [arg for _, arg in used]
+
+class ChatStore(SqliteLog):
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS messages ("
+        "id INTEGER PRIMARY KEY, ts REAL NOT NULL, player TEXT, "
+        "kind TEXT NOT NULL, text TEXT NOT NULL)",
+        "ALTER TABLE messages ADD COLUMN server TEXT NOT NULL DEFAULT 'main'",
+        "CREATE INDEX IF NOT EXISTS messages_ts ON messages (ts)",
+        "CREATE INDEX IF NOT EXISTS messages_server ON messages (server, id)",
+        "CREATE INDEX IF NOT EXISTS messages_server_player ON messages (server, player, id)",
+        "DROP INDEX IF EXISTS messages_player",
+    )
+    INSERT = "INSERT INTO messages (ts, player, kind, text, server) VALUES (?, ?, ?, ?, ?)"
+    TAG = "CHATDB"
+
+    def add(self, text, player=None, kind="chat", server=DEFAULT_SERVER):
+        self.queue.put((time.time(), player, kind, text, server))
+
+    def history(self, server, before=None, limit=100, player=None, before_time=None):
+        # Newest first. Pass the smallest id of a page as before= for the next.
+        where, args = where_clause([("server = ?", server), ("id < ?", before),
+                                    ("ts < ?", before_time), ("player = ?", player)])
+        sql = "SELECT id, ts, player, kind, text FROM messages" + where + " ORDER BY id DESC LIMIT ?"
+        return [{"id": i, "time": ts, "player": p, "kind": k, "text": t}
+                for i, ts, p, k, t in self.reader().execute(sql, args + [limit])]
+
+class ConsoleIndex(SqliteLog):
+    # Every console line plus an external-content FTS5 index over it.
+    # Levels come from parse_log_line, so stack trace bodies carry the level
+    # of the line that started them.
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS lines ("
+        "id INTEGER PRIMARY KEY, ts REAL NOT NULL, level TEXT, text TEXT NOT NULL)",
+        "ALTER TABLE lines ADD COLUMN server TEXT NOT NULL DEFAULT 'main'",
+        "CREATE INDEX IF NOT EXISTS lines_ts ON lines (ts)",
+        "CREATE INDEX IF NOT EXISTS lines_server ON lines (server, id)",
+        "CREATE VIRTUAL TABLE IF NOT EXISTS lines_fts USING fts5("
+        "text, content='lines', content_rowid='id')",
+        "CREATE TRIGGER IF NOT EXISTS lines_ai AFTER INSERT ON lines BEGIN "
+        "INSERT INTO lines_fts (rowid, text) VALUES (new.id, new.text); END",
+        "CREATE TRIGGER IF NOT EXISTS lines_ad AFTER DELETE ON lines BEGIN "
+        "INSERT INTO lines_fts (lines_fts, rowid, text) VALUES ('delete', old.id, old.text); END",
+    )
+    INSERT = "INSERT INTO lines (ts, level, text, server) VALUES (?, ?, ?, ?)"
+    TAG = "LOGDB"
+
+    def __init__(self, path):
+        super().__init__(path, batch=CONSOLE_DB_BATCH)
+
+    def add(self, line, level=None, server=DEFAULT_SERVER):
+        self.queue.put((time.time(), level, line, server))
+
+    def prune(self, conn):
+        conn.execute("DELETE FROM lines WHERE ts < ?", (time.time() - CONSOLE_INDEX_DAYS * 86400,))
+
+    def search(self, server, q, start=None, end=None, level=None, limit=SEARCH_LIMIT, context=SEARCH_CONTEXT):
+        # Every word must appear; each is quoted so "java.lang.Foo" or a stray
+        # '*' is matched literally instead of being FTS syntax.
+        terms = " ".join('"' + t.replace('"', '""') + '"' for t in q.split())
+        if not terms:
+            return []
+        where, args = where_clause([("lines_fts MATCH ?", terms), ("l.server = ?", server),
+                                    ("l.ts >= ?", start), ("l.ts < ?", end), ("l.level = ?", level)])
+        conn = self.reader()
+        hits = conn.execute(
+            "SELECT l.id, l.ts, l.level, l.text, bm25(lines_fts) FROM lines_fts "
+            "JOIN lines l ON l.id = lines_fts.rowid" + where +
+            " ORDER BY bm25(lines_fts), l.id DESC LIMIT ?", args + [limit]).fetchall()
+        results = []
+        for i, ts, lvl, text, score in hits:
+            # Servers share the table, so neighbours are the same server's rows, not id +- context
+            before = conn.execute("SELECT text FROM lines WHERE server = ? AND id < ? ORDER BY id DESC LIMIT ?",
+                                  (server, i, context)).fetchall()
+            after = conn.execute("SELECT text FROM lines WHERE server = ? AND id > ? ORDER BY id LIMIT ?",
+                                 (server, i, context)).fetchall()
+            results.append({"id": i, "time": ts, "level": lvl, "text": text, "score": -score,
+                            "before": [t for (t,) in reversed(before)],
+                            "after": [t for (t,) in after]})
+        return results
+
+chat_store = ChatStore(CHAT_DB_PATH)
+console_index = ConsoleIndex(CONSOLE_DB_PATH)
+atexit.register(chat_store.close)
+atexit.register(console_index.close)
 
 # -----------------------------
-# FULL HTML TEMPLATES (Unchanged)
+# FULL HTML TEMPLATES
 # -----------------------------
 # ... (HTML_PAGE and ADMIN_PAGE remain here as they were)
 HTML_PAGE = """
@@ -184,11 +1345,11 @@ body{margin:0;background:var(--bg);color:#e6eef6;font-family:Segoe UI,Roboto,Ari
   <div class="title">
     <div>
       <h1 class="h1">WebCraft</h1>
-      <div class="sub">Guest: <strong>{{ user_prefix }}</strong></div>
+      <div class="sub">Guest: <strong id="guestName">&hellip;</strong>{% if fleet %} &middot; Server: <strong>{{ server }}</strong> (<a href="/fleet" style="color:inherit">all servers</a>){% endif %}</div>
     </div>
   </div>
   <div>
-    <button class="admin-btn" onclick="window.open('/admin','_blank')">Open Admin</button>
+    <button class="admin-btn" onclick="window.open(BASE + '/admin','_blank')">Open Admin</button>
   </div>
 </div>
 <div class="layout">
@@ -208,7 +1369,7 @@ body{margin:0;background:var(--bg);color:#e6eef6;font-family:Segoe UI,Roboto,Ari
       <div class="kv"><div class="small">Server Status</div><div id="srvStatus" class="small">unknown</div></div>
       <div class="kv"><div class="small">Task</div><div id="taskStatus" class="small">idle</div></div>
       <div style="margin-top:8px">
-        <button class="admin-btn" onclick="window.open('/admin','_blank')">Admin Panel</button>
+        <button class="admin-btn" onclick="window.open(BASE + '/admin','_blank')">Admin Panel</button>
       </div>
     </div>
     <div class="section small">
@@ -217,44 +1378,113 @@ body{margin:0;background:var(--bg);color:#e6eef6;font-family:Segoe UI,Roboto,Ari
   </div>
 </div>
 <script>
+const BASE = {{ base|tojson }};  // "" or /s/<name> for a fleet server
+let chatCursor = 0;
+const MAX_CHAT_NODES = 200;
+function appendLines(area, lines, maxNodes){
+  if(!lines.length) return;
+  const stick = area.scrollTop + area.clientHeight >= area.scrollHeight - 4;
+  const frag = document.createDocumentFragment();
+  for(const m of lines){
+    const el = document.createElement('div');
+    el.textContent = m;
+    frag.appendChild(el);
+  }
+  area.appendChild(frag);
+  while(area.childElementCount > maxNodes) area.removeChild(area.firstChild);
+  if(stick) area.scrollTop = area.scrollHeight;
+}
+function renderPlayers(players){
+  const pl = document.getElementById('players');
+  if(players.length){
+    pl.innerHTML = '';
+    for(const p of players){
+      const div = document.createElement('div');
+      div.textContent = p;
+      pl.appendChild(div);
+    }
+  } else {
+    pl.innerHTML = 'No players yet';
+  }
+}
+function setServer(running){ document.getElementById('srvStatus').textContent = running ? 'running' : 'stopped'; }
+function setTask(task, progress){ document.getElementById('taskStatus').textContent = (task || 'idle') + (progress ? ' (' + progress + ')' : ''); }
+function touch(){ document.getElementById('lastLogTime').textContent = new Date().toLocaleTimeString(); }
 async function fetchData(){
   try {
-    const r = await fetch('/chat'); const d = await r.json();
+    const r = await fetch(BASE + '/chat?since=' + chatCursor); const d = await r.json();
     const chat = document.getElementById('chat');
-    chat.innerHTML = '';
-    for(const m of d.messages){
-      const el = document.createElement('div');
-      el.textContent = m;
-      chat.appendChild(el);
-    }
-    chat.scrollTop = chat.scrollHeight;
-    const pl = document.getElementById('players');
-    if(d.players && d.players.length){
-      pl.innerHTML = '';
-      for(const p of d.players){
-        const div = document.createElement('div');
-        div.textContent = p;
-        pl.appendChild(div);
-      }
-    } else {
-      pl.innerHTML = 'No players yet';
-    }
-    const s = await fetch('/admin/status'); const js = await s.json();
-    document.getElementById('srvStatus').textContent = js.server_running ? 'running' : 'stopped';
-    document.getElementById('taskStatus').textContent = js.current_task || 'idle';
+    if(d.reset) chat.innerHTML = '';
+    appendLines(chat, d.messages, MAX_CHAT_NODES);
+    chatCursor = d.cursor;
+    if(d.players) renderPlayers(d.players);
+    const s = await fetch(BASE + '/admin/status'); const js = await s.json();
+    setServer(js.server_running);
+    setTask(js.current_task, js.progress);
     if(js.last_log_time) document.getElementById('lastLogTime').textContent = js.last_log_time;
+    return d.event_id;
   } catch(e){
     console.error(e);
   }
 }
+// Same events over the WebSocket and /stream
+function handleEvent(event, d){
+  if(event === 'chat'){
+    if(d.seq <= chatCursor) return;  // already fetched via /chat
+    chatCursor = d.seq;
+    appendLines(document.getElementById('chat'), [d.text], MAX_CHAT_NODES);
+    touch();
+  } else if(event === 'join' || event === 'leave' || event === 'players'){
+    renderPlayers(d.players); touch();
+  } else if(event === 'task'){
+    setTask(d.task, d.progress);
+  } else if(event === 'server'){
+    setServer(d.running);
+  } else if(event === 'reset'){
+    chatCursor = 0; fetchData();
+  } else if(event === 'error'){
+    console.error(d.message);
+  }
+}
+function openStream(lastEventId){
+  const es = new EventSource(BASE + '/stream?last_event_id=' + lastEventId);
+  for(const name of ['chat','join','leave','players','task','server','reset']){
+    es.addEventListener(name, e => handleEvent(name, JSON.parse(e.data)));
+  }
+  // Refused (503 when the wrapper has too many streams): the browser gives up, so poll
+  es.onerror = () => { if(es.readyState === EventSource.CLOSED) setInterval(fetchData, 1000); };
+}
+const WS_PORT = {{ ws_port|tojson }};
+let ws = null;
+function openSocket(lastEventId){
+  // One connection both ways. If it never opens (port blocked, https proxy) fall back to /stream + /send
+  const sock = new WebSocket((location.protocol === 'https:' ? 'wss://' : 'ws://') + location.hostname + ':' + WS_PORT + BASE + '/ws?last_event_id=' + lastEventId);
+  let opened = false;
+  sock.onopen = () => { opened = true; ws = sock; };
+  sock.onmessage = e => { const m = JSON.parse(e.data); handleEvent(m.event, m.data); };
+  sock.onclose = () => {
+    ws = null;
+    if(!opened) openStream(lastEventId);
+    else setTimeout(() => fetchData().then(id => openSocket(id || 0)), 2000);
+  };
+}
 async function sendMessage(){
   const v = document.getElementById('msgInput').value.trim();
   if(!v) return;
   document.getElementById('msgInput').value = '';
-  await fetch('/send',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({msg:v})});
+  if(ws && ws.readyState === WebSocket.OPEN){ ws.send(JSON.stringify({msg:v})); return; }
+  await fetch(BASE + '/send',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({msg:v})});
+}
+// The page itself is the same cached bytes for everyone; the guest name is per client
+fetch('/whoami').then(r => r.json()).then(j => { document.getElementById('guestName').textContent = j.user; });
+if(window.WebSocket && WS_PORT){
+  fetchData().then(id => openSocket(id || 0));
+} else if(window.EventSource){
+  fetchData().then(id => openStream(id || 0));
+} else {
+  setInterval(fetchData, 1000);
+  fetchData();
 }
-setInterval(fetchData, 1000);
-fetchData();
 </script>
 </body>
 </html>
@@ -287,11 +1517,11 @@ body{background:#07080a;color:#e6eef6;font-family:Segoe UI,Arial,sans-serif;padd
 <div class="container">
   <div class="header">
     <div>
-      <h2 class="h1">Admin Panel</h2>
+      <h2 class="h1">Admin Panel{% if fleet %} - {{ server }}{% endif %}</h2>
       <div class="small">Manage server backups, restart, and restores. No password change here (edit passkey.txt).</div>
     </div>
     <div>
-      <button class="btn gray" onclick="window.open('/','_blank')">Open Main Panel</button>
+      <button class="btn gray" onclick="window.open(BASE + '/','_blank')">Open Main Panel</button>
     </div>
   </div>
   <div id="authBlock" class="panel">
@@ -319,9 +1549,17 @@ body{background:#07080a;color:#e6eef6;font-family:Segoe UI,Arial,sans-serif;padd
           <button id="btnKill" class="btn red" onclick="startAction('kill')">Kill Server</button>
           <button id="btnBackup" class="btn" onclick="startAction('backup')">Create Backup</button>
           <label class="file">
-            <input id="rarfile" type="file" accept=".rar" />
+            <input id="rarfile" type="file" accept=".rar,.zst,.gz" />
           </label>
-          <button id="btnRestore" class="btn" onclick="doRestore()">Restore Backup (upload .rar)</button>
+          <button id="btnRestore" class="btn" onclick="doRestore()">Restore Backup (upload archive)</button>
+          <button id="btnRollback" class="btn gray" onclick="startAction('rollback')">Undo Last Restore</button>
+          <button id="btnReload" class="btn gray" style="display:none" onclick="startAction('reload')">Reload Wrapper</button>
+        </div>
+        <div style="display:flex;gap:8px;align-items:center;margin-top:8px">
+          <button id="btnProfiler" class="btn gray" onclick="toggleProfiler()">Start Profiler</button>
+          <a class="small" href="/admin/profiler" download="profile.folded">Download folded stacks</a>
+          <a class="small" href="/metrics" target="_blank">Metrics</a>
+          <span id="profilerInfo" class="small"></span>
         </div>
       </div>
       <div class="panel" style="margin-top:10px">
@@ -331,15 +1569,55 @@ body{background:#07080a;color:#e6eef6;font-family:Segoe UI,Arial,sans-serif;padd
             <button class="btn" onclick="sendCommand()">Run</button>
         </div>
         <div class="status" id="statusText"></div>
+        <pre id="cmdOutput" class="logarea" style="display:none;height:auto;max-height:200px;white-space:pre-wrap;margin:8px 0 0 0"></pre>
+      </div>
+      <div class="panel" style="margin-top:10px">
+        <div style="display:flex;justify-content:space-between;align-items:center">
+          <h3 style="margin:0">Performance</h3>
+          <select id="perfSpan" class="input" onchange="updatePerf()">
+            <option value="3600">Last hour</option><option value="86400">Last day</option><option value="2592000">Last 30 days</option>
+          </select>
+        </div>
+        <div id="perfInfo" class="small" style="margin:6px 0"></div>
+        <svg id="perfGraph" viewBox="0 0 600 80" preserveAspectRatio="none" style="width:100%;height:80px;background:#020203;border-radius:6px"></svg>
+        <div class="small">MSPT (line = mean, shade = max, dashed = 50ms budget), <span style="color:#d73a49">lag warnings</span>,
+          <span style="color:#2ea043">joins</span>, <span style="color:#1982c4">tasks</span>, <span style="color:#ffd166">startups</span></div>
       </div>
       <div class="panel" style="margin-top:10px">
         <h3 style="margin:0 0 8px 0">Recent server output</h3>
+        <div style="display:flex;gap:8px;align-items:center;flex-wrap:wrap;margin-bottom:8px">
+            <select id="logLevel" class="input" onchange="resetLogs()">
+              <option value="">All levels</option><option value="INFO">INFO+</option><option value="WARN">WARN+</option><option value="ERROR">ERROR+</option>
+            </select>
+            <input id="logSource" class="input" placeholder="source / thread" onchange="resetLogs()" />
+            <input id="logRegex" class="input" placeholder="regex" style="flex:1" onchange="resetLogs()" />
+        </div>
+        <button id="btnOlder" class="btn gray" style="margin-bottom:6px" onclick="loadOlder()">Load older output</button>
         <div id="logArea" class="logarea"></div>
       </div>
+      <div class="panel" style="margin-top:10px">
+        <h3 style="margin:0 0 8px 0">Search server output</h3>
+        <div style="display:flex;gap:8px;align-items:center;flex-wrap:wrap">
+            <input id="searchInput" class="input" placeholder="NullPointerException" style="flex:1" onkeydown="if(event.key==='Enter')searchLogs()" />
+            <input id="searchFrom" class="input" type="date" title="From" />
+            <input id="searchTo" class="input" type="date" title="To" />
+            <select id="searchLevel" class="input">
+              <option value="">Any level</option><option>ERROR</option><option>WARN</option><option>INFO</option>
+            </select>
+            <button class="btn" onclick="searchLogs()">Search</button>
+        </div>
+        <div id="searchInfo" class="small" style="margin:6px 0"></div>
+        <div id="searchArea" class="logarea" style="display:none"></div>
+      </div>
+      <div class="panel" style="margin-top:10px">
+        <h3 style="margin:0 0 8px 0">Recent chat</h3>
+        <div id="chatArea" class="logarea"></div>
+      </div>
     </div>
   </div>
 </div>
 <script>
+const BASE = {{ base|tojson }};  // "" or /s/<name> for a fleet server
 async function doAuth(){
   const pw = document.getElementById('pw').value;
   const r = await fetch('/admin/auth',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({pw})});
@@ -357,22 +1635,65 @@ async function doLogout(){
 function showAuthed(){
   document.getElementById('notAuthed').style.display='none';
   document.getElementById('authed').style.display='block';
-  fetchStatus(); updateLogs();
+  fetchStatus(); updateLogs(); updatePerf();
   setInterval(fetchStatus,2000);
   setInterval(updateLogs,2000);
+  setInterval(updatePerf,10000);
 }
 async function fetchStatus(){
-  const r = await fetch('/admin/status');
+  const r = await fetch(BASE + '/admin/status');
   const j = await r.json();
-  document.getElementById('taskIndicator').textContent = 'Task: ' + (j.current_task||'idle');
+  document.getElementById('taskIndicator').textContent = 'Task: ' + (j.current_task||'idle') + (j.progress ? ' (' + j.progress + ')' : '');
   document.getElementById('statusText').textContent = j.message || '';
+  document.getElementById('btnReload').style.display = j.attached ? '' : 'none';
+  showProfiler(j.profiler);
   const running = !!j.current_task;
   // Disable main action buttons while a task is running
-  const btns = ['btnRestart','btnStop','btnKill','btnBackup','btnRestore'];
+  const btns = ['btnRestart','btnStop','btnKill','btnBackup','btnRestore','btnRollback','btnReload'];
   btns.forEach(id=>{ const el=document.getElementById(id); if(el) el.classList.toggle('disabled', running); });
 }
+const MARKER_COLORS = {join:'#2ea043', leave:'#555', task:'#1982c4', task_end:'#1982c4', ready:'#ffd166'};
+async function updatePerf(){
+  const span = +document.getElementById('perfSpan').value;
+  const j = await (await fetch(BASE + '/admin/perf?span=' + span)).json();
+  if(!j.series) return;
+  const W = 600, H = 80, t0 = j.since, dt = j.now - j.since;
+  const x = t => ((t - t0) / dt * W).toFixed(1);
+  const mspt = j.series.mspt || [], lag = j.series.lag_ms || [];
+  const top = Math.max(60, ...mspt.map(p => p[2]));
+  const y = v => (H - Math.min(v, top) / top * (H - 4)).toFixed(1);
+  let svg = '<line x1="0" x2="' + W + '" y1="' + y(50) + '" y2="' + y(50) + '" stroke="#444" stroke-dasharray="4 3"/>';
+  for(const m of j.markers){
+    svg += '<line x1="' + x(m.time) + '" x2="' + x(m.time) + '" y1="0" y2="' + H + '" stroke="' + (MARKER_COLORS[m.kind] || '#555') +
+      '" stroke-opacity="0.6"><title>' + m.kind + ': ' + m.label.replace(/[<&]/g, '') + '</title></line>';
+  }
+  if(mspt.length){
+    svg += '<polygon fill="#1982c4" fill-opacity="0.25" points="' + x(mspt[0][0]) + ',' + H + ' ' +
+      mspt.map(p => x(p[0]) + ',' + y(p[2])).join(' ') + ' ' + x(mspt[mspt.length-1][0]) + ',' + H + '"/>';
+    svg += '<polyline fill="none" stroke="#7cc4ff" stroke-width="1.5" points="' + mspt.map(p => x(p[0]) + ',' + y(p[1])).join(' ') + '"/>';
+  }
+  for(const p of lag) svg += '<circle cx="' + x(p[0]) + '" cy="4" r="3" fill="#d73a49"><title>' + Math.round(p[2]) + 'ms behind</title></circle>';
+  document.getElementById('perfGraph').innerHTML = svg;
+  const tps = j.latest.tps, ms = j.latest.mspt;
+  document.getElementById('perfInfo').textContent = tps
+    ? 'TPS ' + tps.value.toFixed(1) + ' / MSPT ' + ms.value.toFixed(1) + ' ms (' + new Date(tps.time * 1000).toLocaleTimeString() + ')' +
+      (lag.length ? ', ' + lag.length + ' lag warnings in range' : '')
+    : 'No TPS readings yet';
+}
+// The profiler and /metrics cover the whole wrapper, so they are not under BASE
+let profilerOn = false;
+function showProfiler(p){
+  if(!p) return;
+  profilerOn = p.running;
+  document.getElementById('btnProfiler').textContent = p.running ? 'Stop Profiler' : 'Start Profiler';
+  document.getElementById('profilerInfo').textContent = p.samples ? p.samples + ' samples' : '';
+}
+async function toggleProfiler(){
+  const r = await fetch('/admin/profiler', {method:'POST', headers:{'Content-Type':'application/json'}, body:JSON.stringify({enabled: !profilerOn})});
+  showProfiler(await r.json());
+}
 async function startAction(action){
-  const r = await fetch('/admin/' + action, {method:'POST'});
+  const r = await fetch(BASE + '/admin/' + action, {method:'POST'});
   const j = await r.json();
   document.getElementById('statusText').textContent = j.message || JSON.stringify(j);
 }
@@ -382,31 +1703,236 @@ async function sendCommand(){
   if(!cmd) return;
   document.getElementById('cmdInput').value = ''; // Clear input immediately
   
-  const r = await fetch('/admin/command', {
+  const r = await fetch(BASE + '/admin/command', {
       method:'POST',
       headers:{'Content-Type':'application/json'},
       body:JSON.stringify({cmd: cmd})
   });
   const j = await r.json();
   document.getElementById('statusText').textContent = j.message || JSON.stringify(j);
+  const out = document.getElementById('cmdOutput');
+  out.style.display = j.response ? 'block' : 'none';
+  out.textContent = j.response ? '> ' + cmd + '\\n' + j.response : '';
 }
+// SHA-256 for plain-http admin pages, where crypto.subtle is unavailable
+function sha256js(data){
+  const K=[],H=[];let n=2,c=0;
+  while(c<64){let p=true;for(let d=2;d*d<=n;d++)if(n%d===0){p=false;break;}
+    if(p){if(c<8)H[c]=(Math.pow(n,1/2)*4294967296)|0;K[c++]=(Math.pow(n,1/3)*4294967296)|0;}n++;}
+  const len=data.length, total=((len+72)>>6)<<6, m=new Uint8Array(total);
+  m.set(data); m[len]=0x80;
+  const dv=new DataView(m.buffer);
+  dv.setUint32(total-8, Math.floor(len/536870912)); dv.setUint32(total-4, (len*8)>>>0);
+  const w=new Int32Array(64);
+  for(let o=0;o<total;o+=64){
+    for(let i=0;i<16;i++) w[i]=dv.getInt32(o+i*4);
+    for(let i=16;i<64;i++){const x=w[i-15],y=w[i-2];
+      w[i]=((((x>>>7)|(x<<25))^((x>>>18)|(x<<14))^(x>>>3))+w[i-16]+(((y>>>17)|(y<<15))^((y>>>19)|(y<<13))^(y>>>10))+w[i-7])|0;}
+    let [a,b,cc,d,e,f,g,h]=H;
+    for(let i=0;i<64;i++){
+      const t1=(h+(((e>>>6)|(e<<26))^((e>>>11)|(e<<21))^((e>>>25)|(e<<7)))+((e&f)^(~e&g))+K[i]+w[i])|0;
+      const t2=((((a>>>2)|(a<<30))^((a>>>13)|(a<<19))^((a>>>22)|(a<<10)))+((a&b)^(a&cc)^(b&cc)))|0;
+      h=g;g=f;f=e;e=(d+t1)|0;d=cc;cc=b;b=a;a=(t1+t2)|0;}
+    H[0]=(H[0]+a)|0;H[1]=(H[1]+b)|0;H[2]=(H[2]+cc)|0;H[3]=(H[3]+d)|0;H[4]=(H[4]+e)|0;H[5]=(H[5]+f)|0;H[6]=(H[6]+g)|0;H[7]=(H[7]+h)|0;}
+  return H.map(x=>(x>>>0).toString(16).padStart(8,'0')).join('');
+}
+async function sha256hex(buf){
+  if(window.crypto && crypto.subtle){
+    const h = await crypto.subtle.digest('SHA-256', buf);
+    return [...new Uint8Array(h)].map(b=>b.toString(16).padStart(2,'0')).join('');
+  }
+  return sha256js(new Uint8Array(buf));
+}
+function hexBytes(hex){ return new Uint8Array(hex.match(/../g).map(x=>parseInt(x,16))); }
+const UPLOAD_WORKERS = 4;
 async function doRestore(){
+  // Chunked + resumable: re-selecting the same file after a failure only sends missing chunks
   const f = document.getElementById('rarfile').files[0];
-  if(!f){ alert('Select a .rar file first'); return; }
-  const fd = new FormData();
-  fd.append('rarfile', f);
-  const r = await fetch('/admin/restore',{method:'POST', body: fd});
-  const j = await r.json();
-  document.getElementById('statusText').textContent = j.message || JSON.stringify(j);
+  if(!f){ alert('Select a backup archive first'); return; }
+  const status = document.getElementById('statusText');
+  const post = (url, body) => fetch(url,{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify(body)});
+  const init = await (await post(BASE + '/admin/upload/init', {filename:f.name, size:f.size, key:f.name+':'+f.size+':'+f.lastModified})).json();
+  if(!init.upload_id){ status.textContent = init.message || 'Upload refused'; return; }
+  const cs = init.chunk_size, count = Math.ceil(f.size / cs);
+  const have = new Set(init.received), hashes = new Array(count);
+  let next = 0, sent = have.size;
+  async function worker(){
+    for(let i = next++; i < count; i = next++){
+      const buf = await f.slice(i*cs, Math.min(f.size, (i+1)*cs)).arrayBuffer();
+      hashes[i] = await sha256hex(buf);
+      if(have.has(i)) continue;
+      for(let attempt = 1; ; attempt++){
+        const r = await fetch(BASE + '/admin/upload/' + init.upload_id + '?offset=' + (i*cs), {method:'PUT', headers:{'X-Chunk-SHA256':hashes[i]}, body:buf}).catch(() => null);
+        if(r && r.ok) break;
+        if(attempt >= 5) throw new Error('chunk ' + i + ' failed');
+        await new Promise(res => setTimeout(res, 1000 * attempt));
+      }
+      status.textContent = 'Uploading ' + Math.floor(++sent * 100 / count) + '%';
+    }
+  }
+  try {
+    await Promise.all(Array.from({length: UPLOAD_WORKERS}, worker));
+  } catch(e){
+    status.textContent = e.message + ' - select the same file again to resume';
+    return;
+  }
+  const all = new Uint8Array(count * 32);
+  hashes.forEach((h, i) => all.set(hexBytes(h), i * 32));
+  const j = await (await post(BASE + '/admin/upload/' + init.upload_id + '/finalize', {sha256: await sha256hex(all.buffer)})).json();
+  status.textContent = j.message || JSON.stringify(j);
+}
+async function searchLogs(){
+  const q = document.getElementById('searchInput').value.trim();
+  if(!q) return;
+  const p = new URLSearchParams({q});
+  const from = document.getElementById('searchFrom').value, to = document.getElementById('searchTo').value;
+  const level = document.getElementById('searchLevel').value;
+  if(from) p.set('from', from);
+  if(to) p.set('to', to + 'T23:59:59');
+  if(level) p.set('level', level);
+  const j = await (await fetch(BASE + '/admin/logs/search?' + p)).json();
+  const info = document.getElementById('searchInfo'), area = document.getElementById('searchArea');
+  area.innerHTML = '';
+  if(!j.hits){ info.textContent = j.message || 'Search failed'; area.style.display = 'none'; return; }
+  info.textContent = j.hits.length + ' hits in ' + j.took_ms + ' ms';
+  area.style.display = j.hits.length ? 'block' : 'none';
+  for(const h of j.hits){
+    const block = document.createElement('div');
+    block.style.cssText = 'border-bottom:1px solid #222;padding:4px 0';
+    const stamp = document.createElement('div');
+    stamp.className = 'small'; stamp.textContent = new Date(h.time * 1000).toLocaleString();
+    block.appendChild(stamp);
+    const add = (t, strong) => { const el = document.createElement('div'); el.textContent = t; if(strong) el.style.color = '#ffd166'; else el.style.opacity = 0.6; block.appendChild(el); };
+    h.before.forEach(t => add(t)); add(h.text, true); h.after.forEach(t => add(t));
+    area.appendChild(block);
+  }
+}
+let logCursor = 0;
+function appendLines(area, lines, maxNodes){
+  if(!lines.length) return;
+  const stick = area.scrollTop + area.clientHeight >= area.scrollHeight - 4;
+  const frag = document.createDocumentFragment();
+  for(const l of lines){ const el=document.createElement('div'); el.textContent = l; frag.appendChild(el); }
+  area.appendChild(frag);
+  while(area.childElementCount > maxNodes) area.removeChild(area.firstChild);
+  if(stick) area.scrollTop = area.scrollHeight;
+}
+let logGen = 0, logOldest = null, logExtra = 0;
+function resetLogs(){
+  // Filters apply to new fetches only, so start the console view over
+  logGen++; logCursor = 0; logOldest = null; logExtra = 0;
+  document.getElementById('logArea').innerHTML = '';
+  document.getElementById('chatArea').innerHTML = '';
+  updateLogs();
+}
+function logParams(extra){
+  const p = new URLSearchParams(extra);
+  const filters = {level: 'logLevel', source: 'logSource', regex: 'logRegex'};
+  for(const k in filters){ const v = document.getElementById(filters[k]).value.trim(); if(v) p.set(k, v); }
+  return p;
+}
+async function loadOlder(){
+  if(logOldest === null) return;
+  const gen = logGen;
+  const j = await (await fetch(BASE + '/admin/logs/older?' + logParams({before: logOldest}))).json();
+  if(gen !== logGen || !j.lines) return;
+  const area = document.getElementById('logArea');
+  const keep = area.scrollHeight - area.scrollTop;
+  const frag = document.createDocumentFragment();
+  for(const l of j.lines){ const el=document.createElement('div'); el.textContent = l; frag.appendChild(el); }
+  area.insertBefore(frag, area.firstChild);
+  area.scrollTop = area.scrollHeight - keep;
+  logExtra += j.lines.length;
+  logOldest = j.before;
+  document.getElementById('btnOlder').classList.toggle('disabled', logOldest === null);
 }
 async function updateLogs(){
-  const r = await fetch('/admin/logs');
+  const p = logParams({since: logCursor});
+  const gen = logGen;
+  const r = await fetch(BASE + '/admin/logs?' + p);
   const j = await r.json();
+  if(gen !== logGen) return;  // filters changed while this was in flight
+  if(!r.ok){ document.getElementById('statusText').textContent = j.message || 'Log filter rejected'; return; }
   const area = document.getElementById('logArea');
-  area.innerHTML = '';
-  for(const l of j.lines){ const el=document.createElement('div'); el.textContent = l; area.appendChild(el); }
-  area.scrollTop = area.scrollHeight;
+  const chatArea = document.getElementById('chatArea');
+  if(j.reset){ area.innerHTML = ''; chatArea.innerHTML = ''; logExtra = 0; }
+  if(logCursor === 0 || j.reset){
+    logOldest = j.oldest;
+    document.getElementById('btnOlder').classList.remove('disabled');
+  }
+  appendLines(area, j.lines, 400 + logExtra);
+  appendLines(chatArea, j.chat, 100);
+  logCursor = j.cursor;
+}
+</script>
+</body>
+</html>
+"""
+
+# NEW: Aggregate dashboard for every server this wrapper runs
+FLEET_PAGE = """
+<!doctype html>
+<html lang="en">
+<head>
+<meta charset="utf-8"/>
+<title>WebCraft Fleet</title>
+<meta name="viewport" content="width=device-width,initial-scale=1"/>
+<style>
+:root { --bg:#0f1113; --panel:#151719; --muted:#9aa1a7; --good:#2ea44f; --bad:#d73a49; color-scheme: dark; }
+body{margin:0;background:var(--bg);color:#e6eef6;font-family:Segoe UI,Roboto,Arial,sans-serif}
+.header{padding:14px 18px;background:var(--panel);border-bottom:1px solid rgba(255,255,255,0.03)}
+.h1{font-size:18px;margin:0}
+.small{font-size:12px;color:var(--muted)}
+table{width:100%;border-collapse:collapse}
+th,td{text-align:left;padding:8px 12px;border-bottom:1px dashed rgba(255,255,255,0.05);font-size:13px}
+a{color:#0b9bd7}
+.up{color:var(--good)}
+.down{color:var(--bad)}
+</style>
+</head>
+<body>
+<div class="header">
+  <h1 class="h1">WebCraft Fleet</h1>
+  <div class="small" id="summary">-</div>
+</div>
+<div style="padding:12px">
+  <table>
+    <thead><tr><th>Server</th><th>State</th><th>Players</th><th>Task</th><th>Startup</th><th></th></tr></thead>
+    <tbody id="rows"></tbody>
+  </table>
+</div>
+<script>
+async function refresh(){
+  try {
+    const j = await (await fetch('/fleet/status')).json();
+    const rows = document.getElementById('rows');
+    rows.innerHTML = '';
+    let up = 0, players = 0;
+    for(const s of j.servers){
+      const tr = document.createElement('tr');
+      const cells = [s.name, s.state + (s.attached ? ' (attached)' : ''),
+                     s.players.length ? s.players.length + ': ' + s.players.join(', ') : '0',
+                     (s.task || 'idle') + (s.progress ? ' (' + s.progress + ')' : ''),
+                     s.startup_secs ? s.startup_secs + 's' : '-'];
+      cells.forEach((text, i) => {
+        const td = document.createElement('td'); td.textContent = text;
+        if(i === 1) td.className = s.running ? 'up' : 'down';
+        tr.appendChild(td);
+      });
+      const links = document.createElement('td');
+      links.innerHTML = '<a target="_blank">chat</a> &middot; <a target="_blank">admin</a>';
+      links.children[0].href = s.base + '/';
+      links.children[1].href = s.base + '/admin';
+      tr.appendChild(links);
+      rows.appendChild(tr);
+      if(s.running) up++;
+      players += s.players.length;
+    }
+    document.getElementById('summary').textContent = up + ' of ' + j.servers.length + ' servers running, ' + players + ' players online';
+  } catch(e) { /* keep the last table */ }
 }
+refresh();
+setInterval(refresh, 3000);
 </script>
 </body>
 </html>
@@ -415,23 +1941,18 @@ async function updateLogs(){
 # -----------------------------
 # Geyser Update Logic
 # -----------------------------
-def do_geyser_update_task():
-    if not start_task("geyser_update"): return
-    print("[GEYSER] Starting Geyser update process...")
+def do_geyser_update_task(inst):
+    if not inst.start_task("geyser_update"): return
+    print(f"[GEYSER] Starting Geyser update process for {inst.name}...")
     try:
         # 1. Stop Server
         print("[GEYSER] Stopping server for update...")
-        send_server_cmd("/stop")
-        for _ in range(80):
-            if not server_process or server_process.poll() is not None: break
-            time.sleep(0.5)
-        if server_process and server_process.poll() is None:
-            server_process.kill()
+        stop_server(inst)
 
         # 2. Delete old jar
-        print(f"[GEYSER] Deleting old jar: {GEYSER_JAR_PATH}")
-        if os.path.exists(GEYSER_JAR_PATH):
-            os.remove(GEYSER_JAR_PATH)
+        print(f"[GEYSER] Deleting old jar: {inst.geyser_jar_path}")
+        if os.path.exists(inst.geyser_jar_path):
+            os.remove(inst.geyser_jar_path)
         else:
             print("[GEYSER] Old jar not found, continuing with download.")
 
@@ -440,116 +1961,941 @@ def do_geyser_update_task():
         response = requests.get(GEYSER_DOWNLOAD_URL, stream=True)
         response.raise_for_status() # Raise an exception for bad status codes
 
-        with open(GEYSER_JAR_PATH, 'wb') as f:
+        with open(inst.geyser_jar_path, 'wb') as f:
             for chunk in response.iter_content(chunk_size=8192):
                 f.write(chunk)
         
-        print(f"[GEYSER] Download complete. New jar saved to: {GEYSER_JAR_PATH}")
+        print(f"[GEYSER] Download complete. New jar saved to: {inst.geyser_jar_path}")
 
     except Exception as e:
         print("[GEYSER] Error during update:", e)
     finally:
         # 4. Restart Server
         print("[GEYSER] Restarting server.")
-        start_server()
-        finish_task()
+        start_server(inst, for_task=True)
+        inst.finish_task()
+
+# -----------------------------
+# Console line classifier (NEW)
+# -----------------------------
+class LineClassifier:
+    # One pass per console line. Most lines are chunk/mod noise, so a few
+    # literal `in` checks reject them before any regex runs; survivors go
+    # through a single combined pattern whose outer named group (m.lastgroup)
+    # says which rule hit. Inner capture groups must be unique across rules,
+    # so prefix them with the rule name (chat_user, join_user, ...). Console
+    # lines are matched on their parsed message, without the clock/thread/
+    # source prefix, so rules anchored with ^ work for every log layout and
+    # a player can't fake one from chat.
+    def __init__(self):
+        self.rules = []  # (name, literal, pattern)
+        self.handlers = {}
+        self.literals = ()
+        self.combined = None
+
+    def register(self, name, literal, pattern, handler):
+        # Rules registered first win when two match at the same position
+        self.rules.append((name, literal, pattern))
+        self.handlers[name] = handler
+        self.literals = tuple(dict.fromkeys(lit for _, lit, _ in self.rules))
+        self.combined = re.compile("|".join(f"(?P<{n}>{p})" for n, _, p in self.rules))
+
+    def classify(self, line):
+        for lit in self.literals:
+            if lit in line:
+                break
+        else:
+            return None, None
+        m = self.combined.search(line)
+        if not m:
+            return None, None
+        return m.lastgroup, m
+
+    def dispatch(self, line, handle):
+        # Handlers get the ServerProcess the line came from, and its .inst
+        name, m = self.classify(line)
+        if name:
+            LINE_MATCHES.inc(handle.inst.name, name)
+            self.handlers[name](handle, m)
+        return name
 
 # -----------------------------
 # Server control
 # -----------------------------
-def start_server():
-    global server_process
-    # Check if any task (including geyser_update) is running
-    if is_task_running() and current_task != "restart": # Allow restart task to call start_server
-        return
-    if server_process and server_process.poll() is None:
-        return
-    print("[SERVER] Starting Minecraft server...")
-    server_process = subprocess.Popen(
-        START_CMD,
-        cwd=MINECRAFT_DIR,
-        stdin=subprocess.PIPE,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.STDOUT,
-        text=True,
-        bufsize=1
-    )
-    threading.Thread(target=read_server_output, daemon=True).start()
+# NEW: The JVM is driven from one asyncio loop thread. stdout is read in big
+# binary chunks and split/decoded per batch, and EOF wakes the reader at once
+# instead of readline() + sleep polling.
+READ_CHUNK = 256 * 1024
+CONSOLE_ENCODING = locale.getpreferredencoding(False)  # what text=True used
 
-def read_server_output():
-    global server_output_buffer
-    
-    chat_pat = re.compile(r"\[.*?\]: <([^>]+)> (.*)")
-    join_pat = re.compile(r"\[.*?\]: ([\.\w\-\u00C0-\u017F]+) joined the game")
-    leave_pat = re.compile(r"\[.*?\]: ([\.\w\-\u00C0-\u017F]+) left the game")
+supervisor_loop = asyncio.new_event_loop()
+threading.Thread(target=supervisor_loop.run_forever, name="supervisor", daemon=True).start()
 
-    while True:
-        if not server_process or server_process.poll() is not None:
-            break
-        try:
-            line = server_process.stdout.readline()
-            if not line:
-                time.sleep(0.1)
-                continue
-            line = line.rstrip()
-            if not line:
-                continue
+# NEW: stdin is owned by a single writer per process. Callers enqueue and get a
+# future; the writer takes everything pending and sends it with one write +
+# drain, so commands never interleave and a join storm costs one flush.
+STDIN_QUEUE_MAX = 1000
+STDIN_DRAIN_TIMEOUT = 5
 
-            server_output_buffer.append(line)
-            if len(server_output_buffer) > SERVER_OUTPUT_MAX:
-                server_output_buffer = server_output_buffer[-SERVER_OUTPUT_MAX:]
-
-            print(line)
-
-            # NEW: Geyser update detection
-            if GEYSER_UPDATE_PATTERN.search(line):
-                print("[GEYSER DETECTED] Triggering automatic update...")
-                threading.Thread(target=do_geyser_update_task, daemon=True).start()
-                # Do not process further log actions for this line
-
-            c = chat_pat.search(line)
-            j = join_pat.search(line)
-            l = leave_pat.search(line)
-            if c:
-                user, msg = c.groups()
-                players_online.add(user)
-                chat_log.append(f"<{user}> {msg}")
-            elif j:
-                user = j.group(1)
-                players_online.add(user)
-                chat_log.append(f"Joined: {user}")
-                # NEW: Run /replay start command for the joining player
-                cmd_to_send = f"replay start players {user}"
-                send_server_cmd(cmd_to_send)
-                print(f"[ACTION] Ran command on join: {cmd_to_send}")
-            elif l:
-                user = l.group(1)
-                players_online.discard(user)
-                chat_log.append(f"Left: {user}")
-
-            if len(chat_log) > MAX_CHAT_LINES:
-                chat_log[:] = chat_log[-MAX_CHAT_LINES:]
+class CommandWriter:
+    def __init__(self, stdin, server=DEFAULT_SERVER, on_flush=None):
+        self.stdin = stdin
+        self.server = server  # metrics label
+        self.on_flush = on_flush  # called after each batch, so /admin/status shows new counters
+        self.lock = threading.Lock()
+        self.pending = collections.deque()  # (data, future, queued_at)
+        self.wake = asyncio.Event()
+        self.closed = False
+        self.sent = 0
+        self.batches = 0
+        self.failures = 0
+        self.rejected = 0
+        self.last_latency = 0.0
+        self.max_latency = 0.0
 
-        except Exception as e:
-            print("read_server_output error:", e)
-            break
+    def submit(self, data):
+        # Safe from any thread, including the loop itself
+        fut = concurrent.futures.Future()
+        with self.lock:
+            if self.closed:
+                fut.set_exception(BrokenPipeError("server process has exited"))
+                return fut
+            if len(self.pending) >= STDIN_QUEUE_MAX:
+                self.rejected += 1
+                STDIN_REJECTED.inc(self.server)
+                fut.set_exception(RuntimeError("stdin queue full, server is not reading commands"))
+                return fut
+            self.pending.append((data, fut, time.perf_counter()))
+            first = len(self.pending) == 1
+        if first:
+            supervisor_loop.call_soon_threadsafe(self.wake.set)
+        return fut
 
-def send_server_cmd(cmd):
-    try:
-        if server_process and server_process.poll() is None:
-            # Strip leading forward slash if present, as console commands often don't need it
-            cmd = cmd.lstrip("/")
-            server_process.stdin.write(cmd + "\n")
-            server_process.stdin.flush()
-            return True
-    except Exception as e:
-        print("send_server_cmd error:", e)
-    return False
+    async def run(self):
+        while True:
+            await self.wake.wait()
+            self.wake.clear()
+            with self.lock:
+                batch = list(self.pending)
+                self.pending.clear()
+                closed = self.closed
+            if batch:
+                await self._write(batch)
+            if closed:
+                return
+
+    async def _write(self, batch):
+        try:
+            self.stdin.write(b"".join(data for data, _, _ in batch))
+            await asyncio.wait_for(self.stdin.drain(), STDIN_DRAIN_TIMEOUT)
+        except Exception as e:
+            if isinstance(e, asyncio.TimeoutError):
+                e = TimeoutError(f"stdin not drained within {STDIN_DRAIN_TIMEOUT}s")
+            self.failures += len(batch)
+            STDIN_FAILURES.inc(self.server, amount=len(batch))
+            for _, fut, _ in batch:
+                fut.set_exception(e)
+            if self.on_flush:
+                self.on_flush()
+            return
+        now = time.perf_counter()
+        self.batches += 1
+        self.sent += len(batch)
+        for _, fut, queued_at in batch:
+            self.last_latency = now - queued_at
+            self.max_latency = max(self.max_latency, self.last_latency)
+            STDIN_SECONDS.observe(self.last_latency, self.server)
+            fut.set_result(True)
+        if self.on_flush:
+            self.on_flush()
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            leftover = list(self.pending)
+            self.pending.clear()
+        for _, fut, _ in leftover:
+            fut.set_exception(BrokenPipeError("server process has exited"))
+        supervisor_loop.call_soon_threadsafe(self.wake.set)
+
+    def stats(self):
+        return {
+            "queue_depth": len(self.pending),
+            "sent": self.sent,
+            "batches": self.batches,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "last_latency_ms": round(self.last_latency * 1000, 2),
+            "max_latency_ms": round(self.max_latency * 1000, 2)
+        }
+
+# NEW: Lifecycle states, in order. Tasks block on the exact transition
+# (wait_for) instead of sleep-polling poll().
+SERVER_STATES = ("starting", "ready", "stopping", "exited")
+STOP_TIMEOUT = 40
+server_exits = queue.Queue()  # handles whose process has exited, for monitor_server_crash (all servers)
+
+class ServerProcess:
+    # Thread-safe handle on the asyncio child. Mirrors the Popen calls the
+    # rest of the wrapper makes and hops onto the loop for anything that
+    # touches the transport. Also the base of AttachedServer, where proc is
+    # a detached Popen (no stdin) or None.
+    def __init__(self, proc, inst):
+        self.proc = proc
+        self.pid = proc.pid if proc else None
+        self.inst = inst
+        self.reader = None
+        self.writer = CommandWriter(proc.stdin, inst.name, inst.bump) if proc and proc.stdin else None
+        self.writer_task = None
+        self.crashes = CrashTracker(self)
+        self.state = "starting"
+        self.reached = {"starting"}
+        self.state_cond = threading.Condition()
+        self.stop_requested = False
+        self.started_at = time.time()
+        self.ready_secs = None
+        self.saved = threading.Event()  # set by the "Saved the game" line
+        self.last_record = None  # previous console line, for continuation lines
+
+    def set_state(self, state):
+        # States only move forward; a late "ready" after "stopping" is ignored
+        with self.state_cond:
+            if SERVER_STATES.index(state) <= SERVER_STATES.index(self.state):
+                return
+            self.state = state
+            self.reached.add(state)
+            self.state_cond.notify_all()
+        print(f"[SERVER] {self.inst.name} state: {state}")
+        self.inst.events.publish("server", {"running": state != "exited", "state": state})
+        self.inst.bump()
+
+    def wait_for(self, state, timeout=None):
+        # True once `state` has been reached; False on timeout, or if the
+        # process exited without ever getting there.
+        with self.state_cond:
+            self.state_cond.wait_for(lambda: state in self.reached or "exited" in self.reached, timeout)
+            return state in self.reached
+
+    def poll(self):
+        return self.proc.returncode
+
+    def kill(self):
+        supervisor_loop.call_soon_threadsafe(self._signal, "kill")
+
+    def terminate(self):
+        supervisor_loop.call_soon_threadsafe(self._signal, "terminate")
+
+    def _signal(self, how):
+        try:
+            getattr(self.proc, how)()
+        except ProcessLookupError:
+            pass
+
+    def write_line(self, text):
+        # Returns a concurrent future that resolves once the line is flushed
+        return self.writer.submit((text + "\n").encode(CONSOLE_ENCODING, "replace"))
+
+def start_server(inst, for_task=False):
+    # Check if any task (including geyser_update) is running. Tasks pass
+    # for_task=True to bring the server back up from inside their own slot.
+    if inst.is_task_running() and not for_task:
+        return
+    if inst.running():
+        return
+    if not inst.jar:
+        print(f"[SERVER] No .jar found in {inst.minecraft_dir}, not starting {inst.name}")
+        return
+    if inst.attach:
+        inst.server_process = attach_server(inst)
+    else:
+        print(f"[SERVER] Starting Minecraft server {inst.name}...")
+        inst.server_process = asyncio.run_coroutine_threadsafe(spawn_server(inst), supervisor_loop).result()
+    inst.bump()
+
+def request_stop(inst):
+    # Marks the stop as intentional (so the exit is never treated as a crash)
+    # and sends /stop. Returns the handle to wait on, or None if not running.
+    proc = inst.server_process
+    if not proc or proc.poll() is not None:
+        return None
+    proc.stop_requested = True
+    proc.set_state("stopping")
+    send_server_cmd(inst, "/stop")
+    return proc
+
+def stop_server(inst, timeout=STOP_TIMEOUT):
+    # Stops the server and returns as soon as the JVM has actually exited,
+    # killing it if it has not within `timeout` seconds.
+    proc = request_stop(inst)
+    if not proc:
+        return
+    t = time.time()
+    if proc.wait_for("exited", timeout):
+        print(f"[SERVER] Stopped in {time.time() - t:.1f}s")
+        return
+    print(f"[SERVER] Did not stop within {timeout}s, killing")
+    proc.kill()
+    proc.wait_for("exited", 10)
+
+async def spawn_server(inst):
+    proc = await asyncio.create_subprocess_exec(
+        *inst.start_cmd,
+        cwd=inst.minecraft_dir,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        limit=READ_CHUNK
+    )
+    inst.events.publish("server", {"running": True, "state": "starting"})
+    handle = ServerProcess(proc, inst)
+    handle.writer_task = asyncio.create_task(handle.writer.run())
+    handle.reader = asyncio.create_task(read_server_output(handle))
+    return handle
+
+async def read_server_output(handle):
+    proc = handle.proc
+    pending = b""
+    try:
+        while True:
+            chunk = await proc.stdout.read(READ_CHUNK)
+            if not chunk:
+                break
+            pending += chunk
+            cut = pending.rfind(b"\n")
+            if cut < 0:
+                continue
+            ingest_lines(handle, pending[:cut].decode(CONSOLE_ENCODING, "replace"))
+            pending = pending[cut + 1:]
+        if pending:
+            ingest_lines(handle, pending.decode(CONSOLE_ENCODING, "replace"))
+    except Exception as e:
+        print("read_server_output error:", e)
+    await proc.wait()
+    handle.writer.close()
+    handle.set_state("exited")
+    server_exits.put(handle)
+
+def ingest_lines(handle, text):
+    lines = [line for line in (l.rstrip() for l in text.split("\n")) if line]
+    if not lines:
+        return
+    inst = handle.inst
+    if len(servers) > 1:
+        print("\n".join(f"[{inst.name}] {line}" for line in lines))
+    else:
+        print("\n".join(lines))
+    t = time.perf_counter()
+    for line in lines:
+        record = handle.last_record = parse_log_line(line, handle.last_record)
+        inst.append_output_line(record)
+        console_index.add(line, record.level_name, inst.name)
+        try:
+            kind = line_classifier.dispatch(record.message, handle)
+        except Exception as e:
+            kind = None
+            print("line handler error:", e)
+        handle.crashes.feed(line, kind)
+    inst.last_output_at = time.time()
+    inst.bump()  # once per batch, after the handlers, so cached replies see the whole batch
+    # One observation per batch keeps the timing off the per-line path
+    LINES_INGESTED.inc(inst.name, amount=len(lines))
+    LINE_SECONDS.observe((time.perf_counter() - t) / len(lines), inst.name, count=len(lines))
+
+# Console line handlers, dispatched by line_classifier
+def on_chat(handle, m):
+    inst = handle.inst
+    user, msg = m.group("chat_user"), m.group("chat_msg")
+    if user not in inst.players_online:
+        inst.players_online.add(user)
+        inst.mark_players_changed(publish=True)
+    inst.publish_chat(f"<{user}> {msg}", user)
+
+def on_join(handle, m):
+    inst = handle.inst
+    user = m.group("join_user")
+    inst.players_online.add(user)
+    inst.publish_chat(f"Joined: {user}", user, "join")
+    inst.mark_players_changed()
+    inst.events.publish("join", {"player": user, "players": sorted(inst.players_online)})
+    inst.perf.mark("join", user)
+    # NEW: Run /replay start command for the joining player
+    cmd_to_send = f"replay start players {user}"
+    send_server_cmd(inst, cmd_to_send)
+    print(f"[ACTION] Ran command on join: {cmd_to_send}")
+
+def on_leave(handle, m):
+    inst = handle.inst
+    user = m.group("leave_user")
+    inst.players_online.discard(user)
+    inst.publish_chat(f"Left: {user}", user, "leave")
+    inst.mark_players_changed()
+    inst.events.publish("leave", {"player": user, "players": sorted(inst.players_online)})
+    inst.perf.mark("leave", user)
+
+def on_ready(handle, m):
+    handle.ready_secs = float(m.group("ready_secs"))
+    handle.set_state("ready")
+    handle.inst.perf.record("startup_s", handle.ready_secs)
+    handle.inst.perf.mark("ready", f"Done ({m.group('ready_secs')}s)")
+
+# TPS/MSPT readings. Vanilla and Forge only give MSPT or both; TPS is then
+# derived as 1000/MSPT capped at 20, MSPT from TPS the other way round.
+def record_tick_stats(inst, tps=None, mspt=None):
+    if tps is None:
+        tps = min(20.0, 1000.0 / mspt) if mspt else 20.0
+    inst.perf.record("tps", tps)
+    inst.perf.record("mspt", mspt if mspt is not None else 1000.0 / max(tps, 0.01))
+
+def on_lag(handle, m):
+    inst = handle.inst
+    inst.perf.record("lag_ms", int(m.group("lag_ms")))
+    inst.events.publish("lag", {"ms": int(m.group("lag_ms")), "ticks": int(m.group("lag_ticks"))})
+
+def on_tick_query(handle, m):
+    record_tick_stats(handle.inst, mspt=float(m.group("tick_mspt")))
+
+def on_paper_tps(handle, m):
+    record_tick_stats(handle.inst, tps=float(m.group("paper_tps_value")))
+
+def on_forge_tps(handle, m):
+    record_tick_stats(handle.inst, float(m.group("forge_tps_tps")), float(m.group("forge_tps_mspt")))
+
+def on_saved(handle, m):
+    handle.saved.set()
+
+def on_stopping(handle, m):
+    handle.set_state("stopping")
+
+def on_geyser_update(handle, m):
+    print(f"[GEYSER DETECTED] Triggering automatic update of {handle.inst.name}...")
+    threading.Thread(target=do_geyser_update_task, args=(handle.inst,), daemon=True).start()
+
+PLAYER_NAME = r"[\.\w\-\u00C0-\u017F]+"
+
+line_classifier = LineClassifier()
+line_classifier.register("chat", "<", r"^<(?P<chat_user>[^>]+)> (?P<chat_msg>.*)", on_chat)
+line_classifier.register("join", " joined the game", rf"^(?P<join_user>{PLAYER_NAME}) joined the game", on_join)
+line_classifier.register("leave", " left the game", rf"^(?P<leave_user>{PLAYER_NAME}) left the game", on_leave)
+line_classifier.register("geyser_update", "Geyser", GEYSER_UPDATE_PATTERN.pattern, on_geyser_update)
+line_classifier.register("ready", "Done (", r"^Done \((?P<ready_secs>[\d.]+)s\)!", on_ready)
+line_classifier.register("saved", "Saved the game", r"^(?:\[Rcon: )?Saved the game", on_saved)
+line_classifier.register("stopping", "Stopping server", r"^Stopping server", on_stopping)
+
+# NEW: Perf rules also run over RCON replies to the probe, which never reach the console
+perf_classifier = LineClassifier()
+for _classifier in (line_classifier, perf_classifier):
+    _classifier.register("lag", "Can't keep up",
+                         r"Can't keep up!.*?Running (?P<lag_ms>\d+)ms or (?P<lag_ticks>\d+) ticks behind", on_lag)
+    _classifier.register("tick_query", "time per tick", r"Average time per tick: (?P<tick_mspt>[\d.]+)ms", on_tick_query)
+    _classifier.register("paper_tps", "TPS from last",
+                         r"TPS from last 1m, 5m, 15m: (?:\u00a7.|\*)*(?P<paper_tps_value>[\d.]+)", on_paper_tps)
+    _classifier.register("forge_tps", "Mean tick time",
+                         r"Overall: Mean tick time: (?P<forge_tps_mspt>[\d.]+) ms\. Mean TPS: (?P<forge_tps_tps>[\d.]+)", on_forge_tps)
+
+def send_server_cmd(inst, cmd, wait=False):
+    # Sends cmd over RCON when it is up, otherwise queues it for the stdin
+    # writer. wait=True blocks until it has been answered (RCON) or flushed to
+    # the JVM (stdin); never use it from the supervisor loop itself.
+    return run_server_cmd(inst, cmd, wait)[0]
+
+def run_server_cmd(inst, cmd, wait=True):
+    # Returns (sent, reply, transport). Only RCON has a reply; over stdin the
+    # output just shows up in the console log.
+    proc = inst.server_process
+    rcon = inst.rcon
+    try:
+        if proc and proc.poll() is None:
+            # Strip leading forward slash if present, as console commands often don't need it
+            cmd = cmd.lstrip("/")
+            if rcon.usable():
+                fut = rcon.submit(cmd)
+                if not wait:
+                    fut.add_done_callback(lambda f: rcon_fallback(f, proc, cmd))
+                    return True, None, "rcon"
+                try:
+                    return True, fut.result(RCON_TIMEOUT + 1), "rcon"
+                except RconError as e:
+                    print(f"[RCON] {e}, falling back to stdin")
+            fut = proc.write_line(cmd)
+            if wait or fut.done():
+                fut.result(timeout=STDIN_DRAIN_TIMEOUT + 1)
+            return True, None, "stdin"
+    except Exception as e:
+        print("send_server_cmd error:", e)
+    return False, None, None
+
+def rcon_fallback(fut, proc, cmd):
+    # Fire-and-forget commands whose RCON connection failed go to stdin.
+    # Timeouts are not resent: the server may still run them.
+    if not fut.cancelled() and isinstance(fut.exception(), RconError):
+        print(f"[RCON] {fut.exception()}, falling back to stdin")
+        proc.write_line(cmd)
+
+# -----------------------------
+# RCON client (NEW)
+# -----------------------------
+# Packets are <length, request id, type, body, 2 NULs>, little-endian. The
+# server answers one connection's packets in order, so several commands can
+# be in flight at once. Long replies arrive split over several packets; each
+# command is followed by a packet of an unknown type, and the server's answer
+# to that marks the end of the reply.
+RCON_AUTH_RESPONSE, RCON_COMMAND, RCON_LOGIN = 2, 2, 3
+RCON_END_MARKER = 100
+RCON_MAX_PACKET = 1024 * 1024
+
+class RconError(Exception):
+    # Connection or login problems; the command was not run
+    pass
+
+def read_server_properties(inst):
+    cache = inst.properties_cache
+    path = os.path.join(inst.minecraft_dir, "server.properties")
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return {}
+    if mtime != cache["mtime"]:
+        props = {}
+        with open(path, encoding="utf-8", errors="replace") as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith("#") and "=" in line:
+                    k, v = line.split("=", 1)
+                    props[k.strip()] = v.strip()
+        cache.update(mtime=mtime, props=props)
+    return cache["props"]
+
+def rcon_settings(inst):
+    # (host, port, password), or None when RCON is off
+    if not RCON_ENABLED:
+        return None
+    props = read_server_properties(inst)
+    if inst.rcon_port is None and props.get("enable-rcon", "false").lower() != "true":
+        return None
+    password = inst.rcon_password if inst.rcon_password is not None else props.get("rcon.password", "")
+    if not password:
+        return None  # the server refuses to start RCON without one
+    return RCON_HOST, inst.rcon_port or int(props.get("rcon.port", 25575)), password
+
+class RconConnection:
+    # One authenticated socket. Lives on supervisor_loop.
+    def __init__(self):
+        self.reader = self.writer = None
+        self.pending = {}  # command id -> (future, reply chunks)
+        self.ends = {}     # end marker id -> command id
+        self.last_id = 0
+        self.alive = False
+
+    def _next_id(self):
+        self.last_id = self.last_id % 0x7FFFFFFF + 1
+        return self.last_id
+
+    def _send(self, request_id, kind, body):
+        data = body.encode("utf-8")
+        self.writer.write(struct.pack("<iii", len(data) + 10, request_id, kind) + data + b"\0\0")
+
+    async def _read(self):
+        (length,) = struct.unpack("<i", await self.reader.readexactly(4))
+        if not 10 <= length <= RCON_MAX_PACKET:
+            raise RconError(f"bad RCON packet length {length}")
+        data = await self.reader.readexactly(length)
+        request_id, kind = struct.unpack("<ii", data[:8])
+        return request_id, kind, data[8:-2].decode("utf-8", "replace")
+
+    async def connect(self, host, port, password):
+        try:
+            self.reader, self.writer = await asyncio.wait_for(asyncio.open_connection(host, port), RCON_TIMEOUT)
+            login_id = self._next_id()
+            self._send(login_id, RCON_LOGIN, password)
+            await self.writer.drain()
+            while True:
+                request_id, kind, _ = await asyncio.wait_for(self._read(), RCON_TIMEOUT)
+                if request_id == -1:
+                    raise RconError("RCON password rejected")
+                if request_id == login_id and kind == RCON_AUTH_RESPONSE:
+                    break
+        except RconError:
+            self.close()
+            raise
+        except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError) as e:
+            self.close()
+            raise RconError(f"RCON connect to {host}:{port} failed: {e!r}")
+        self.alive = True
+        supervisor_loop.create_task(self._read_loop())
+
+    async def _read_loop(self):
+        try:
+            while True:
+                request_id, _, body = await self._read()
+                if request_id in self.pending:
+                    self.pending[request_id][1].append(body)
+                elif request_id in self.ends:
+                    fut, chunks = self.pending.pop(self.ends.pop(request_id))
+                    if not fut.done():
+                        fut.set_result("".join(chunks))
+        except Exception as e:
+            self.close(e)
+
+    async def command(self, cmd):
+        if not self.alive:
+            raise RconError("RCON connection closed")
+        fut = supervisor_loop.create_future()
+        request_id, end_id = self._next_id(), self._next_id()
+        self.pending[request_id] = (fut, [])
+        self.ends[end_id] = request_id
+        try:
+            self._send(request_id, RCON_COMMAND, cmd)
+            self._send(end_id, RCON_END_MARKER, "")
+            await self.writer.drain()
+            return await asyncio.wait_for(fut, RCON_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise  # a TimeoutError is an OSError, but the connection is fine
+        except OSError as e:
+            self.close(e)
+            raise RconError(f"RCON connection lost: {e!r}")
+        finally:
+            self.pending.pop(request_id, None)
+            self.ends.pop(end_id, None)
+
+    def close(self, reason=None):
+        self.alive = False
+        if self.writer:
+            self.writer.close()
+        for fut, _ in self.pending.values():
+            if not fut.done():
+                fut.set_exception(RconError(f"RCON connection lost: {reason!r}"))
+        self.pending.clear()
+        self.ends.clear()
+
+class RconPool:
+    # Up to `size` persistent connections. A command goes to the least busy
+    # one; a new connection is only opened when all of them have commands in
+    # flight. Dead connections are dropped and replaced on the next command.
+    def __init__(self, size, inst):
+        self.size = size
+        self.inst = inst
+        self.conns = []
+        self.connect_lock = asyncio.Lock()
+        self.retry_at = 0
+        self.sent = 0
+        self.failures = 0
+
+    def usable(self):
+        proc = self.inst.server_process
+        return (proc is not None and proc.state == "ready" and time.time() >= self.retry_at
+                and rcon_settings(self.inst) is not None)
+
+    def submit(self, cmd):
+        # Safe from any thread; returns a concurrent future with the reply text
+        return asyncio.run_coroutine_threadsafe(self._command(cmd), supervisor_loop)
+
+    async def _command(self, cmd):
+        t = time.perf_counter()
+        try:
+            reply = await (await self._pick()).command(cmd)
+        except Exception:
+            self.failures += 1
+            RCON_FAILURES.inc(self.inst.name)
+            self.inst.bump()
+            raise
+        self.sent += 1
+        RCON_SECONDS.observe(time.perf_counter() - t, self.inst.name)
+        self.inst.bump()  # counters in /admin/status
+        return reply
+
+    async def _pick(self):
+        async with self.connect_lock:
+            self.conns = [c for c in self.conns if c.alive]
+            best = min(self.conns, key=lambda c: len(c.pending), default=None)
+            if best is not None and (not best.pending or len(self.conns) >= self.size):
+                return best
+            settings = rcon_settings(self.inst)
+            if settings is None:
+                raise RconError("RCON is not enabled")
+            conn = RconConnection()
+            try:
+                await conn.connect(*settings)
+            except RconError as e:
+                self.retry_at = time.time() + RCON_RETRY
+                if best is not None:
+                    return best
+                raise
+            print(f"[RCON] Connected to {self.inst.name} at {settings[0]}:{settings[1]} ({len(self.conns) + 1} open)")
+            self.conns.append(conn)
+            return conn
+
+    def stats(self):
+        live = [c for c in self.conns if c.alive]
+        return {
+            "available": self.usable(),
+            "connections": len(live),
+            "in_flight": sum(len(c.pending) for c in live),
+            "sent": self.sent,
+            "failures": self.failures
+        }
 
 # -----------------------------
-# RAR helpers (Unchanged)
+# Attach mode (NEW)
 # -----------------------------
-def do_rar_archive(out_path, source_dir):
+class AttachedServer(ServerProcess):
+    # Same interface as ServerProcess for a server the wrapper does not own.
+    # `popen` is set only when this wrapper run launched it. Output comes
+    # from log_followers, commands go over RCON, and the exit is noticed by
+    # the launched process ending or, for one found already running, by its
+    # RCON port closing.
+    def __init__(self, inst, popen=None):
+        super().__init__(popen, inst)
+        self.detached = threading.Event()
+
+    def poll(self):
+        if self.state != "exited":
+            return None
+        return self.proc.poll() if self.proc else 0
+
+    def write_line(self, text):
+        return self.inst.rcon.submit(text)
+
+    def kill(self):
+        if self.proc:
+            self.proc.kill()
+        else:
+            print(f"[ATTACH] {self.inst.name} was not started by this wrapper, sending stop instead of killing")
+            self.write_line("stop")
+
+    def terminate(self):
+        if self.proc:
+            self.proc.terminate()
+        else:
+            self.write_line("stop")
+
+    def detach(self):
+        self.detached.set()
+
+    def exited(self):
+        self.set_state("exited")
+        server_exits.put(self)
+
+    async def watch(self):
+        # Liveness check, run on supervisor_loop so any number of attached
+        # servers share it. Two failed probes in a row count as an exit.
+        misses = 0
+        while True:
+            await asyncio.sleep(1 if self.proc else ATTACH_PROBE)
+            if self.detached.is_set():
+                return
+            if self.proc:
+                if self.proc.poll() is not None:
+                    return self.exited()
+                continue
+            if self.state == "starting":
+                continue  # RCON only opens once the world is loaded
+            misses = 0 if await rcon_port_open(self.inst) else misses + 1
+            if misses >= 2:
+                return self.exited()
+
+async def rcon_port_open(inst):
+    settings = rcon_settings(inst)
+    if settings is None:
+        return False
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(*settings[:2]), 2)
+    except (OSError, asyncio.TimeoutError):
+        return False
+    writer.close()
+    return True
+
+def attach_server(inst):
+    # Attaches to a running server, or launches one detached from the wrapper
+    if rcon_settings(inst) is None:
+        print(f"[ATTACH] RCON is not enabled in {inst.name}'s server.properties, attach mode cannot send commands")
+    # Positioned before launching: a new server rotates latest.log away and
+    # the follower then reads the fresh file from the top
+    follower = LogFollower(inst.latest_log, None, from_end=True)
+    if asyncio.run_coroutine_threadsafe(rcon_port_open(inst), supervisor_loop).result():
+        print(f"[ATTACH] {inst.name} already running, attaching")
+        handle = AttachedServer(inst)
+        handle.set_state("ready")
+        threading.Thread(target=refresh_players, args=(inst,), daemon=True).start()
+    else:
+        print(f"[SERVER] Starting Minecraft server {inst.name} (detached)...")
+        handle = AttachedServer(inst, launch_detached(inst))
+    follower.handle = handle
+    inst.events.publish("server", {"running": True, "state": handle.state})
+    log_followers.add(follower)
+    asyncio.run_coroutine_threadsafe(handle.watch(), supervisor_loop)
+    return handle
+
+def launch_detached(inst):
+    kwargs = {}
+    if os.name == "nt":
+        kwargs["creationflags"] = subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+        kwargs["start_new_session"] = True
+    return subprocess.Popen(inst.start_cmd, cwd=inst.minecraft_dir, stdin=subprocess.DEVNULL,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, **kwargs)
+
+PLAYER_LIST = re.compile(r"players online:\s*(.*)$")
+
+def refresh_players(inst):
+    # After attaching, the joins happened before we were watching
+    try:
+        reply = inst.rcon.submit("list").result(RCON_TIMEOUT + 1)
+    except Exception as e:
+        print(f"[ATTACH] Could not list players on {inst.name}: {e}")
+        return
+    m = PLAYER_LIST.search(reply)
+    if m:
+        inst.players_online.update(p.strip() for p in m.group(1).split(",") if p.strip())
+        inst.mark_players_changed(publish=True)
+
+IN_MODIFY, IN_MOVED_FROM, IN_MOVED_TO, IN_CREATE, IN_DELETE = 0x2, 0x40, 0x80, 0x100, 0x200
+INOTIFY_EVENT = struct.Struct("iIII")  # wd, mask, cookie, name length; the name follows
+
+def inotify_init():
+    # (libc, fd) for a non-blocking inotify instance, or None where inotify is unavailable
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        return (libc, fd) if fd >= 0 else None
+    except (OSError, AttributeError):
+        return None
+
+def inotify_add_watch(inotify, directory):
+    # Watch descriptor for `directory` (the same one again for a directory
+    # already watched), or -1
+    libc, fd = inotify
+    mask = IN_MODIFY | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    return libc.inotify_add_watch(fd, os.fsencode(directory), mask)
+
+class LogFollower:
+    # Tails a log4j latest.log. The file is reopened for every read instead of
+    # being held open, so the server can rotate it on Windows too. Rotation
+    # shows up as a new file identity or a size below our position, and
+    # reading restarts at the top of the new file.
+    def __init__(self, path, handle, from_end=False):
+        self.path = path
+        self.handle = handle
+        self.wd = -1  # inotify watch on the log's directory
+        self.identity = None
+        self.pos = 0
+        self.decoder = None
+        self.pending = ""
+        if from_end:
+            try:
+                st = os.stat(path)
+                self.identity, self.pos = (st.st_dev, st.st_ino), st.st_size
+            except OSError:
+                pass
+
+    def read_new(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return
+        identity = (st.st_dev, st.st_ino)
+        if identity != self.identity or st.st_size < self.pos:
+            if self.identity is not None:
+                print(f"[ATTACH] {self.handle.inst.name}: log rotated, following the new file")
+            self.identity, self.pos, self.pending = identity, 0, ""
+            self.decoder = None
+        if st.st_size <= self.pos:
+            return
+        if self.decoder is None:
+            self.decoder = codecs.getincrementaldecoder("utf-8")("replace")
+        with open(self.path, "rb") as f:
+            f.seek(self.pos)
+            while True:
+                chunk = f.read(READ_CHUNK)
+                if not chunk:
+                    break
+                self.pos += len(chunk)
+                text = self.pending + self.decoder.decode(chunk)
+                cut = text.rfind("\n")
+                if cut < 0:
+                    self.pending = text
+                    continue
+                self.pending = text[cut + 1:]
+                ingest_lines(self.handle, text[:cut])
+
+class LogFollowers:
+    # One thread tails latest.log for every attached server. A single inotify
+    # fd watches all their log directories and only followers whose directory
+    # changed are read; everything is also read once a second (or every
+    # ATTACH_POLL without inotify). A follower is dropped after its server
+    # exits or is detached.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.followers = []
+        self.inotify = None
+        self.watches = {}  # directory -> watch descriptor
+        self.thread = None
+
+    def add(self, follower):
+        directory = os.path.dirname(follower.path)
+        with self.lock:
+            if self.thread is None:
+                self.inotify = inotify_init()
+                self.thread = threading.Thread(target=self.run, name="log-followers", daemon=True)
+                self.thread.start()
+            if self.inotify and directory not in self.watches:
+                self.watches[directory] = inotify_add_watch(self.inotify, directory)
+            follower.wd = self.watches.get(directory, -1)
+            self.followers.append(follower)
+
+    def wait(self):
+        # Watch descriptors that fired, or None when everything should be read
+        if self.inotify is None:
+            time.sleep(ATTACH_POLL)
+            return None
+        fd = self.inotify[1]
+        if not select.select([fd], [], [], 1)[0]:
+            return None
+        woke = set()
+        try:
+            buf = os.read(fd, 64 * 1024)
+        except BlockingIOError:
+            return woke
+        offset = 0
+        while offset + INOTIFY_EVENT.size <= len(buf):
+            wd, _, _, length = INOTIFY_EVENT.unpack_from(buf, offset)
+            woke.add(wd)
+            offset += INOTIFY_EVENT.size + length
+        return woke
+
+    def run(self):
+        while True:
+            with self.lock:
+                followers = list(self.followers)
+            woke = self.wait()
+            for follower in followers:
+                handle = follower.handle
+                done = handle.detached.is_set() or handle.state == "exited"
+                try:
+                    if woke is None or follower.wd in woke or done:
+                        follower.read_new()
+                except Exception as e:
+                    print(f"[ATTACH] {handle.inst.name}: reading {follower.path} failed: {e}")
+                if done:
+                    with self.lock:
+                        self.followers.remove(follower)
+
+log_followers = LogFollowers()
+
+def reload_wrapper():
+    # Attach mode only: replace this process with a fresh copy of the script.
+    # The server keeps running and the new wrapper attaches to it.
+    print("[ATTACH] Reloading wrapper...")
+    chat_store.close()
+    console_index.close()
+    args = [a for a in sys.argv if a != "--attach"]
+    os.execv(sys.executable, [sys.executable] + args + ["--attach"])
+
+# -----------------------------
+# RAR helpers
+# -----------------------------
+def do_rar_archive(out_path, source_dir, progress=None):
     if not os.path.exists(WINRAR_PATH):
         raise FileNotFoundError("WinRAR not found!")
     # NOTE: Changed `os.path.join(source_dir, "*")` to just `source_dir` 
@@ -569,94 +2915,554 @@ def extract_rar_to_dir(rar_path, dest_dir):
         raise Exception(f"Extract failed: {result.stderr}")
 
 # -----------------------------
-# Tasks (Unchanged, except for calls to start_task and start_server)
+# Native archives (NEW)
 # -----------------------------
-def do_backup_task():
-    if not start_task("backup"): return
+# A standard tar stream cut into pieces (one per file, big files every
+# ARCHIVE_PIECE bytes). Each piece is compressed as an independent zstd frame
+# or gzip member on a thread pool (zlib/zstd release the GIL, and threads avoid
+# re-importing this module in worker processes), then the frames are written
+# in order. Concatenated frames are a valid .tar.zst / .tar.gz for any tool.
+def native_archive_ext():
+    return ".tar.zst" if zstd else ".tar.gz"
+
+def _compress(data):
+    if zstd:
+        return zstd.compress(data, ARCHIVE_LEVEL)
+    return gzip.compress(data, ARCHIVE_LEVEL, mtime=0)
+
+def _compress_piece(header, path, offset, length, pad):
+    data = header
+    if length:
+        with open(path, "rb") as f:
+            f.seek(offset)
+            chunk = f.read(length)
+        # The header already promised `length` bytes; keep the tar valid if the file shrank
+        data += chunk + bytes(length - len(chunk))
+    return _compress(data + bytes(pad))
+
+def _tar_pieces(source_dir):
+    pieces = []  # (header, path, offset, length, pad)
+    total = 0
+    for root, dirnames, filenames in os.walk(source_dir):
+        dirnames.sort()
+        for d in dirnames:
+            info = tarfile.TarInfo(os.path.relpath(os.path.join(root, d), source_dir).replace(os.sep, "/"))
+            info.type, info.mode, info.mtime = tarfile.DIRTYPE, 0o755, int(time.time())
+            pieces.append((info.tobuf(tarfile.PAX_FORMAT), None, 0, 0, 0))
+        for fn in sorted(filenames):
+            path = os.path.join(root, fn)
+            st = os.stat(path)
+            info = tarfile.TarInfo(os.path.relpath(path, source_dir).replace(os.sep, "/"))
+            info.size, info.mode, info.mtime = st.st_size, 0o644, int(st.st_mtime)
+            header = info.tobuf(tarfile.PAX_FORMAT)
+            if not st.st_size:
+                pieces.append((header, None, 0, 0, 0))
+            for offset in range(0, st.st_size, ARCHIVE_PIECE):
+                length = min(ARCHIVE_PIECE, st.st_size - offset)
+                pad = -st.st_size % tarfile.BLOCKSIZE if offset + length == st.st_size else 0
+                pieces.append((header if offset == 0 else b"", path, offset, length, pad))
+            total += st.st_size
+    pieces.append((bytes(2 * tarfile.BLOCKSIZE), None, 0, 0, 0))  # end-of-archive marker
+    return pieces, total
+
+def native_archive(out_path, source_dir, progress=None, workers=None):
+    pieces, total = _tar_pieces(source_dir)
+    workers = workers or ARCHIVE_WORKERS
+    tmp = out_path + ".tmp"
+    done = 0
+    inflight = collections.deque()
+    with open(tmp, "wb") as out, concurrent.futures.ThreadPoolExecutor(workers) as pool:
+        for i, piece in enumerate(pieces):
+            inflight.append((pool.submit(_compress_piece, *piece), piece[3]))
+            # Bounded window: keeps memory at ~2 pieces per worker, output stays in order
+            while inflight and (len(inflight) > workers * 2 or i == len(pieces) - 1):
+                fut, length = inflight.popleft()
+                out.write(fut.result())
+                done += length
+                if progress and total:
+                    progress(done, total)
+    os.replace(tmp, out_path)
+
+def _write_file(path, data, mtime):
+    with open(path, "wb") as f:
+        f.write(data)
+    os.utime(path, (mtime, mtime))
+
+def native_extract(path, dest_dir):
+    # Decompression is one sequential stream; file writes fan out to workers
+    if path.endswith(".zst") and not zstd:
+        raise Exception("This archive needs Python 3.14+ (compression.zstd) to extract")
+    dest_dir = os.path.abspath(dest_dir)
+    inflight = collections.deque()
+    with tarfile.open(path, "r:zst" if path.endswith(".zst") else "r:gz") as tf, \
+            concurrent.futures.ThreadPoolExecutor(EXTRACT_WORKERS) as pool:
+        for member in tf:
+            member = tarfile.data_filter(member, dest_dir)  # rejects absolute paths, "..", links out
+            target = os.path.join(dest_dir, member.name)
+            if member.isdir():
+                os.makedirs(target, exist_ok=True)
+            elif member.isfile():
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                inflight.append(pool.submit(_write_file, target, tf.extractfile(member).read(), member.mtime))
+                while len(inflight) > EXTRACT_WORKERS * 2:
+                    inflight.popleft().result()
+        for fut in inflight:
+            fut.result()
+
+ARCHIVE_BACKENDS = {
+    "native": {"exts": (".tar.zst", ".tar.gz"), "archive": native_archive, "extract": native_extract},
+    "winrar": {"exts": (".rar",), "archive": do_rar_archive, "extract": extract_rar_to_dir},
+}
+
+def archive_ext(backend):
+    return native_archive_ext() if backend == "native" else ARCHIVE_BACKENDS[backend]["exts"][0]
+
+def backend_for_archive(path):
+    for name, backend in ARCHIVE_BACKENDS.items():
+        if path.lower().endswith(backend["exts"]):
+            return backend
+    return None
+
+# -----------------------------
+# Incremental backups (NEW)
+# -----------------------------
+# Content-addressed store, one per server (CHUNK_STORE_DIR for main):
+#   blocks/ab/<hash>       raw data blocks, plus one "recipe" per file listing its block hashes
+#   manifests/<name>.json.gz  {relpath: [size, mtime_ns, recipe_hash]} for one backup
+# Region files are cut at chunk boundaries so a save only produces new blocks
+# for the chunks that changed; files whose size and mtime match the previous
+# manifest are not even read.
+REGION_SECTOR = 4096
+REGION_HEADER = 8192
+FIXED_BLOCK = 4 * 1024 * 1024
+
+def block_hash(data):
+    return hashlib.blake2b(data, digest_size=20).hexdigest()
+
+def block_path(store, h):
+    return os.path.join(store, "blocks", h[:2], h)
+
+def store_block(store, data, stats=None):
+    # stats["written"] counts the bytes of blocks that were new to the store
+    h = block_hash(data)
+    path = block_path(store, h)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        if stats is not None:
+            stats["written"] += len(data)
+    return h
+
+def load_block(store, h):
+    with open(block_path(store, h), "rb") as f:
+        return f.read()
+
+def region_segments(data):
+    # Anvil header: 1024 x (3-byte sector offset, 1-byte sector count), then
+    # 1024 timestamps. Cut at every chunk extent so the pieces concatenate
+    # back to the exact file, whatever padding or garbage sits between them.
+    if len(data) < REGION_HEADER:
+        return [data]
+    cuts = {0, REGION_HEADER, len(data)}
+    for i in range(1024):
+        entry = data[i * 4:i * 4 + 4]
+        offset = int.from_bytes(entry[:3], "big") * REGION_SECTOR
+        count = entry[3] * REGION_SECTOR
+        if offset >= REGION_HEADER and count and offset < len(data):
+            cuts.add(offset)
+            cuts.add(min(offset + count, len(data)))
+    cuts = sorted(cuts)
+    return [data[a:b] for a, b in zip(cuts, cuts[1:])]
+
+def store_file(store, path, stats=None):
+    # Returns the hash of the file's recipe (newline-separated block hashes)
+    blocks = []
+    with open(path, "rb") as f:
+        if path.endswith(".mca"):
+            blocks = [store_block(store, seg, stats) for seg in region_segments(f.read())]
+        else:
+            while True:
+                data = f.read(FIXED_BLOCK)
+                if not data:
+                    break
+                blocks.append(store_block(store, data, stats))
+    return store_block(store, "\n".join(blocks).encode(), stats)
+
+def manifest_dir(store):
+    return os.path.join(store, "manifests")
+
+def list_manifests(store):
+    # Oldest first
     try:
-        print("[BACKUP] Starting backup...")
-        send_server_cmd("/stop")
-        for _ in range(80):
-            if not server_process or server_process.poll() is not None: break
-            time.sleep(0.5)
-        if server_process and server_process.poll() is None:
-            server_process.kill()
-        
+        names = os.listdir(manifest_dir(store))
+    except FileNotFoundError:
+        return []
+    return sorted(n[:-len(".json.gz")] for n in names if n.endswith(".json.gz"))
+
+def load_manifest(store, name):
+    with gzip.open(os.path.join(manifest_dir(store), f"{name}.json.gz"), "rt", encoding="utf-8") as f:
+        return json.load(f)
+
+def unchanged_filter(store):
+    # For live snapshots: skip(rel, st) is true for files the latest manifest
+    # already has at the same size and mtime; their entries land in `carried`
+    # so the snapshot only has to copy what changed.
+    names = list_manifests(store)
+    previous = load_manifest(store, names[-1])["files"] if names else {}
+    carried = {}
+    def skip(rel, st):
+        prev = previous.get(rel)
+        if prev and prev[0] == st.st_size and prev[1] == st.st_mtime_ns:
+            carried[rel] = prev
+            return True
+        return False
+    return carried, skip
+
+def incremental_backup(store, source_dir, carried=None):
+    # Returns (manifest name, bytes of new blocks). `carried` holds entries for
+    # files left out of source_dir because they did not change.
+    names = list_manifests(store)
+    previous = load_manifest(store, names[-1])["files"] if names else {}
+    files, dirs = dict(carried or {}), []
+    new_files = 0
+    stats = {"written": 0}
+    for root, dirnames, filenames in os.walk(source_dir):
+        rel_root = os.path.relpath(root, source_dir)
+        if not dirnames and not filenames and rel_root != ".":
+            dirs.append(rel_root.replace(os.sep, "/"))
+        for fn in filenames:
+            path = os.path.join(root, fn)
+            rel = os.path.relpath(path, source_dir).replace(os.sep, "/")
+            st = os.stat(path)
+            prev = previous.get(rel)
+            if prev and prev[0] == st.st_size and prev[1] == st.st_mtime_ns:
+                files[rel] = prev
+                continue
+            files[rel] = [st.st_size, st.st_mtime_ns, store_file(store, path, stats)]
+            new_files += 1
+    # Microseconds keep back-to-back backups apart and still sort by time;
+    # the suffix loop makes sure an existing manifest is never replaced
+    base = name = datetime.datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    os.makedirs(manifest_dir(store), exist_ok=True)
+    path = os.path.join(manifest_dir(store), f"{name}.json.gz")
+    n = 0
+    while os.path.exists(path):
+        n += 1
+        name = f"{base}_{n}"
+        path = os.path.join(manifest_dir(store), f"{name}.json.gz")
+    tmp = path + ".tmp"
+    with gzip.open(tmp, "wt", encoding="utf-8") as f:
+        json.dump({"created": name, "source": os.path.basename(source_dir), "files": files, "dirs": dirs}, f)
+    os.replace(tmp, path)
+    print(f"[BACKUP] Manifest {name}: {len(files)} files, {new_files} changed, "
+          f"{stats['written'] / 1048576:.1f} MiB new")
+    return name, stats["written"]
+
+def restore_manifest(store, name, dest_dir):
+    manifest = load_manifest(store, name)
+    for rel in manifest["dirs"]:
+        os.makedirs(os.path.join(dest_dir, rel), exist_ok=True)
+    with concurrent.futures.ThreadPoolExecutor(EXTRACT_WORKERS) as pool:
+        futures = [pool.submit(_restore_file, store, dest_dir, rel, *entry) for rel, entry in manifest["files"].items()]
+        for fut in futures:
+            fut.result()
+
+def _restore_file(store, dest_dir, rel, size, mtime_ns, recipe):
+    path = os.path.join(dest_dir, rel)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        for h in load_block(store, recipe).decode().split("\n"):
+            if h:
+                f.write(load_block(store, h))
+    if os.path.getsize(path) != size:
+        raise Exception(f"Restored {rel} has the wrong size")
+    # Keep the recorded mtime so the next backup can skip the file again
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+def gc_chunk_store(store, keep=INCREMENTAL_KEEP):
+    # Drops all but the newest `keep` manifests, then deletes every block no
+    # remaining manifest references. Only run inside a task (no concurrent backup).
+    names = list_manifests(store)
+    for name in names[:-keep] if keep else []:
+        os.remove(os.path.join(manifest_dir(store), f"{name}.json.gz"))
+    live = set()
+    for name in list_manifests(store):
+        for _, _, recipe in load_manifest(store, name)["files"].values():
+            if recipe in live:
+                continue
+            live.add(recipe)
+            live.update(h for h in load_block(store, recipe).decode().split("\n") if h)
+    removed = freed = 0
+    blocks_root = os.path.join(store, "blocks")
+    for root, _, filenames in os.walk(blocks_root):
+        for fn in filenames:
+            if fn not in live:
+                path = os.path.join(root, fn)
+                freed += os.path.getsize(path)
+                os.remove(path)
+                removed += 1
+    print(f"[BACKUP] GC removed {removed} blocks ({freed // (1024 * 1024)} MiB)")
+    return removed
+
+# -----------------------------
+# Live snapshots (NEW)
+# -----------------------------
+FICLONE = 0x40049409
+reflink_supported = fcntl is not None
+
+def clone_file(src, dst):
+    # Copy-on-write clone where the filesystem can (btrfs, xfs), otherwise a
+    # real copy. No hardlinks: the server rewrites region files in place, so a
+    # hardlinked snapshot would change under the archiver after save-on.
+    global reflink_supported
+    if reflink_supported:
+        try:
+            with open(src, "rb") as fs, open(dst, "wb") as fd:
+                fcntl.ioctl(fd.fileno(), FICLONE, fs.fileno())
+            shutil.copystat(src, dst)
+            return
+        except OSError:
+            reflink_supported = False
+    shutil.copy2(src, dst)
+
+def snapshot_tree(src, dst, skip=None):
+    jobs = []
+    for root, _, filenames in os.walk(src):
+        rel_root = os.path.relpath(root, src)
+        target = os.path.join(dst, rel_root)
+        os.makedirs(target, exist_ok=True)
+        for fn in filenames:
+            if fn == "session.lock":  # held open by the server on Windows
+                continue
+            path = os.path.join(root, fn)
+            if skip and skip(os.path.normpath(os.path.join(rel_root, fn)).replace(os.sep, "/"), os.stat(path)):
+                continue
+            jobs.append((path, os.path.join(target, fn)))
+    with concurrent.futures.ThreadPoolExecutor(SNAPSHOT_WORKERS) as pool:
+        for fut in [pool.submit(clone_file, a, b) for a, b in jobs]:
+            fut.result()
+    return len(jobs)
+
+def take_live_snapshot(inst, world_dir, dest, skip=None):
+    # Saving stays off only for the flush + copy, never for the archiving
+    proc = inst.server_process
+    if not send_server_cmd(inst, "save-off", wait=True):
+        raise Exception("could not send save-off")
+    try:
+        proc.saved.clear()
+        sent, reply, _ = run_server_cmd(inst, "save-all flush")
+        if not sent:
+            raise Exception("could not send save-all flush")
+        # Over RCON the reply is the confirmation (the flush runs before it
+        # is sent); over stdin it is the "Saved the game" console line
+        if reply and "Saved the game" in reply:
+            proc.saved.set()
+        if not proc.saved.wait(SAVE_FLUSH_TIMEOUT):
+            raise Exception(f"server did not confirm save-all flush within {SAVE_FLUSH_TIMEOUT}s")
+        t = time.time()
+        count = snapshot_tree(world_dir, dest, skip)
+        print(f"[BACKUP] Snapshot of {count} files in {time.time() - t:.1f}s")
+    finally:
+        send_server_cmd(inst, "save-on")
+
+# -----------------------------
+# Staged restores (NEW)
+# -----------------------------
+def delete_later(path):
+    threading.Thread(target=shutil.rmtree, args=(path,), kwargs={"ignore_errors": True}, daemon=True).start()
+
+def cleanup_world_leftovers(inst):
+    # Staging/trash/snapshot dirs from a task that was interrupted by a wrapper restart
+    for name in os.listdir(inst.minecraft_dir):
+        if name.startswith((".world_staging_", ".world_trash_", ".world_snapshot_")):
+            delete_later(os.path.join(inst.minecraft_dir, name))
+
+def find_world_root(staging):
+    # Archives either hold the world's contents or a single folder with them
+    if os.path.isfile(os.path.join(staging, "level.dat")):
+        return staging
+    entries = os.listdir(staging)
+    if len(entries) == 1 and os.path.isfile(os.path.join(staging, entries[0], "level.dat")):
+        return os.path.join(staging, entries[0])
+    raise Exception("Restored data has no level.dat, refusing to swap it in")
+
+def stage_world(inst, fill):
+    # Runs fill(staging_dir) while the server keeps running, on the same
+    # filesystem as the world so the later swap is a plain rename.
+    cleanup_world_leftovers(inst)
+    staging = os.path.join(inst.minecraft_dir, f".world_staging_{uuid.uuid4().hex}")
+    os.makedirs(staging)
+    try:
+        inst.set_task_progress("extracting")
+        t = time.time()
+        fill(staging)
+        root = find_world_root(staging)
+        print(f"[RESTORE] Staged and verified in {time.time() - t:.1f}s")
+        return staging, root
+    except:
+        delete_later(staging)
+        raise
+
+def swap_world(inst, staging, root):
+    # The only part of a restore that needs the server down
+    world_dir = os.path.join(inst.minecraft_dir, "world")
+    previous = inst.previous_world_dir
+    inst.set_task_progress("swapping")
+    stop_server(inst)
+    t = time.time()
+    if os.path.exists(previous):
+        trash = os.path.join(inst.minecraft_dir, f".world_trash_{uuid.uuid4().hex}")
+        os.rename(previous, trash)
+        delete_later(trash)
+    if os.path.exists(world_dir):
+        os.rename(world_dir, previous)
+    try:
+        os.rename(root, world_dir)
+    except:
+        if os.path.exists(previous):
+            os.rename(previous, world_dir)
+        raise
+    if root != staging:
+        delete_later(staging)
+    print(f"[RESTORE] World swapped in {time.time() - t:.2f}s, previous world kept as {previous}")
+
+# -----------------------------
+# Tasks
+# -----------------------------
+def do_backup_task(inst):
+    if not inst.start_task("backup"): return
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    # Next to the world so the snapshot stays on its volume (reflinks, fast copies)
+    snapshot_root = os.path.join(inst.minecraft_dir, f".world_snapshot_{timestamp}")
+    try:
+        print(f"[BACKUP] Starting backup of {inst.name}...")
         # Backup only the world directory
-        world_dir = os.path.join(MINECRAFT_DIR, "world")
+        world_dir = os.path.join(inst.minecraft_dir, "world")
         if not os.path.isdir(world_dir): 
              print("[BACKUP] 'world' directory not found. Skipping.")
              return
-             
-        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        backup_file = os.path.join(BACKUP_DIR, f"ServerArchive_{timestamp}.rar")
+
+        world_content_dir = world_dir
+        carried = None
+        if HOT_BACKUPS and inst.running():
+            cleanup_world_leftovers(inst)
+            # Snapshot dir is named "world" too, so archives look the same as cold ones
+            world_content_dir = os.path.join(snapshot_root, "world")
+            skip = None
+            if BACKUP_MODE == "incremental":
+                # Only copy what changed since the last manifest while saving is off
+                carried, skip = unchanged_filter(inst.chunk_store_dir)
+            take_live_snapshot(inst, world_dir, world_content_dir, skip)
+        else:
+            stop_server(inst)
+
+        if BACKUP_MODE == "incremental":
+            name, written = incremental_backup(inst.chunk_store_dir, world_content_dir, carried)
+            record_backup_size(inst, "incremental", written)
+            gc_chunk_store(inst.chunk_store_dir)
+            print(f"[BACKUP] Done: manifest {name}")
+            return
+
+        backup_file = os.path.join(inst.backup_dir, f"ServerArchive_{timestamp}{archive_ext(ARCHIVE_BACKEND)}")
         
         # Do archive on the 'world' folder contents
-        world_content_dir = os.path.join(MINECRAFT_DIR, "world")
-        do_rar_archive(backup_file, world_content_dir)
-        print(f"[BACKUP] Done: {backup_file}")
+        t = time.time()
+        ARCHIVE_BACKENDS[ARCHIVE_BACKEND]["archive"](backup_file, world_content_dir, inst.report_progress)
+        record_backup_size(inst, ARCHIVE_BACKEND, os.path.getsize(backup_file))
+        print(f"[BACKUP] Done in {time.time() - t:.1f}s: {backup_file}")
     except Exception as e:
         print("[BACKUP] Error:", e)
     finally:
-        start_server()
-        finish_task()
+        shutil.rmtree(snapshot_root, ignore_errors=True)
+        start_server(inst, for_task=True)
+        inst.finish_task()
 
-def do_restore_task(rar_path):
+def record_backup_size(inst, mode, size):
+    BACKUP_BYTES.set(size, inst.name, mode)
+    BACKUP_BYTES_TOTAL.inc(inst.name, mode, amount=size)
+
+def do_restore_task(inst, rar_path):
     task_name = f"restore:{os.path.basename(rar_path)}"
-    if not start_task(task_name): return
-    try:
-        print(f"[RESTORE] Starting from {rar_path}")
-        send_server_cmd("/stop")
-        for _ in range(80):
-            if not server_process or server_process.poll() is not None: break
-            time.sleep(0.5)
-        if server_process and server_process.poll() is None:
-            server_process.kill()
-        world_dir = os.path.join(MINECRAFT_DIR, "world")
-        if os.path.exists(world_dir):
-            shutil.rmtree(world_dir)
-        os.makedirs(world_dir, exist_ok=True)
-        extract_rar_to_dir(rar_path, world_dir)
+    if not inst.start_task(task_name): return
+    try:
+        print(f"[RESTORE] Starting {inst.name} from {rar_path}")
+        extract = backend_for_archive(rar_path)["extract"]
+        swap_world(inst, *stage_world(inst, lambda staging: extract(rar_path, staging)))
         print("[RESTORE] Done")
     except Exception as e:
         print("[RESTORE] Error:", e)
     finally:
-        start_server()
+        start_server(inst, for_task=True)
         try: os.remove(rar_path)
         except: pass
-        finish_task()
+        inst.finish_task()
 
-def do_restart_task():
-    if not start_task("restart"): return
+def do_restore_manifest_task(inst, name):
+    if not inst.start_task(f"restore:{name}"): return
     try:
-        send_server_cmd("/stop")
-        for _ in range(80):
-            if not server_process or server_process.poll() is not None: break
-            time.sleep(0.5)
-        start_server()
+        print(f"[RESTORE] Starting {inst.name} from manifest {name}")
+        swap_world(inst, *stage_world(inst, lambda staging: restore_manifest(inst.chunk_store_dir, name, staging)))
+        print("[RESTORE] Done")
+    except Exception as e:
+        print("[RESTORE] Error:", e)
     finally:
-        finish_task()
+        start_server(inst, for_task=True)
+        inst.finish_task()
 
-def do_stop_task():
-    if not start_task("stop"): return
+def do_rollback_task(inst):
+    # Swaps world and world.previous back, i.e. undoes the last restore
+    if not inst.start_task("rollback"): return
     try:
-        send_server_cmd("/stop")
+        world_dir = os.path.join(inst.minecraft_dir, "world")
+        stop_server(inst)
+        tmp = os.path.join(inst.minecraft_dir, f".world_staging_{uuid.uuid4().hex}")
+        os.rename(world_dir, tmp)
+        try:
+            os.rename(inst.previous_world_dir, world_dir)
+        except:
+            os.rename(tmp, world_dir)
+            raise
+        os.rename(tmp, inst.previous_world_dir)
+        print(f"[RESTORE] Rolled {inst.name} back to the previous world")
+    except Exception as e:
+        print("[RESTORE] Rollback error:", e)
+    finally:
+        start_server(inst, for_task=True)
+        inst.finish_task()
+
+def do_restart_task(inst):
+    if not inst.start_task("restart"): return
+    try:
+        stop_server(inst)
+        start_server(inst, for_task=True)
     finally:
-        finish_task()
+        inst.finish_task()
 
-def do_kill_task():
-    if not start_task("kill"): return
+def do_stop_task(inst):
+    if not inst.start_task("stop"): return
     try:
-        if server_process and server_process.poll() is None:
-            server_process.kill()
+        request_stop(inst)
     finally:
-        finish_task()
+        inst.finish_task()
+
+def do_kill_task(inst):
+    if not inst.start_task("kill"): return
+    try:
+        proc = inst.server_process
+        if proc and proc.poll() is None:
+            proc.stop_requested = True
+            proc.kill()
+    finally:
+        inst.finish_task()
 
 # -----------------------------
 # Scheduled Tasks (NEW)
 # -----------------------------
 def scheduled_task_monitor():
-    global last_scheduled_backup
+    # One loop for every server
     while True:
         now = datetime.datetime.now()
         
@@ -665,41 +3471,558 @@ def scheduled_task_monitor():
         # now.hour == 12 is 12 PM.
         # now.minute == 45 is 45 minutes past the hour.
         if now.weekday() == 6 and now.hour == 12 and now.minute == 45:
-            # Prevent multiple backups within the same minute
-            if last_scheduled_backup is None or (now - last_scheduled_backup).total_seconds() > 60:
-                print("[SCHEDULE] Starting Sunday 12:45 PM backup...")
-                if not is_task_running():
-                    threading.Thread(target=do_backup_task, daemon=True).start()
-                    last_scheduled_backup = now
+            for inst in list(servers.values()):
+                # Prevent multiple backups within the same minute
+                last = inst.last_scheduled_backup
+                if last is not None and (now - last).total_seconds() <= 60:
+                    continue
+                print(f"[SCHEDULE] Starting Sunday 12:45 PM backup of {inst.name}...")
+                if not inst.is_task_running():
+                    threading.Thread(target=do_backup_task, args=(inst,), daemon=True).start()
+                    inst.last_scheduled_backup = now
                 else:
-                    print(f"[SCHEDULE] Skipping backup, task '{current_task}' is already running.")
+                    print(f"[SCHEDULE] Skipping backup, task '{inst.current_task}' is already running.")
         
         # Check every 20 seconds, allowing for time drift near the target minute
         time.sleep(20)
 
+def perf_probe_monitor():
+    # One loop for every server; only ready servers without a task are asked,
+    # so the probe never lands in the middle of a stop or a save-off window
+    while PERF_PROBE_CMD:
+        time.sleep(PERF_PROBE_INTERVAL)
+        for inst in list(servers.values()):
+            proc = inst.server_process
+            if not proc or proc.poll() is not None or proc.state != "ready" or inst.is_task_running():
+                continue
+            sent, reply, _ = run_server_cmd(inst, PERF_PROBE_CMD)
+            # Over stdin the answer shows up in the console and is parsed there
+            for line in (reply or "").splitlines():
+                try:
+                    perf_classifier.dispatch(line, proc)
+                except Exception as e:
+                    print("perf probe error:", e)
+
 # -----------------------------
-# Crash monitor (Unchanged)
+# Crash monitor
 # -----------------------------
+class CrashTracker:
+    # Per-run crash state, fed every console line at ingest time. The first
+    # indicator is kept with CRASH_CONTEXT lines on either side, so by the time
+    # the process exits the backup decision is already made. Only lines after
+    # the server is ready count, and never ones carrying player text (mod
+    # banners and config dumps at startup, a player typing "fatal").
+    def __init__(self, handle):
+        self.handle = handle
+        self.inst = handle.inst
+        self.first = None
+        self.hits = 0
+        self._after = 0
+        self.run_start = self.inst.log_seq  # context never reaches into the previous run
+
+    def feed(self, line, kind=None):
+        # kind: what line_classifier made of the line
+        if self._after:
+            self.first["context"].append(line)
+            self._after -= 1
+        if kind in CRASH_SKIP_KINDS or "ready" not in self.handle.reached:
+            return
+        m = CRASH_MATCHER.search(line)
+        if not m:
+            return
+        inst = self.inst
+        self.hits += 1
+        CRASH_INDICATORS.inc(inst.name)
+        record = {
+            "time": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "signature": CRASH_PATTERNS[int(m.lastgroup[1:])].pattern,
+            "line": line
+        }
+        if self.first is None:
+            # The current line is already in server_output_buffer
+            before = inst.server_output_buffer.range(self.run_start, limit=CRASH_CONTEXT + 1)
+            record["context"] = [str(r) for _, r in before]
+            self.first = record
+            self._after = CRASH_CONTEXT
+        inst.crash_seq += 1
+        inst.crash_history.append(inst.crash_seq, record)
+
+    def is_crash(self):
+        return self.first is not None
+
 def monitor_server_crash():
-    global server_process
+    # Woken by read_server_output the moment a process exits; the crash
+    # decision was already made at ingest time by its CrashTracker. One
+    # thread serves every server.
     while True:
-        time.sleep(3)
-        if server_process and server_process.poll() is not None:
-            print(f"[MONITOR] Server stopped (code {server_process.poll()})")
-            recent = "\n".join(server_output_buffer[-80:])
-            is_crash = any(p.search(recent) for p in CRASH_PATTERNS)
-            if is_crash:
-                print("[MONITOR] CRASH DETECTED → Emergency backup")
-                if not is_task_running():
-                    threading.Thread(target=do_backup_task, daemon=True).start()
-                else:
-                    print(f"[MONITOR] Cannot start emergency backup, task '{current_task}' is already running.")
+        proc = server_exits.get()
+        inst = proc.inst
+        print(f"[MONITOR] Server {inst.name} stopped (code {proc.poll()})")
+        if proc.stop_requested:
+            print("[MONITOR] Requested shutdown — no backup")
+        elif proc.crashes.is_crash():
+            first = proc.crashes.first
+            print(f"[MONITOR] First crash indicator at {first['time']}: {first['line']}")
+            print("[MONITOR] CRASH DETECTED → Emergency backup")
+            if not inst.is_task_running():
+                threading.Thread(target=do_backup_task, args=(inst,), daemon=True).start()
+            else:
+                print(f"[MONITOR] Cannot start emergency backup, task '{inst.current_task}' is already running.")
+        else:
+            print("[MONITOR] Normal shutdown — no backup")
+        if inst.server_process is proc:
+            inst.server_process = None
+            inst.bump()
+
+# -----------------------------
+# Chunked uploads (NEW)
+# -----------------------------
+# An upload is <id>.part (preallocated to the final size) plus <id>.json with
+# the SHA-256 of every chunk received so far, so it survives dropped
+# connections and wrapper restarts. The finalize hash is the SHA-256 of the
+# concatenated raw chunk digests, which the browser can compute chunk by chunk.
+uploads_lock = threading.Lock()
+
+def upload_path(upload_id, ext):
+    return os.path.join(UPLOAD_TMP_DIR, f"{upload_id}{ext}")
+
+def load_upload(upload_id):
+    if not re.fullmatch(r"[0-9a-f]{32}", upload_id or ""):
+        return None
+    try:
+        with open(upload_path(upload_id, ".json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def save_upload(meta):
+    path = upload_path(meta["id"], ".json")
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(path + ".tmp", path)
+
+def drop_upload(upload_id):
+    for ext in (".json", ".part"):
+        try: os.remove(upload_path(upload_id, ext))
+        except FileNotFoundError: pass
+
+def upload_chunk_count(meta):
+    return (meta["size"] + meta["chunk_size"] - 1) // meta["chunk_size"]
+
+def find_or_create_upload(filename, size, key):
+    with uploads_lock:
+        now = time.time()
+        for fn in os.listdir(UPLOAD_TMP_DIR):
+            if not fn.endswith(".json"):
+                continue
+            meta = load_upload(fn[:-5])
+            if not meta:
+                continue
+            if now - meta["created"] > UPLOAD_TTL:
+                drop_upload(meta["id"])
+            elif key and meta["key"] == key and meta["size"] == size:
+                return meta
+        meta = {"id": uuid.uuid4().hex, "key": key, "filename": filename, "size": size,
+                "chunk_size": UPLOAD_CHUNK, "chunks": {}, "created": now}
+        with open(upload_path(meta["id"], ".part"), "wb") as f:
+            f.truncate(size)
+        save_upload(meta)
+        return meta
+
+def write_upload_chunk(meta, offset, stream, expected_hash):
+    # Streams one chunk straight into the preallocated file. Returns an error
+    # message, or None once the chunk is on disk and recorded.
+    size, chunk_size = meta["size"], meta["chunk_size"]
+    if offset < 0 or offset >= size or offset % chunk_size:
+        return "bad offset"
+    expected = min(chunk_size, size - offset)
+    index = str(offset // chunk_size)
+    digest = hashlib.sha256()
+    written = 0
+    error = None
+    with open(upload_path(meta["id"], ".part"), "r+b") as f:
+        f.seek(offset)
+        while True:
+            buf = stream.read(1024 * 1024)
+            if not buf:
+                break
+            written += len(buf)
+            if written > expected:
+                error = "chunk too large"
+                break
+            digest.update(buf)
+            f.write(buf)
+    if not error and written != expected:
+        error = f"incomplete chunk ({written} of {expected} bytes)"
+    if not error and expected_hash and expected_hash.lower() != digest.hexdigest():
+        error = "chunk hash mismatch"
+    with uploads_lock:
+        current = load_upload(meta["id"])
+        if not current:
+            return "upload no longer exists"
+        # A failed rewrite may have clobbered a chunk that was good before
+        if error:
+            current["chunks"].pop(index, None)
+        else:
+            current["chunks"][index] = digest.hexdigest()
+        save_upload(current)
+    return error
+
+def upload_digest(meta):
+    count = upload_chunk_count(meta)
+    return hashlib.sha256(b"".join(bytes.fromhex(meta["chunks"][str(i)]) for i in range(count))).hexdigest()
+
+# -----------------------------
+# WebSocket chat (NEW)
+# -----------------------------
+# RFC 6455 by hand on asyncio streams: one connection per guest carries chat
+# both ways. Everything runs on the supervisor loop, so an idle guest costs a
+# socket and a small queue instead of a thread.
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+WS_CONTINUATION, WS_TEXT, WS_BINARY, WS_CLOSE, WS_PING_OP, WS_PONG = 0x0, 0x1, 0x2, 0x8, 0x9, 0xA
+
+class WebSocketError(Exception):
+    # Ends the connection with a close code (or an HTTP status during the handshake)
+    def __init__(self, code, reason):
+        super().__init__(reason)
+        self.code = code
+
+def ws_frame(opcode, payload):
+    # Server frames are never masked or fragmented
+    n = len(payload)
+    if n < 126:
+        head = struct.pack("!BB", 0x80 | opcode, n)
+    elif n < 65536:
+        head = struct.pack("!BBH", 0x80 | opcode, 126, n)
+    else:
+        head = struct.pack("!BBQ", 0x80 | opcode, 127, n)
+    return head + payload
+
+def ws_close_frame(code, reason=""):
+    return ws_frame(WS_CLOSE, struct.pack("!H", code) + reason.encode()[:120])
+
+def ws_event_frame(event, payload):
+    # payload is already JSON, so events are framed without parsing them again
+    return ws_frame(WS_TEXT, f'{{"event":"{event}","data":{payload}}}'.encode())
+
+async def ws_read_frame(reader):
+    head = await reader.readexactly(2)
+    fin, opcode = bool(head[0] & 0x80), head[0] & 0x0F
+    length = head[1] & 0x7F
+    if not head[1] & 0x80:
+        raise WebSocketError(1002, "client frames must be masked")
+    if length == 126:
+        length = struct.unpack("!H", await reader.readexactly(2))[0]
+    elif length == 127:
+        length = struct.unpack("!Q", await reader.readexactly(8))[0]
+    if length > WS_MAX_MESSAGE:
+        raise WebSocketError(1009, "message too big")
+    mask = await reader.readexactly(4)
+    data = await reader.readexactly(length)
+    # XOR the whole payload at once as one big integer
+    key = (mask * (length // 4 + 1))[:length]
+    data = (int.from_bytes(data, "big") ^ int.from_bytes(key, "big")).to_bytes(length, "big")
+    return fin, opcode, data
+
+def ws_origin_allowed(origin, host):
+    # Same host as the Host header, ignoring ports: the page is served from
+    # WEB_PORT and the socket lives on WS_PORT
+    if not origin:
+        return False
+    if origin in WS_ALLOWED_ORIGINS:
+        return True
+    try:
+        origin_host = urllib.parse.urlsplit(origin).hostname
+        own_host = urllib.parse.urlsplit("//" + host).hostname
+    except ValueError:
+        return False
+    return origin_host is not None and origin_host == own_host
+
+async def ws_handshake(reader, writer):
+    # Returns (inst, last_event_id); accepts /ws and /s/<server>/ws
+    try:
+        raw = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), WS_HANDSHAKE_TIMEOUT)
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError):
+        raise WebSocketError(400, "Bad Request")
+    lines = raw.decode("latin-1").split("\r\n")
+    parts = lines[0].split(" ")
+    headers = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+    if len(parts) != 3 or parts[0] != "GET":
+        raise WebSocketError(400, "Bad Request")
+    path, _, query = parts[1].partition("?")
+    m = re.fullmatch(r"(?:/s/([\w-]+))?/ws", path)
+    inst = servers.get(m.group(1) or DEFAULT_SERVER) if m else None
+    if inst is None:
+        raise WebSocketError(404, "Not Found")
+    key = headers.get("sec-websocket-key")
+    if (headers.get("upgrade", "").lower() != "websocket"
+            or "upgrade" not in [t.strip().lower() for t in headers.get("connection", "").split(",")]
+            or headers.get("sec-websocket-version") != "13" or not key):
+        raise WebSocketError(400, "Bad Request")
+    if not ws_origin_allowed(headers.get("origin"), headers.get("host", "")):
+        raise WebSocketError(403, "Forbidden")
+    if sum(len(i.ws.clients) for i in servers.values()) >= WS_MAX_CLIENTS:
+        raise WebSocketError(503, "Service Unavailable")
+    accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode()).digest()).decode()
+    writer.write(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                  f"Sec-WebSocket-Accept: {accept}\r\n\r\n").encode())
+    m = re.search(r"(?:^|&)last_event_id=(\d+)", query)
+    return inst, int(m.group(1)) if m else 0
+
+class WebSocketClient:
+    def __init__(self, reader, writer, user):
+        self.reader = reader
+        self.writer = writer
+        self.user = user
+        self.queue = asyncio.Queue(WS_QUEUE)
+        self.last_id = 0  # newest event queued, so replay and live fan-out never double up
+
+    def push(self, frame):
+        try:
+            self.queue.put_nowait(frame)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    async def send_loop(self):
+        # Everything queued goes out in one write; silence is filled with pings
+        try:
+            while True:
+                try:
+                    frames = [await asyncio.wait_for(self.queue.get(), WS_PING)]
+                except asyncio.TimeoutError:
+                    frames = [ws_frame(WS_PING_OP, b"")]
+                while not self.queue.empty():
+                    frames.append(self.queue.get_nowait())
+                self.writer.write(b"".join(frames))
+                await self.writer.drain()
+        except ConnectionError:
+            self.writer.transport.abort()  # receive_loop then sees EOF
+
+    async def receive_loop(self, inst):
+        # Returns the close code to answer with
+        loop = asyncio.get_running_loop()
+        message, message_op = [], None
+        while True:
+            fin, opcode, data = await ws_read_frame(self.reader)
+            if opcode == WS_CLOSE:
+                return struct.unpack("!H", data[:2])[0] if len(data) >= 2 else 1000
+            if opcode == WS_PING_OP:
+                self.writer.write(ws_frame(WS_PONG, data))
+                continue
+            if opcode == WS_PONG:
+                continue
+            if opcode in (WS_TEXT, WS_BINARY):
+                message, message_op = [data], opcode
+            elif opcode == WS_CONTINUATION and message_op is not None:
+                message.append(data)
+                if sum(len(d) for d in message) > WS_MAX_MESSAGE:
+                    raise WebSocketError(1009, "message too big")
             else:
-                print("[MONITOR] Normal shutdown — no backup")
-            server_process = None
+                raise WebSocketError(1002, "unexpected frame")
+            if not fin:
+                continue
+            if message_op != WS_TEXT:
+                raise WebSocketError(1003, "only text messages are accepted")
+            text, message, message_op = b"".join(message), [], None
+            try:
+                msg = str(json.loads(text).get("msg", "")).strip()
+            except (ValueError, AttributeError):
+                raise WebSocketError(1007, "messages are JSON objects")
+            # One message at a time per guest; the stdin/RCON round trip runs off the loop
+            if msg and not await loop.run_in_executor(None, web_chat, inst, self.user, msg):
+                self.push(ws_frame(WS_TEXT, json.dumps({"event": "error", "data": {"message": "Server process not running"}}).encode()))
+
+class WebSocketHub:
+    # Fan-out for one server's WebSocket guests. EventBroadcaster.publish
+    # hands every event to the loop, where it is framed once and the same
+    # bytes go into each client's bounded queue. A client whose queue is
+    # full is disconnected rather than buffered for, so one stalled browser
+    # never holds memory or delays the others.
+    def __init__(self, inst):
+        self.inst = inst
+        self.clients = set()
+        inst.events.listeners.append(self.on_publish)
+
+    def on_publish(self, event_id, event, payload):
+        # Runs on the publishing thread under the broadcaster lock, so the
+        # loop receives events in id order. A client added after this check
+        # gets the event from the history replay in add() instead.
+        if self.clients:
+            supervisor_loop.call_soon_threadsafe(self.fan_out, event_id, ws_event_frame(event, payload))
+
+    def fan_out(self, event_id, frame):
+        for client in list(self.clients):
+            if event_id <= client.last_id:
+                continue
+            client.last_id = event_id
+            if not client.push(frame):
+                self.drop(client)
+
+    def add(self, client, last_id):
+        # Replays what the client missed since its /chat fetch, like /stream
+        self.clients.add(client)
+        batch, gap = self.inst.events.wait_after(last_id, 0)
+        if gap:
+            client.push(ws_event_frame("reset", "{}"))
+        for event_id, event, payload in batch[-(WS_QUEUE - 1):]:
+            client.push(ws_event_frame(event, payload))
+        client.last_id = batch[-1][0] if batch else last_id
+
+    def drop(self, client):
+        print(f"[WS] Dropping {client.user} on {self.inst.name}: {WS_QUEUE} frames behind")
+        WS_DROPPED.inc(self.inst.name)
+        self.clients.discard(client)
+        client.writer.transport.abort()
+
+async def ws_session(reader, writer):
+    peer = writer.get_extra_info("peername")
+    try:
+        try:
+            inst, last_id = await ws_handshake(reader, writer)
+        except WebSocketError as e:
+            writer.write(f"HTTP/1.1 {e.code} {e}\r\nContent-Length: 0\r\nConnection: close\r\n\r\n".encode())
+            return
+        client = WebSocketClient(reader, writer, guest_name(peer[0] if peer else None))
+        inst.ws.add(client, last_id)
+        sender = asyncio.ensure_future(client.send_loop())
+        try:
+            code, reason = await client.receive_loop(inst), ""
+        except WebSocketError as e:
+            code, reason = e.code, str(e)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            code, reason = None, ""
+        finally:
+            inst.ws.clients.discard(client)
+            sender.cancel()
+        if code is not None and not writer.transport.is_closing():
+            writer.write(ws_close_frame(code, reason))
+            await asyncio.wait_for(writer.drain(), 5)
+    except Exception as e:
+        if not isinstance(e, (ConnectionError, asyncio.TimeoutError)):
+            print("[WS] session error:", e)
+    finally:
+        writer.close()
+
+def start_ws_server():
+    if not WS_PORT:
+        return
+    try:
+        asyncio.run_coroutine_threadsafe(
+            asyncio.start_server(ws_session, "0.0.0.0", WS_PORT, limit=WS_MAX_MESSAGE + 4096), supervisor_loop).result()
+        print(f"[WS] WebSocket chat on port {WS_PORT}")
+    except OSError as e:
+        print(f"[WS] Cannot listen on port {WS_PORT} ({e}), guests will use /stream + /send")
 
 # -----------------------------
-# Flask routes (Unchanged)
+# Server fleet (NEW)
+# -----------------------------
+servers = {DEFAULT_SERVER: ServerInstance(
+    DEFAULT_SERVER, MINECRAFT_DIR, JAVA_PATH, BACKUP_DIR, rcon_port=RCON_PORT, rcon_password=RCON_PASSWORD,
+    chunk_store_dir=CHUNK_STORE_DIR, previous_world_dir=PREVIOUS_WORLD_DIR, latest_log=LATEST_LOG,
+    geyser_jar_path=GEYSER_JAR_PATH)}
+for _name, _config in SERVERS.items():
+    if _name in servers or not re.fullmatch(r"[\w-]+", _name):
+        print(f"ERROR: Server name {_name!r} is taken or not usable in a URL, skipping it")
+        continue
+    servers[_name] = ServerInstance(_name, **_config)
+    if not servers[_name].jar:
+        print(f"ERROR: No .jar found in {servers[_name].minecraft_dir}, {_name} will not start")
+
+def server_base(inst):
+    # URL prefix of a server's pages; main also keeps the plain routes
+    return "" if inst.name == DEFAULT_SERVER else f"/s/{inst.name}"
+
+def page_context(inst):
+    return {"base": server_base(inst), "server": inst.name, "fleet": len(servers) > 1, "ws_port": WS_PORT}
+
+def server_route(rule, **options):
+    # Registers a per-server view at `rule` (for main) and at /s/<name><rule>.
+    # The view is called with the ServerInstance first.
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(server=DEFAULT_SERVER, **kwargs):
+            inst = servers.get(server)
+            if inst is None:
+                return jsonify({"message": f"unknown server {server}"}), 404
+            return view(inst, **kwargs)
+        app.add_url_rule(rule, view.__name__, wrapper, **options)
+        app.add_url_rule("/s/<server>" + rule, "s_" + view.__name__, wrapper, **options)
+        return view
+    return decorator
+
+# -----------------------------
+# Static pages (NEW)
+# -----------------------------
+# The pages only depend on the server they belong to, so each one is rendered
+# once at startup and kept as bytes plus compressed copies. A hit is then an
+# ETag compare and a write; nothing per-client is baked in (see /whoami).
+PAGE_MAX_AGE = 60  # browsers revalidate after this, and get a 304 if nothing changed
+
+class StaticPage:
+    def __init__(self, html):
+        body = html.encode("utf-8")
+        tag = hashlib.sha256(body).hexdigest()[:32]
+        # (encoding, body, etag); each encoding is its own representation,
+        # so each gets its own strong ETag
+        self.variants = [(None, body, tag)]
+        self.variants.append(("gzip", gzip.compress(body, 9, mtime=0), tag + "-gz"))
+        if brotli is not None:
+            self.variants.append(("br", brotli.compress(body, quality=11), tag + "-br"))
+
+    def pick(self):
+        # Smallest variant the client accepts; identity is always allowed
+        best = self.variants[0]
+        for variant in self.variants[1:]:
+            if request.accept_encodings[variant[0]] and len(variant[1]) < len(best[1]):
+                best = variant
+        return best
+
+    def serve(self):
+        encoding, body, tag = self.pick()
+        headers = {"ETag": f'"{tag}"', "Cache-Control": f"public, max-age={PAGE_MAX_AGE}", "Vary": "Accept-Encoding"}
+        if request.if_none_match.contains_weak(tag):
+            return Response(status=304, headers=headers)
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        return Response(body, mimetype="text/html", headers=headers)
+
+def build_static_pages():
+    # Compiled once; render needs an app context for the tojson filter
+    with app.app_context():
+        templates = {name: app.jinja_env.from_string(src)
+                     for name, src in (("index", HTML_PAGE), ("admin", ADMIN_PAGE), ("fleet", FLEET_PAGE))}
+        pages = {(name, inst.name): StaticPage(templates[name].render(**page_context(inst)))
+                 for name in ("index", "admin") for inst in servers.values()}
+        pages["fleet", None] = StaticPage(templates["fleet"].render())
+    return pages
+
+static_pages = build_static_pages()
+
+def guest_name(ip):
+    ip = ip or "0.0.0.0"
+    return f"WebGuest{ip.split('.')[0][-2:].zfill(2)}"
+
+def web_chat(inst, user, msg):
+    # Guest chat from /send and the WebSocket. Returns False if the server is not running.
+    # FIX: Use /tellraw @a with JSON formatting
+    message_content = f"<{user}> {msg}"
+    json_payload = json.dumps({"text": message_content})
+    cmd_to_send = f"tellraw @a {json_payload}"
+    if not send_server_cmd(inst, cmd_to_send, wait=True):
+        return False
+    # Manually add to chat log since tellraw is not parsed back easily
+    inst.publish_chat(message_content, user, "web")
+    if user not in inst.players_online:
+        inst.players_online.add(user)
+        inst.mark_players_changed(publish=True)
+    return True
+
+# -----------------------------
+# Flask routes
 # -----------------------------
 def read_passfile():
     try:
@@ -708,41 +4031,155 @@ def read_passfile():
     except:
         return ""
 
+# NEW: request counts and latency per route pattern (not per URL, so /s/<server>
+# stays one series). Streams are timed until their response headers go out.
+@app.before_request
+def metrics_start():
+    g.metrics_start = time.perf_counter()
+
+@app.after_request
+def metrics_finish(response):
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    HTTP_REQUESTS.inc(route, request.method, str(response.status_code))
+    if "metrics_start" in g:
+        HTTP_SECONDS.observe(time.perf_counter() - g.metrics_start, route, request.method)
+    return response
+
+@app.route("/metrics")
+def metrics():
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+@app.route("/admin/profiler", methods=["GET", "POST"])
+def admin_profiler():
+    # GET downloads the folded stacks (flamegraph.pl / speedscope input),
+    # POST {"enabled": true|false} starts or stops sampling
+    if not session.get("admin"): return jsonify({"message": "auth required"}), 403
+    if request.method == "GET":
+        return Response(profiler.folded(), mimetype="text/plain",
+                        headers={"Content-Disposition": "attachment; filename=profile.folded"})
+    if request.get_json().get("enabled"):
+        profiler.start()
+    else:
+        profiler.stop()
+    for inst in servers.values():
+        inst.bump()  # /admin/status shows whether it runs
+    return jsonify(profiler.stats())
+
 # Public Routes
-@app.route("/")
-def index():
-    ip = request.remote_addr or "0.0.0.0"
-    prefix = ip.split(".")[0][-2:].zfill(2)
-    return render_template_string(HTML_PAGE, user_prefix=f"WebGuest{prefix}")
-
-@app.route("/chat")
-def chat():
-    return jsonify({"messages": chat_log[-200:], "players": sorted(players_online)})
-
-@app.route("/send", methods=["POST"])
-def send():
+@server_route("/")
+def index(inst):
+    return static_pages["index", inst.name].serve()
+
+@app.route("/whoami")
+def whoami():
+    # The guest name /send will use for this client
+    resp = jsonify({"user": guest_name(request.remote_addr)})
+    resp.headers["Cache-Control"] = "private, max-age=3600"
+    return resp
+
+@server_route("/chat")
+def chat(inst):
+    # ?since=<cursor> returns only newer messages; players are only resent when they changed
+    since, reset = parse_since(inst)
+
+    def build():
+        event_id = inst.events.last_id  # read before the cursor so /stream?last_event_id= leaves no gap
+        cursor = inst.log_seq
+        resp = {"messages": lines_since(inst.chat_log, since, cursor, 200), "cursor": cursor, "reset": reset, "event_id": event_id}
+        if since == 0 or inst.players_changed_seq > since:
+            resp["players"] = sorted(inst.players_online)
+        return resp
+    return versioned_json(inst, ("chat", since, reset), build)
+
+@server_route("/chat/history")
+def chat_history(inst):
+    # ?before=<id>&limit=N&player=X pages backwards through the stored chat;
+    # ?before_time=<unix ts> jumps to a point in time.
+    try:
+        before = request.args.get("before", type=int)
+        before_time = request.args.get("before_time", type=float)
+        limit = min(max(int(request.args.get("limit", 100)), 1), CHAT_HISTORY_LIMIT)
+    except ValueError:
+        return jsonify({"message": "bad paging parameters"}), 400
+    player = request.args.get("player") or None
+    messages = chat_store.history(inst.name, before, limit, player, before_time)
+    return jsonify({"messages": messages,
+                    "next_before": messages[-1]["id"] if len(messages) == limit else None})
+
+@server_route("/stream")
+def stream(inst):
+    # Server-Sent Events. Browsers resume with the Last-Event-ID header on
+    # reconnect; the first connect passes ?last_event_id= from /chat. Each
+    # open stream occupies a request thread (see STREAM_MAX_CLIENTS).
+    if not stream_slots.acquire(blocking=False):
+        return jsonify({"message": "too many streams, poll /chat instead"}), 503
+    events = inst.events
+    try:
+        last_id = int(request.headers.get("Last-Event-ID") or request.args.get("last_event_id", events.last_id))
+    except ValueError:
+        last_id = events.last_id
+
+    def gen():
+        nonlocal last_id
+        STREAM_CLIENTS.inc(inst.name)
+        try:
+            yield "retry: 2000\n\n"
+            while True:
+                batch, gap = events.wait_after(last_id, STREAM_KEEPALIVE)
+                if not batch:
+                    yield ": keepalive\n\n"
+                    continue
+                out = []
+                if gap:
+                    out.append("event: reset\ndata: {}\n\n")
+                for event_id, event, payload in batch:
+                    out.append(f"id: {event_id}\nevent: {event}\ndata: {payload}\n\n")
+                last_id = batch[-1][0]
+                yield "".join(out)
+        finally:
+            STREAM_CLIENTS.inc(inst.name, amount=-1)  # the server closes the generator on disconnect
+
+    resp = Response(gen(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    # Runs even when the client leaves before the generator ever started
+    resp.call_on_close(stream_slots.release)
+    return resp
+
+@server_route("/send", methods=["POST"])
+def send(inst):
     msg = request.get_json().get("msg", "").strip()
     if not msg: return jsonify({"success": False})
     
-    ip = request.remote_addr or "0.0.0.0"
-    user = f"WebGuest{ip.split('.')[0][-2:].zfill(2)}"
-    
-    # FIX: Use /tellraw @a with JSON formatting
-    message_content = f"<{user}> {msg}"
-    json_payload = json.dumps({"text": message_content})
-    cmd_to_send = f"tellraw @a {json_payload}"
-    
-    if send_server_cmd(cmd_to_send):
-        # Manually add to chat log since tellraw is not parsed back easily
-        chat_log.append(message_content) 
-        players_online.add(user)
+    if web_chat(inst, guest_name(request.remote_addr), msg):
         return jsonify({"success": True})
     return jsonify({"success": False, "message": "Server process not running"})
 
+@app.route("/fleet")
+def fleet_page():
+    return static_pages["fleet", None].serve()
+
+@app.route("/fleet/status")
+def fleet_status():
+    out = []
+    for inst in servers.values():
+        proc = inst.server_process
+        out.append({
+            "name": inst.name,
+            "base": server_base(inst),
+            "running": inst.running(),
+            "state": proc.state if proc else "exited",
+            "attached": inst.attach,
+            "players": sorted(inst.players_online),
+            "task": inst.current_task,
+            "progress": inst.task_progress,
+            "startup_secs": proc.ready_secs if proc else None
+        })
+    return jsonify({"servers": out})
+
 # Admin Routes
-@app.route("/admin")
-def admin_page():
-    return render_template_string(ADMIN_PAGE)
+@server_route("/admin")
+def admin_page(inst):
+    return static_pages["admin", inst.name].serve()
 
 @app.route("/admin/auth", methods=["POST"])
 def admin_auth():
@@ -756,80 +4193,399 @@ def admin_logout():
     session.pop("admin", None)
     return jsonify({"ok": True})
 
-@app.route("/admin/status")
-def admin_status():
-    running = server_process and server_process.poll() is None
-    return jsonify({
-        "server_running": running,
-        "current_task": current_task,
-        "last_log_time": datetime.datetime.now().strftime("%H:%M:%S"),
-        "message": "Task running" if current_task else "Idle"
-    })
-
-@app.route("/admin/logs")
-def admin_logs():
-    return jsonify({"lines": server_output_buffer[-400:] + ["--- CHAT ---"] + chat_log[-100:]})
-
-@app.route("/admin/command", methods=["POST"])
-def admin_command():
+@server_route("/admin/status")
+def admin_status(inst):
+    def build():
+        proc = inst.server_process
+        running = proc is not None and proc.poll() is None
+        last = inst.last_output_at
+        return {
+            "server": inst.name,
+            "server_running": running,
+            "server_state": proc.state if proc else "exited",
+            "startup_secs": proc.ready_secs if proc else None,
+            "current_task": inst.current_task,
+            "progress": inst.task_progress,
+            # Time of the last console line (it used to be the time of the request)
+            "last_log_time": time.strftime("%H:%M:%S", time.localtime(last)) if last else None,
+            "message": "Task running" if inst.current_task else "Idle",
+            "stdin": proc.writer.stats() if running and proc.writer else None,
+            "attached": inst.attach,
+            "rcon": inst.rcon.stats(),
+            "profiler": {"running": profiler.running}  # sample counts come from /admin/profiler
+        }
+    return versioned_json(inst, ("status",), build)
+
+@server_route("/admin/logs")
+def admin_logs(inst):
+    # Optional filters on the console lines: level=<minimum level>,
+    # source=<text in the logger or thread name>, regex=<pattern on the message>
+    # Admin only: the regex runs over text players control (chat)
+    if not session.get("admin"): return jsonify({"message": "auth required"}), 403
+    since, reset = parse_since(inst)
+    try:
+        filters = log_filter_args()
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+
+    def build():
+        cursor = inst.log_seq
+        if any(filters):
+            lines = inst.server_output_buffer.select(since, cursor, 400, *filters)
+        else:
+            lines = inst.server_output_buffer.range(since, cursor, 400)
+        return {
+            "lines": [str(r) for _, r in lines],
+            "chat": lines_since(inst.chat_log, since, cursor, 100),
+            "cursor": cursor,
+            "oldest": lines[0][0] if lines else cursor + 1,  # ?before= for /admin/logs/older
+            "reset": reset
+        }
+    key = ("logs", since, reset, filters[0], filters[1], filters[2] and filters[2].pattern)
+    return versioned_json(inst, key, build)
+
+def log_filter_args():
+    # (min_level, source, pattern) from the query string; ValueError when invalid
+    level = request.args.get("level", "").upper()
+    source = request.args.get("source", "").strip() or None
+    regex = request.args.get("regex", "")
+    if level and level not in LEVEL_CODES:
+        raise ValueError(f"unknown level {level}")
+    if len(regex) > LOG_REGEX_MAX:
+        raise ValueError(f"regex longer than {LOG_REGEX_MAX} characters")
+    try:
+        pattern = re.compile(regex) if regex else None
+    except re.error as e:
+        raise ValueError(f"bad regex: {e}")
+    return LEVEL_CODES.get(level, 0), source, pattern
+
+@server_route("/admin/logs/older")
+def admin_logs_older(inst):
+    # Scroll-back: the newest `limit` console lines with seq < before, from
+    # memory first and then the spill segments. Takes the /admin/logs filters.
+    # "before" in the reply is the value for the next page (null = nothing older).
+    if not session.get("admin"): return jsonify({"message": "auth required"}), 403
+    try:
+        before = int(request.args.get("before", inst.log_seq + 1))
+        limit = min(max(int(request.args.get("limit", 400)), 1), 2000)
+    except ValueError:
+        return jsonify({"message": "bad paging parameters"}), 400
+    try:
+        filters = log_filter_args()
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+    lines = inst.server_output_buffer.select(0, before - 1, limit, *filters)
+    if len(lines) >= limit:
+        return jsonify({"lines": [str(r) for _, r in lines], "before": lines[0][0]})
+    # Everything older than the memory results is on disk by now
+    older, scanned, next_before = [], 0, None
+    for block in inst.console_spill.blocks_before(lines[0][0] if lines else before):
+        for seq, text in reversed(block):
+            scanned += 1
+            if not any(filters) or record_matches(parse_log_line(text), *filters):
+                older.append((seq, text))
+            if len(older) + len(lines) >= limit or scanned >= OLDER_SCAN_MAX:
+                next_before = seq
+                break
+        if next_before is not None:
+            break
+    older.reverse()
+    lines = older + lines
+    before = next_before
+    return jsonify({"lines": [str(r) for _, r in lines], "before": before})
+
+def parse_time_arg(name):
+    # Unix seconds or an ISO date/time ("2024-05-01", "2024-05-01T18:30")
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.datetime.fromisoformat(value).timestamp()
+
+@server_route("/admin/logs/search")
+def admin_logs_search(inst):
+    if not session.get("admin"): return jsonify({"message": "auth required"}), 403
+    q = request.args.get("q", "").strip()
+    if not q:
+        return jsonify({"message": "q required"}), 400
+    try:
+        start, end = parse_time_arg("from"), parse_time_arg("to")
+    except ValueError:
+        return jsonify({"message": "from/to must be unix seconds or ISO dates"}), 400
+    level = request.args.get("level", "").upper() or None
+    t0 = time.perf_counter()
+    hits = console_index.search(inst.name, q, start, end, level)
+    return jsonify({"hits": hits, "took_ms": round((time.perf_counter() - t0) * 1000, 1)})
+
+@server_route("/admin/crashes")
+def admin_crashes(inst):
+    if not session.get("admin"):
+        return jsonify({"message": "auth required"}), 403
+    # Newest first; only the first indicator of each run carries a context window
+    crashes = inst.crash_history.snapshot()
+    crashes.reverse()
+    return jsonify({"crashes": crashes})
+
+@server_route("/admin/perf")
+def admin_perf(inst):
+    # ?span=<seconds> (default 1h). Points are [time, mean, max] per slot;
+    # the slot size grows from 1s to 1m to 1h as the span gets longer.
+    if not session.get("admin"): return jsonify({"message": "auth required"}), 403
+    try:
+        span = max(60, int(request.args.get("span", 3600)))
+    except ValueError:
+        return jsonify({"message": "span must be seconds"}), 400
+    return jsonify(inst.perf.query(span))
+
+@server_route("/admin/command", methods=["POST"])
+def admin_command(inst):
     if not session.get("admin"): return jsonify({"message": "auth required"}), 403
     cmd = request.get_json().get("cmd", "").strip()
     if not cmd:
         return jsonify({"message": "No command provided"}), 400
     
-    # Note: send_server_cmd strips the leading slash, which is fine.
-    success = send_server_cmd(cmd)
+    # Note: run_server_cmd strips the leading slash, which is fine.
+    success, reply, transport = run_server_cmd(inst, cmd)
     
     if success:
-        return jsonify({"message": f"Command sent: {cmd}"})
+        return jsonify({"message": f"Command sent: {cmd}", "response": reply, "transport": transport})
     else:
         return jsonify({"message": "Failed to send command. Is the server running?"}), 500
 
-@app.route("/admin/backup", methods=["POST"])
-def admin_backup():
+@server_route("/admin/reload", methods=["POST"])
+def admin_reload(inst):
+    # Replaces the whole wrapper, so every server has to be attached and idle
     if not session.get("admin"): return jsonify({"message": "auth required"}), 403
-    if is_task_running(): return jsonify({"message": "task running"}), 409
-    threading.Thread(target=do_backup_task, daemon=True).start()
+    if not all(i.attach for i in servers.values()):
+        return jsonify({"message": "Reloading is only possible when every server is in attach mode"}), 400
+    busy = [i for i in servers.values() if i.is_task_running()]
+    if busy:
+        return jsonify({"message": f"Task '{busy[0].current_task}' is running on {busy[0].name}"}), 409
+    threading.Timer(0.5, reload_wrapper).start()  # let this response go out first
+    return jsonify({"message": "Reloading wrapper, the server keeps running"})
+
+@server_route("/admin/backup", methods=["POST"])
+def admin_backup(inst):
+    if not session.get("admin"): return jsonify({"message": "auth required"}), 403
+    if inst.is_task_running(): return jsonify({"message": "task running"}), 409
+    threading.Thread(target=do_backup_task, args=(inst,), daemon=True).start()
     return jsonify({"message": "backup started"})
 
-@app.route("/admin/restart", methods=["POST"])
-def admin_restart():
+@server_route("/admin/restart", methods=["POST"])
+def admin_restart(inst):
     if not session.get("admin"): return jsonify({"message": "auth required"}), 403
-    if is_task_running(): return jsonify({"message": "task running"}), 409
-    threading.Thread(target=do_restart_task, daemon=True).start()
+    if inst.is_task_running(): return jsonify({"message": "task running"}), 409
+    threading.Thread(target=do_restart_task, args=(inst,), daemon=True).start()
     return jsonify({"message": "restart started"})
 
-@app.route("/admin/stop", methods=["POST"])
-def admin_stop():
+@server_route("/admin/stop", methods=["POST"])
+def admin_stop(inst):
     if not session.get("admin"): return jsonify({"message": "auth required"}), 403
-    threading.Thread(target=do_stop_task, daemon=True).start()
+    threading.Thread(target=do_stop_task, args=(inst,), daemon=True).start()
     return jsonify({"message": "stop command sent"})
 
-@app.route("/admin/kill", methods=["POST"])
-def admin_kill():
+@server_route("/admin/kill", methods=["POST"])
+def admin_kill(inst):
     if not session.get("admin"): return jsonify({"message": "auth required"}), 403
-    threading.Thread(target=do_kill_task, daemon=True).start()
+    threading.Thread(target=do_kill_task, args=(inst,), daemon=True).start()
     return jsonify({"message": "kill command sent"})
 
-@app.route("/admin/restore", methods=["POST"])
-def admin_restore():
+@server_route("/admin/restore", methods=["POST"])
+def admin_restore(inst):
     if not session.get("admin"): return jsonify({"message": "auth required"}), 403
     if "rarfile" not in request.files: return jsonify({"message": "no file"}), 400
     f = request.files["rarfile"]
-    if not f.filename.lower().endswith(".rar"): return jsonify({"message": "only .rar"}), 400
+    if not backend_for_archive(f.filename): return jsonify({"message": "only .rar, .tar.zst or .tar.gz"}), 400
     path = os.path.join(UPLOAD_TMP_DIR, f"{uuid.uuid4().hex}_{secure_filename(f.filename)}")
     f.save(path)
-    threading.Thread(target=do_restore_task, args=(path,), daemon=True).start()
+    threading.Thread(target=do_restore_task, args=(inst, path), daemon=True).start()
     return jsonify({"message": "restore started"})
 
+@server_route("/admin/upload/init", methods=["POST"])
+def admin_upload_init(inst):
+    if not session.get("admin"): return jsonify({"message": "auth required"}), 403
+    data = request.get_json()
+    filename = data.get("filename", "")
+    size = data.get("size")
+    if not backend_for_archive(filename): return jsonify({"message": "only .rar, .tar.zst or .tar.gz"}), 400
+    if not isinstance(size, int) or size <= 0: return jsonify({"message": "bad size"}), 400
+    meta = find_or_create_upload(secure_filename(filename), size, str(data.get("key", "")))
+    return jsonify({"upload_id": meta["id"], "chunk_size": meta["chunk_size"],
+                    "received": sorted(int(i) for i in meta["chunks"])})
+
+@server_route("/admin/upload/<upload_id>", methods=["GET"])
+def admin_upload_status(inst, upload_id):
+    if not session.get("admin"): return jsonify({"message": "auth required"}), 403
+    meta = load_upload(upload_id)
+    if not meta: return jsonify({"message": "unknown upload"}), 404
+    return jsonify({"upload_id": upload_id, "chunk_size": meta["chunk_size"], "chunks": upload_chunk_count(meta),
+                    "received": sorted(int(i) for i in meta["chunks"])})
+
+@server_route("/admin/upload/<upload_id>", methods=["PUT"])
+def admin_upload_chunk(inst, upload_id):
+    if not session.get("admin"): return jsonify({"message": "auth required"}), 403
+    meta = load_upload(upload_id)
+    if not meta: return jsonify({"message": "unknown upload"}), 404
+    try:
+        offset = int(request.args.get("offset", ""))
+    except ValueError:
+        return jsonify({"message": "bad offset"}), 400
+    error = write_upload_chunk(meta, offset, request.stream, request.headers.get("X-Chunk-SHA256"))
+    if error: return jsonify({"message": error}), 400
+    return jsonify({"ok": True})
+
+@server_route("/admin/upload/<upload_id>/finalize", methods=["POST"])
+def admin_upload_finalize(inst, upload_id):
+    if not session.get("admin"): return jsonify({"message": "auth required"}), 403
+    if inst.is_task_running(): return jsonify({"message": "task running"}), 409
+    with uploads_lock:
+        meta = load_upload(upload_id)
+        if not meta: return jsonify({"message": "unknown upload"}), 404
+        missing = [i for i in range(upload_chunk_count(meta)) if str(i) not in meta["chunks"]]
+        if missing: return jsonify({"message": f"{len(missing)} chunks missing", "missing": missing}), 400
+        if request.get_json().get("sha256", "").lower() != upload_digest(meta):
+            return jsonify({"message": "hash mismatch, upload is corrupt"}), 422
+        path = os.path.join(UPLOAD_TMP_DIR, f"{upload_id}_{meta['filename']}")
+        os.replace(upload_path(upload_id, ".part"), path)
+        drop_upload(upload_id)
+    threading.Thread(target=do_restore_task, args=(inst, path), daemon=True).start()
+    return jsonify({"message": "upload verified, restore started"})
+
+@server_route("/admin/rollback", methods=["POST"])
+def admin_rollback(inst):
+    if not session.get("admin"): return jsonify({"message": "auth required"}), 403
+    if inst.is_task_running(): return jsonify({"message": "task running"}), 409
+    if not os.path.isdir(inst.previous_world_dir): return jsonify({"message": "no previous world to roll back to"}), 404
+    threading.Thread(target=do_rollback_task, args=(inst,), daemon=True).start()
+    return jsonify({"message": "rollback started"})
+
+@server_route("/admin/backups")
+def admin_backups(inst):
+    if not session.get("admin"): return jsonify({"message": "auth required"}), 403
+    return jsonify({"mode": BACKUP_MODE, "manifests": list(reversed(list_manifests(inst.chunk_store_dir)))})
+
+@server_route("/admin/restore_backup", methods=["POST"])
+def admin_restore_backup(inst):
+    if not session.get("admin"): return jsonify({"message": "auth required"}), 403
+    if inst.is_task_running(): return jsonify({"message": "task running"}), 409
+    name = request.get_json().get("name", "")
+    if name not in list_manifests(inst.chunk_store_dir): return jsonify({"message": "unknown backup"}), 404
+    threading.Thread(target=do_restore_manifest_task, args=(inst, name), daemon=True).start()
+    return jsonify({"message": "restore started"})
+
+# -----------------------------
+# Benchmarks (NEW)
+# -----------------------------
+def bench_classifier(log_path, rounds=5):
+    # Usage: python webcraft_wrapper.py --bench-classify logs/latest.log
+    with open(log_path, "r", encoding="utf-8", errors="replace") as f:
+        lines = [l.rstrip() for l in f if l.strip()]
+    if not lines:
+        print("[BENCH] Log is empty")
+        return
+    # The four independent scans read_server_output used to run on every line
+    legacy = [
+        GEYSER_UPDATE_PATTERN,
+        re.compile(r"\[.*?\]: <([^>]+)> (.*)"),
+        re.compile(r"\[.*?\]: ([\.\w\-\u00C0-\u017F]+) joined the game"),
+        re.compile(r"\[.*?\]: ([\.\w\-\u00C0-\u017F]+) left the game"),
+    ]
+
+    def run_legacy():
+        for line in lines:
+            for pat in legacy:
+                pat.search(line)
+
+    # The ingest loop parses every line for the console buffer anyway; the
+    # classifier only adds the match on the parsed message
+    messages = [parse_log_line(line).message for line in lines]
+
+    def run_classifier():
+        classify = line_classifier.classify
+        for message in messages:
+            classify(message)
+
+    results = {}
+    for name, fn in (("legacy 4x regex", run_legacy), ("classifier", run_classifier)):
+        best = min(_timed(fn) for _ in range(rounds))
+        results[name] = len(lines) / best
+        print(f"[BENCH] {name:16} {results[name]:>14,.0f} lines/s")
+    hits = collections.Counter(line_classifier.classify(m)[0] for m in messages)
+    print(f"[BENCH] {len(lines)} lines, matches: {dict(hits)}")
+    print(f"[BENCH] speedup: {results['classifier'] / results['legacy 4x regex']:.2f}x")
+
+def make_synthetic_world(root, regions=24, chunks_per_region=400):
+    # Region files with real Anvil headers and semi-compressible chunk data
+    rnd = random.Random(42)
+    os.makedirs(os.path.join(root, "region"), exist_ok=True)
+    for r in range(regions):
+        header, body, sector = bytearray(REGION_HEADER), bytearray(), 2
+        for i in range(chunks_per_region):
+            sectors = rnd.randint(1, 6)
+            data = b"".join(os.urandom(1024) + bytes(REGION_SECTOR - 1024) for _ in range(sectors))
+            header[i * 4:i * 4 + 3] = sector.to_bytes(3, "big")
+            header[i * 4 + 3] = sectors
+            body += data
+            sector += sectors
+        with open(os.path.join(root, "region", f"r.{r}.0.mca"), "wb") as f:
+            f.write(header + body)
+    with open(os.path.join(root, "level.dat"), "wb") as f:
+        f.write(os.urandom(4096))
+
+def bench_archive(regions=24):
+    # Usage: python webcraft_wrapper.py --bench-archive [regions]
+    root = tempfile.mkdtemp(prefix="webcraft_bench_")
+    try:
+        world = os.path.join(root, "world")
+        make_synthetic_world(world, regions)
+        size = sum(os.path.getsize(os.path.join(r, f)) for r, _, fs in os.walk(world) for f in fs)
+        print(f"[BENCH] Synthetic world: {size / 1048576:.0f} MiB in {regions} regions")
+        runs = [
+            (f"native x{ARCHIVE_WORKERS}", lambda out: native_archive(out, world)),
+            ("native x1", lambda out: native_archive(out, world, workers=1)),
+        ]
+        if os.path.exists(WINRAR_PATH):
+            runs.append(("winrar", lambda out: do_rar_archive(out, world)))
+        else:
+            print(f"[BENCH] WinRAR not found at {WINRAR_PATH}, skipping RAR run")
+        for name, fn in runs:
+            out = os.path.join(root, f"bench{'.rar' if name == 'winrar' else native_archive_ext()}")
+            elapsed = _timed(lambda: fn(out))
+            print(f"[BENCH] {name:12} {elapsed:7.2f}s {size / 1048576 / elapsed:8.1f} MiB/s  ratio {os.path.getsize(out) / size:.2f}")
+            os.remove(out)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+def _timed(fn):
+    t = time.perf_counter()
+    fn()
+    return time.perf_counter() - t
+
 # -----------------------------
 # Start everything
 # -----------------------------
 if __name__ == "__main__":
-    print("[MAIN] Starting WebCraft Manager...")
-    start_server()
+    if len(sys.argv) > 2 and sys.argv[1] == "--bench-classify":
+        bench_classifier(sys.argv[2])
+        sys.exit(0)
+    if len(sys.argv) > 1 and sys.argv[1] == "--bench-archive":
+        bench_archive(*map(int, sys.argv[2:3]))
+        sys.exit(0)
+    if "--attach" in sys.argv[1:]:
+        ATTACH_MODE = True
+        for inst in servers.values():
+            inst.attach = True
+    print("[MAIN] Starting WebCraft Manager..." + (" (attach mode)" if ATTACH_MODE else ""))
+    for inst in servers.values():
+        start_server(inst)
     threading.Thread(target=monitor_server_crash, daemon=True).start()
     threading.Thread(target=scheduled_task_monitor, daemon=True).start() # NEW: Start scheduled task monitor
+    threading.Thread(target=perf_probe_monitor, name="perf-probe", daemon=True).start()
+    start_ws_server()
     print(f"[MAIN] Open: http://127.0.0.1:{WEB_PORT}")
     print(f"[MAIN] Admin: http://127.0.0.1:{WEB_PORT}/admin")
+    if len(servers) > 1:
+        print(f"[MAIN] Fleet: http://127.0.0.1:{WEB_PORT}/fleet")
     app.run(host="0.0.0.0", port=WEB_PORT, threaded=True)